@@ -0,0 +1,218 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import metriche
+from cache_http import impronta
+from date_italiane import parse_giorno_mese_anno
+from evento_compatto import SENZA_DATA
+from sink_output import INTESTAZIONE
+
+# Archivio locale (SQLite) delle righe scritte da ogni sorgente, una per evento e giorno.
+# Un evento è il link con il titolo: le righe senza link hanno tutte "Link non disponibile".
+# Conserva gli eventi tra un'esecuzione e l'altra: gli scraper possono fermare la paginazione
+# dopo una serie di eventi già noti e invariati, e l'unione legge da qui invece che dai tab.
+# Percorso del database; vuoto per non usare l'archivio
+PERCORSO_ARCHIVIO = os.getenv("EVENTI_ARCHIVIO", "")
+# Eventi consecutivi già in archivio e invariati dopo i quali la paginazione si ferma; 0 = mai.
+# Gli elenchi dei siti sono ordinati per data dell'evento, non di pubblicazione: un valore
+# troppo basso può far perdere gli eventi nuovi delle pagine successive
+STOP_DOPO_NOTI = int(os.getenv("EVENTI_STOP_DOPO_NOTI", "0"))
+# Giorni passati conservati in archivio
+GIORNI_STORICO = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventi (
+    sorgente TEXT NOT NULL,
+    link TEXT NOT NULL,
+    data TEXT NOT NULL,          -- AAAA-MM-GG, '' se la data non è disponibile
+    titolo TEXT NOT NULL,
+    data_testo TEXT,             -- la data come la scrive la sorgente nel proprio tab
+    ora TEXT,
+    luogo TEXT,
+    categoria TEXT,
+    impronta TEXT NOT NULL,
+    ordine INTEGER,
+    visto TEXT,
+    PRIMARY KEY (sorgente, link, data, titolo)
+);
+CREATE INDEX IF NOT EXISTS eventi_data ON eventi (data);
+CREATE INDEX IF NOT EXISTS eventi_sorgente_data ON eventi (sorgente, data);
+"""
+
+
+def data_iso(testo):
+    # "03 Ago 2025" / "03 Aug 2025" -> "2025-08-03"; '' per "Data non disponibile" e date illeggibili
+    data = parse_giorno_mese_anno(str(testo)) if testo and testo != SENZA_DATA else None
+    return data.date().isoformat() if data else ''
+
+
+def chiave_riga(riga):
+    return riga[4], data_iso(riga[1]), riga[0]
+
+
+def impronta_riga(riga):
+    # Titolo e ora dicono se un evento è cambiato; luogo e categoria restano fuori perché
+    # alcune sorgenti li completano dopo l'elenco (pagine di dettaglio)
+    return impronta(repr((riga[0], riga[2])).encode('utf-8'))
+
+
+def _evento(link, titolo):
+    return link if link.startswith('http') else (link, titolo)
+
+
+class RaccoltaIncrementale:
+    # Conta gli eventi già in archivio e invariati, nell'ordine delle pagine dell'elenco.
+    # ferma(righe) restituisce True quando la serie raggiunge la soglia: le pagine successive
+    # non servono e gli eventi non rivisti restano quelli dell'archivio
+    def __init__(self, noti, sorgente, soglia=STOP_DOPO_NOTI):
+        self.noti = noti
+        self.sorgente = sorgente
+        self.soglia = soglia
+        self.consecutivi = 0
+        self.interrotta = False
+
+    def ferma(self, righe):
+        if not self.soglia:
+            return False
+        for riga in righe:
+            if self.noti.get(chiave_riga(riga)) == impronta_riga(riga):
+                self.consecutivi += 1
+            else:
+                self.consecutivi = 0
+        if self.consecutivi >= self.soglia and not self.interrotta:
+            self.interrotta = True
+            logging.info(f"{self.sorgente}: {self.consecutivi} eventi consecutivi già noti, paginazione interrotta")
+            metriche.incrementa('paginazione_interrotta', sorgente=self.sorgente)
+        return self.interrotta
+
+
+class ArchivioEventi:
+    nome = 'archivio'
+
+    def __init__(self, percorso=PERCORSO_ARCHIVIO or 'archivio_eventi.sqlite'):
+        self.percorso = percorso
+        # Al primo avvio la cartella (es. .cache nel workflow) può non esistere ancora
+        os.makedirs(os.path.dirname(percorso) or '.', exist_ok=True)
+        # Condiviso dai thread della pipeline: ogni accesso passa dal lock
+        self.conn = sqlite3.connect(percorso, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._aggiorna_schema()
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _aggiorna_schema(self):
+        # Gli archivi creati con la chiave (sorgente, link, data) vengono ricreati con il titolo
+        # nella chiave; le righe si ricopiano tutte, perché con la vecchia chiave non si ripetevano
+        colonne = {r[1]: r[5] for r in self.conn.execute("PRAGMA table_info(eventi)")}
+        if not colonne or colonne.get('titolo'):
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE eventi RENAME TO eventi_precedenti")
+            self.conn.execute("DROP INDEX IF EXISTS eventi_data")
+            self.conn.execute("DROP INDEX IF EXISTS eventi_sorgente_data")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO eventi SELECT sorgente, link, data, COALESCE(titolo, ''), data_testo, "
+                "ora, luogo, categoria, impronta, ordine, visto FROM eventi_precedenti"
+            )
+            self.conn.execute("DROP TABLE eventi_precedenti")
+        logging.info(f"Archivio {self.percorso}: chiave aggiornata con il titolo")
+
+    def chiudi(self):
+        self.conn.close()
+
+    def impronte(self, sorgente):
+        # (link, data, titolo) -> impronta degli eventi di oggi in poi
+        with self._lock:
+            cursore = self.conn.execute(
+                "SELECT link, data, titolo, impronta FROM eventi WHERE sorgente = ? AND (data >= ? OR data = '')",
+                (sorgente, date.today().isoformat())
+            )
+            return {(link, data, titolo): valore for link, data, titolo, valore in cursore}
+
+    def raccolta_incrementale(self, sorgente, soglia=STOP_DOPO_NOTI):
+        return RaccoltaIncrementale(self.impronte(sorgente) if soglia else {}, sorgente, soglia)
+
+    def aggiorna(self, sorgente, righe, completa=True):
+        # Inserisce o aggiorna le righe appena raccolte e toglie quelle che non esistono più:
+        # con una raccolta completa tutte le righe future non riviste, con una raccolta
+        # interrotta solo i giorni non più presenti degli eventi rivisti.
+        # Restituisce le righe della sorgente da oggi in poi (il contenuto del suo tab)
+        oggi = date.today().isoformat()
+        adesso = datetime.now().isoformat(timespec='seconds')
+        nuove = {}
+        for ordine, riga in enumerate(righe):
+            nuove[chiave_riga(riga)] = (ordine, riga)
+
+        with self._lock, self.conn:
+            esistenti = dict(
+                ((link, data, titolo), valore) for link, data, titolo, valore in self.conn.execute(
+                    "SELECT link, data, titolo, impronta FROM eventi WHERE sorgente = ?", (sorgente,)
+                )
+            )
+            conteggi = {'nuove': 0, 'modificate': 0, 'invariate': 0, 'rimosse': 0}
+            for chiave, (ordine, riga) in nuove.items():
+                valore = impronta_riga(riga)
+                precedente = esistenti.get(chiave)
+                stato = 'nuove' if precedente is None else 'invariate' if precedente == valore else 'modificate'
+                conteggi[stato] += 1
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO eventi "
+                "(sorgente, link, data, titolo, data_testo, ora, luogo, categoria, impronta, ordine, visto) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (sorgente, link, data, r[0], r[1], r[2], r[3], r[5], impronta_riga(r), ordine, adesso)
+                    for (link, data, _), (ordine, r) in nuove.items()
+                )
+            )
+
+            # Senza link l'evento rivisto è riconosciuto solo dal titolo
+            rivisti = {_evento(link, titolo) for link, _, titolo in nuove}
+            da_rimuovere = [
+                (sorgente, link, data, titolo) for link, data, titolo in esistenti
+                if (link, data, titolo) not in nuove and (data >= oggi or data == '')
+                and (completa or _evento(link, titolo) in rivisti)
+            ]
+            self.conn.executemany(
+                "DELETE FROM eventi WHERE sorgente = ? AND link = ? AND data = ? AND titolo = ?", da_rimuovere
+            )
+            conteggi['rimosse'] = len(da_rimuovere)
+
+            limite = (date.today() - timedelta(days=GIORNI_STORICO)).isoformat()
+            self.conn.execute("DELETE FROM eventi WHERE sorgente = ? AND data != '' AND data < ?", (sorgente, limite))
+
+        for stato, n in conteggi.items():
+            metriche.incrementa('righe_archivio', n, sorgente=sorgente, stato=stato)
+        logging.info(
+            f"Archivio {sorgente}: {conteggi['nuove']} nuove, {conteggi['modificate']} modificate, "
+            f"{conteggi['invariate']} invariate, {conteggi['rimosse']} rimosse"
+        )
+        return self.righe(sorgente)
+
+    def _record(self, sorgente, dal):
+        # Righe di una sorgente ordinate per data (senza data in fondo), nell'ordine dell'ultima raccolta
+        with self._lock:
+            return self.conn.execute(
+                "SELECT titolo, data_testo, ora, luogo, link, categoria FROM eventi "
+                "WHERE sorgente = ? AND (data >= ? OR data = '') ORDER BY data = '', data, ordine",
+                (sorgente, dal)
+            ).fetchall()
+
+    def righe(self, sorgente, dal=None):
+        return [list(r) for r in self._record(sorgente, (dal or date.today()).isoformat())]
+
+    def sorgenti(self, dal=None):
+        # Come Sink.sorgenti(): (nome, intestazione, record) per ogni sorgente in archivio,
+        # già ordinati per data come si aspetta l'unione in streaming
+        dal = (dal or date.today()).isoformat()
+        with self._lock:
+            nomi = [r[0] for r in self.conn.execute("SELECT DISTINCT sorgente FROM eventi ORDER BY sorgente")]
+        for nome in nomi:
+            yield nome, list(INTESTAZIONE), (dict(zip(INTESTAZIONE, r)) for r in self._record(nome, dal))
+
+    def leggi_sorgenti(self):
+        return [r for _, _, record in self.sorgenti() for r in record]
@@ -0,0 +1,78 @@
+# Confronto tra dateparser e il parser memoizzato di date_italiane sulle date tipiche dei siti.
+# Uso: python benchmark/bench_date_italiane.py [numero_eventi]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dateparser
+import date_italiane
+
+MESI = list(date_italiane.MESI)[:12]
+
+
+def genera_date(n, seed=42):
+    # Mix realistico: giorno+mese (turismofvg), periodi "dal ... al ...", date dei fogli
+    rnd = random.Random(seed)
+    date = []
+    for _ in range(n):
+        giorno = rnd.randint(1, 28)
+        mese = rnd.choice(MESI)
+        tipo = rnd.random()
+        if tipo < 0.5:
+            date.append(f"{giorno} {mese}")
+        elif tipo < 0.8:
+            date.append(f"dal {giorno} al {rnd.randint(giorno, 28)} {mese}")
+        else:
+            date.append(f"{giorno:02d} {rnd.choice(list(date_italiane.MESI_ABBR_ITA.values()))} 2025")
+    return date
+
+
+def con_dateparser(testi, anno):
+    for testo in testi:
+        if testo.startswith("dal "):
+            inizio, fine = testo[4:].split(" al ")
+            dateparser.parse(f"{inizio} {anno}", settings={'DATE_ORDER': 'DMY'}, languages=['it'])
+            dateparser.parse(f"{fine} {anno}", settings={'DATE_ORDER': 'DMY'}, languages=['it'])
+        else:
+            testo = testo if testo[-4:].isdigit() else f"{testo} {anno}"
+            dateparser.parse(testo, settings={'DATE_ORDER': 'DMY'}, languages=['it'])
+
+
+def con_date_italiane(testi, anno):
+    for testo in testi:
+        if testo.startswith("dal "):
+            date_italiane.parse_periodo(testo, anno)
+        else:
+            date_italiane.parse_data(testo, anno)
+
+
+def misura(nome, funzione, testi, anno):
+    inizio = time.perf_counter()
+    funzione(testi, anno)
+    durata = time.perf_counter() - inizio
+    print(f"{nome:<28} {len(testi):>7} eventi  {durata:8.3f}s  {len(testi) / durata:12.0f} eventi/s")
+    return durata
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    testi = genera_date(n)
+    anno = 2025
+
+    # dateparser carica i dati di lingua alla prima chiamata: non lo si conta nel confronto
+    dateparser.parse("1 gennaio 2025", languages=['it'])
+
+    lento = misura("dateparser", con_dateparser, testi, anno)
+    date_italiane._parse_data.cache_clear()
+    date_italiane.parse_data_esatta.cache_clear()
+    date_italiane.parse_giorno_mese_anno.cache_clear()
+    freddo = misura("date_italiane (cache vuota)", con_date_italiane, testi, anno)
+    caldo = misura("date_italiane (cache piena)", con_date_italiane, testi, anno)
+    print(f"Accelerazione: {lento / freddo:.0f}x a freddo, {lento / caldo:.0f}x con cache")
+
+
+if __name__ == "__main__":
+    main()
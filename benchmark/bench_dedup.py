@@ -0,0 +1,101 @@
+# Scalabilità della ricerca dei duplicati simili (dedup_fuzzy) e confronto con il confronto
+# di tutte le coppie dello stesso giorno.
+# Uso: python benchmark/bench_dedup.py [righe_massime]
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup_fuzzy import IndiceDuplicati, jaccard, normalizza_testo, trigrammi, SOGLIA
+
+COMUNI = ['Udine', 'Trieste', 'Pordenone', 'Gorizia', 'Cividale', 'Grado', 'Lignano', 'Aquileia',
+          'Spilimbergo', 'Tolmezzo', 'Sacile', 'Palmanova', 'Codroipo', 'Gemona', 'Tarvisio']
+SEDI = ['Teatro Nuovo', 'Palazzo Comunale', 'Castello', 'Museo Civico', 'Piazza Libertà', 'Chiesa di San Marco']
+PAROLE = ['mostra', 'concerto', 'festival', 'sagra', 'rassegna', 'notte', 'jazz', 'vino', 'arte', 'teatro',
+          'estate', 'natale', 'mercatino', 'fotografia', 'cinema', 'danza', 'musica', 'storia', 'castelli',
+          'borghi', 'sapori', 'lettura', 'libri', 'antiquariato', 'incontri', 'laboratorio', 'bambini']
+
+
+def nome_proprio(rnd):
+    # Nomi propri inventati (artisti, luoghi, rassegne): rendono i titoli vari come quelli reali
+    sillabe = ['ma', 'ri', 'no', 'ca', 'te', 'lu', 'fra', 'gio', 'ber', 'tin', 'vel', 'sa', 'do', 'pe', 'zan']
+    return ''.join(rnd.choice(sillabe) for _ in range(rnd.randint(2, 4))).capitalize()
+
+
+def variante(titolo, rnd):
+    # Lo stesso titolo come potrebbe scriverlo un'altra sorgente
+    tipo = rnd.random()
+    if tipo < 0.25:
+        return titolo.upper()
+    if tipo < 0.5:
+        return titolo + ' - edizione ' + str(rnd.randint(2024, 2026))
+    if tipo < 0.75:
+        return titolo.replace(' ', ': ', 1)
+    i = rnd.randrange(len(titolo))
+    return titolo[:i] + titolo[i + 1:]
+
+
+def genera(n, seed=7):
+    # Restituisce le righe (titolo, data, luogo) e il numero di eventi distinti
+    rnd = random.Random(seed)
+    inizio = date(2025, 9, 1)
+    righe = []
+    distinti = 0
+    while len(righe) < n:
+        distinti += 1
+        titolo = ' '.join(rnd.choice(PAROLE) for _ in range(rnd.randint(1, 3))).capitalize()
+        titolo += ' ' + ' '.join(nome_proprio(rnd) for _ in range(rnd.randint(1, 2)))
+        giorno = inizio + timedelta(days=rnd.randrange(60))
+        comune = rnd.choice(COMUNI)
+        righe.append((titolo, giorno, comune))
+        for _ in range(rnd.choice([0, 0, 1, 2])):
+            righe.append((variante(titolo, rnd), giorno, f"{rnd.choice(SEDI)}, {comune}"))
+    rnd.shuffle(righe)
+    return righe[:n], distinti
+
+
+def dedup_indice(righe):
+    indice = IndiceDuplicati()
+    tenuti = sum(indice.aggiungi(t, d, l) == i for i, (t, d, l) in enumerate(righe))
+    return tenuti, indice.confronti
+
+
+def dedup_coppie(righe):
+    # Riferimento quadratico: ogni evento confrontato con tutti quelli già tenuti nello stesso giorno
+    per_giorno = {}
+    tenuti = confronti = 0
+    for titolo, giorno, _ in righe:
+        gruppi = trigrammi(normalizza_testo(titolo))
+        visti = per_giorno.setdefault(giorno, [])
+        confronti += len(visti)
+        if not any(jaccard(gruppi, g) >= SOGLIA for g in visti):
+            tenuti += 1
+            visti.append(gruppi)
+    return tenuti, confronti
+
+
+def misura(funzione, righe):
+    inizio = time.perf_counter()
+    tenuti, confronti = funzione(righe)
+    return time.perf_counter() - inizio, tenuti, confronti
+
+
+if __name__ == '__main__':
+    massimo = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n = 12_500
+    precedente = None
+    while n <= massimo:
+        righe, distinti = genera(n)
+        durata, tenuti, confronti = misura(dedup_indice, righe)
+        crescita = f"  x{durata / precedente:.2f} rispetto a n/2" if precedente else ""
+        print(f"{n:>7} righe: {durata:6.2f}s ({n / durata:8.0f} righe/s), {confronti:>8} confronti, "
+              f"{tenuti} tenuti su ~{distinti} eventi distinti{crescita}")
+        if n <= 25_000:
+            durata_coppie, tenuti_coppie, confronti_coppie = misura(dedup_coppie, righe)
+            print(f"{'':>7}  tutte le coppie: {durata_coppie:6.2f}s, {confronti_coppie:>10} confronti, "
+                  f"{tenuti_coppie} tenuti")
+        precedente = durata
+        n *= 2
@@ -0,0 +1,323 @@
+# Suite di benchmark offline: estrazioni dalle pagine salvate (e da pagine sintetiche grandi),
+# parser delle date e unione dei tab su un dataset generato. Per ogni caso riporta tempo,
+# eventi al secondo e picco di memoria (tracemalloc) e li confronta con benchmark/baseline.json.
+# Uso:
+#   python benchmark/bench_suite.py                  # esegue e confronta con la baseline
+#   python benchmark/bench_suite.py --salva-baseline # aggiorna la baseline
+#   python benchmark/bench_suite.py --filtro estrai/ --max-righe 10000
+import argparse
+import contextlib
+import csv
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(CARTELLA))
+sys.path.insert(0, CARTELLA)
+
+# Le estrazioni si misurano senza la cache delle card (che altrimenti risponderebbe dal secondo
+# giro in poi); i casi "schede_invariate" la attivano in una cartella temporanea
+os.environ['EVENTI_CACHE_SCHEDE'] = '0'
+
+import cache_http
+import date_italiane
+import motore_html
+import scraping_eventifvg
+import scraping_itinerarinellarte
+import scraping_turismofvg
+import unione_dati_scraping
+from fixture_html import PAGINE, leggi_fixture
+from sink_output import TAB_UNIONE, SinkCsv
+
+# Gli scraper registrano ogni evento a livello INFO: nel benchmark conta il lavoro, non l'output
+logging.disable(logging.INFO)
+
+PERCORSO_BASELINE = os.path.join(CARTELLA, 'baseline.json')
+# Peggioramento (tempo o memoria) oltre il quale un caso viene segnalato come regressione
+SOGLIA_REGRESSIONE = 0.3
+# Eventi delle pagine sintetiche grandi
+EVENTI_PAGINA_GRANDE = 1000
+
+SORGENTI = {
+    'eventifvg': (scraping_eventifvg, scraping_eventifvg.CONTENITORI),
+    'turismofvg': (scraping_turismofvg, scraping_turismofvg.CONTENITORI),
+    'itinerarinellarte': (scraping_itinerarinellarte, None),
+}
+
+
+# ================= CASI =================
+# Ogni caso è (nome, prepara): prepara() restituisce (funzione, giri); funzione() esegue il lavoro
+# una volta e restituisce il numero di eventi elaborati, giri è quante volte ripeterla per misura
+
+def casi_estrazione():
+    motori = [nome for nome in motore_html.MOTORI if motore_html._disponibile(nome)]
+    for sorgente, (modulo, contenitori) in SORGENTI.items():
+        for motore in motori:
+            def prepara(sorgente=sorgente, modulo=modulo, contenitori=contenitori, motore=motore):
+                html = leggi_fixture(sorgente)
+                istanza = motore_html.MOTORI[motore]()
+                return lambda: len(motore_html.estrai_html(html, modulo.estrai_eventi, contenitori, istanza)), 50
+            yield f"estrai/{sorgente}/{motore}/fixture", prepara
+
+            def prepara_grande(sorgente=sorgente, modulo=modulo, contenitori=contenitori, motore=motore):
+                html = PAGINE[sorgente](EVENTI_PAGINA_GRANDE).encode()
+                istanza = motore_html.MOTORI[motore]()
+                return lambda: len(motore_html.estrai_html(html, modulo.estrai_eventi, contenitori, istanza)), 1
+            yield f"estrai/{sorgente}/{motore}/grande", prepara_grande
+
+            def prepara_invariate(sorgente=sorgente, modulo=modulo, contenitori=contenitori, motore=motore):
+                # Pagina grande con tutte le card già in cache (il riscaldamento la riempie)
+                html = PAGINE[sorgente](EVENTI_PAGINA_GRANDE).encode()
+                istanza = motore_html.MOTORI[motore]()
+                cartella = tempfile.mkdtemp()
+                def esegui():
+                    with cache_schede_attiva(cartella):
+                        return len(motore_html.estrai_html(html, modulo.estrai_eventi, contenitori, istanza))
+                return esegui, 1
+            yield f"estrai/{sorgente}/{motore}/schede_invariate", prepara_invariate
+
+
+@contextlib.contextmanager
+def cache_schede_attiva(cartella):
+    precedenti = cache_http.CACHE_SCHEDE, cache_http.CARTELLA_CACHE
+    cache_http.CACHE_SCHEDE, cache_http.CARTELLA_CACHE = True, cartella
+    try:
+        yield
+    finally:
+        cache_http.CACHE_SCHEDE, cache_http.CARTELLA_CACHE = precedenti
+
+
+def _svuota_cache_date():
+    # Misura a freddo: i parser memorizzano i risultati
+    date_italiane.parse_giorno_mese_anno.cache_clear()
+    date_italiane.parse_data_esatta.cache_clear()
+    date_italiane._parse_data.cache_clear()
+
+
+def genera_testi_date(n, seed=3):
+    # Date come compaiono nei siti e nei fogli
+    rnd = random.Random(seed)
+    mesi = list(date_italiane.MESI)[:12]
+    testi = []
+    for _ in range(n):
+        giorno, mese = rnd.randint(1, 28), rnd.randint(1, 12)
+        testi.append(rnd.choice([
+            f"{giorno} {mesi[mese - 1]}",
+            f"{giorno:02d} {date_italiane.MESI_ABBR_ITA[mese]} 2025",
+            f"{giorno:02d} {date_italiane.MESI_ABBR_ENG[mese]} 2025",
+            f"{giorno:02d}/{mese:02d}/2025",
+        ]))
+    return testi
+
+
+def genera_testi_fogli(n, seed=4):
+    # Date come le scrivono gli scraper nei tab: "03 Ago 2025" e "03 Aug 2025"
+    rnd = random.Random(seed)
+    oggi = date.today()
+    formati = [date_italiane.formatta_data, date_italiane.formatta_data_inglese]
+    return [rnd.choice(formati)(oggi + timedelta(days=rnd.randint(-30, 365))) for _ in range(n)]
+
+
+def casi_date():
+    def prepara_parse_data():
+        testi = genera_testi_date(20000)
+        def esegui():
+            _svuota_cache_date()
+            for t in testi:
+                date_italiane.parse_data(t, 2025)
+            return len(testi)
+        return esegui, 1
+    yield "date/parse_data", prepara_parse_data
+
+    def prepara_parse_periodo():
+        rnd = random.Random(5)
+        testi = [
+            f"Dal {g} {date_italiane.MESI_ABBR_ITA[m].lower()} al {g + rnd.randint(0, 20)} {list(date_italiane.MESI)[m - 1]}"
+            for g, m in ((rnd.randint(1, 8), rnd.randint(1, 12)) for _ in range(20000))
+        ]
+        def esegui():
+            _svuota_cache_date()
+            for t in testi:
+                date_italiane.parse_periodo(t, 2025)
+            return len(testi)
+        return esegui, 1
+    yield "date/parse_periodo", prepara_parse_periodo
+
+    def prepara_normalizza():
+        import pandas as pd
+        serie = pd.Series(genera_testi_fogli(100000))
+        def esegui():
+            _svuota_cache_date()
+            unione_dati_scraping.normalizza_date(serie)
+            return len(serie)
+        return esegui, 1
+    yield "date/normalizza_date", prepara_normalizza
+
+
+def genera_tab(n, seed=11):
+    # n righe divise tra i tre tab, ciascuno ordinato per data come lo scrivono gli scraper;
+    # circa il 10% degli eventi compare in più sorgenti
+    rnd = random.Random(seed)
+    oggi = date.today()
+    formati = {
+        'EventiFvg': date_italiane.formatta_data,
+        'Itinerarinellarte': date_italiane.formatta_data,
+        'TurismoFvg': date_italiane.formatta_data_inglese,
+    }
+    tab = {nome: [] for nome in formati}
+    for i in range(n):
+        giorno = oggi + timedelta(days=rnd.randint(-3, 60))
+        titolo = f"Evento {i // 10 if rnd.random() < 0.1 else i}"
+        nome = rnd.choice(list(formati))
+        tab[nome].append((giorno, [titolo, giorno, '20:30', 'Udine', f'https://example.org/{i}', 'Musica']))
+    righe = {}
+    for nome, eventi in tab.items():
+        eventi.sort(key=lambda e: e[0])
+        righe[nome] = [[r[0], formati[nome](r[1])] + r[2:] for _, r in eventi]
+    return righe
+
+
+def righe_csv(percorso):
+    # Righe di dati di un CSV scritto dal sink (0 se manca)
+    if not os.path.exists(percorso):
+        return 0
+    with open(percorso, newline='', encoding='utf-8') as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def casi_unione(max_righe):
+    n = 10000
+    while n <= max_righe:
+        for modalita in ('dataframe', 'streaming'):
+            def prepara(n=n, modalita=modalita):
+                cartella = tempfile.mkdtemp(prefix='bench_unione_')
+                sink = SinkCsv(cartella)
+                for nome, righe in genera_tab(n).items():
+                    sink.scrivi(nome, righe)
+                unione = os.path.join(cartella, f"{TAB_UNIONE}.csv")
+                def esegui():
+                    if os.path.exists(unione):
+                        os.remove(unione)
+                    uscita = io.StringIO()
+                    with contextlib.redirect_stdout(uscita):
+                        unione_dati_scraping.unisci_e_ordina_eventi(sink, sink, modalita)
+                    # unisci_e_ordina_eventi stampa gli errori senza sollevarli: senza questo controllo
+                    # un'unione fallita verrebbe misurata come un'esecuzione molto veloce
+                    if righe_csv(unione) == 0:
+                        raise RuntimeError(f"unione/{modalita}/{n}: tab unito vuoto o mancante\n{uscita.getvalue()[-2000:]}")
+                    return n
+                return esegui, 1
+            yield f"unione/{modalita}/{n}", prepara
+        n *= 10
+
+
+# ================= MISURA =================
+def misura(prepara, ripetizioni):
+    funzione, giri = prepara()
+    funzione()  # riscaldamento (import, selettori compilati)
+
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        for _ in range(giri):
+            eventi = funzione()
+        tempi.append((time.perf_counter() - inizio) / giri)
+    secondi = min(tempi)
+
+    tracemalloc.start()
+    funzione()
+    picco = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'secondi': round(secondi, 6),
+        'eventi': eventi,
+        'eventi_al_secondo': round(eventi / secondi, 1) if secondi else None,
+        'picco_mb': round(picco / 2 ** 20, 3),
+    }
+
+
+def confronta(risultati, baseline, soglia):
+    # Rapporti nuovo/baseline di tempo e memoria; True nella terza colonna se peggiora oltre la soglia
+    confronto = {}
+    for nome, r in risultati.items():
+        base = baseline.get(nome)
+        if not base:
+            continue
+        tempo = r['secondi'] / base['secondi'] if base['secondi'] else 1.0
+        memoria = r['picco_mb'] / base['picco_mb'] if base['picco_mb'] else 1.0
+        confronto[nome] = (tempo, memoria, tempo > 1 + soglia or memoria > 1 + soglia)
+    return confronto
+
+
+def descrivi_macchina():
+    return {
+        'python': platform.python_version(),
+        'sistema': platform.platform(),
+        'processore': platform.machine(),
+        'motori': [n for n in motore_html.MOTORI if motore_html._disponibile(n)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline degli scraper e dell'unione")
+    parser.add_argument('--filtro', default='', help="esegue solo i casi il cui nome contiene il testo")
+    parser.add_argument('--ripetizioni', type=int, default=3, help="ripetizioni per caso (si tiene la migliore)")
+    parser.add_argument('--max-righe', type=int, default=100000, help="righe massime del dataset dell'unione")
+    parser.add_argument('--soglia', type=float, default=SOGLIA_REGRESSIONE, help="peggioramento tollerato (0.3 = 30%%)")
+    parser.add_argument('--baseline', default=PERCORSO_BASELINE)
+    parser.add_argument('--salva-baseline', action='store_true', help="scrive i risultati come nuova baseline")
+    parser.add_argument('--json', help="salva i risultati anche in questo file")
+    parser.add_argument('--fallisci', action='store_true', help="codice di uscita 1 in caso di regressioni")
+    args = parser.parse_args()
+
+    casi = [c for c in (*casi_estrazione(), *casi_date(), *casi_unione(args.max_righe)) if args.filtro in c[0]]
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.salva_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            dati = json.load(f)
+        baseline = dati['risultati']
+        if dati.get('macchina', {}).get('python') != platform.python_version():
+            print(f"⚠️ Baseline registrata con Python {dati.get('macchina', {}).get('python')}: "
+                  f"i confronti di tempo sono indicativi")
+
+    risultati = {}
+    print(f"{'caso':<45} {'tempo':>10} {'eventi/s':>12} {'picco MB':>9}  confronto")
+    for nome, prepara in casi:
+        r = risultati[nome] = misura(prepara, args.ripetizioni)
+        riga = f"{nome:<45} {r['secondi'] * 1000:>8.2f}ms {r['eventi_al_secondo'] or 0:>12,.0f} {r['picco_mb']:>9.2f}"
+        confronto = confronta({nome: r}, baseline, args.soglia).get(nome)
+        if confronto:
+            tempo, memoria, regressione = confronto
+            riga += f"  tempo x{tempo:.2f}, memoria x{memoria:.2f}" + ("  ⛔️ REGRESSIONE" if regressione else "")
+        print(riga, flush=True)
+
+    regressioni = [n for n, (_, _, peggiora) in confronta(risultati, baseline, args.soglia).items() if peggiora]
+    if baseline:
+        print(f"\n{len(regressioni)} regressioni oltre il {args.soglia:.0%} rispetto a {args.baseline}")
+
+    uscita = {'macchina': descrivi_macchina(), 'risultati': risultati}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(uscita, f, indent=2)
+    if args.salva_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(uscita, f, indent=2, sort_keys=True)
+        print(f"Baseline salvata in {args.baseline}")
+
+    if regressioni and args.fallisci:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
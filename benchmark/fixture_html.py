@@ -0,0 +1,145 @@
+# Pagine di elenco con la stessa struttura dei tre siti, per misurare le estrazioni senza rete.
+# Le pagine salvate in benchmark/fixtures vengono rigenerate con:
+#   python benchmark/fixture_html.py
+# Le pagine sintetiche grandi (migliaia di eventi) vengono create al volo dalla suite.
+import os
+from datetime import date, timedelta
+
+CARTELLA_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# Date fisse: le pagine salvate non cambiano da un giorno all'altro
+DATA_FIXTURE = date(2025, 10, 1)
+MESI = ['gennaio', 'febbraio', 'marzo', 'aprile', 'maggio', 'giugno',
+        'luglio', 'agosto', 'settembre', 'ottobre', 'novembre', 'dicembre']
+LUOGHI = ['Udine', 'Trieste', 'Pordenone', 'Gorizia', 'Cividale del Friuli', 'Lignano Sabbiadoro']
+
+
+def _contorno(titolo, corpo):
+    # Intestazione, menu e piè di pagina come nei siti veri: il parser deve attraversarli
+    menu = ''.join(f'<li class="menu-item"><a href="/sezione-{i}/">Sezione {i}</a></li>' for i in range(40))
+    script = '<script>window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);}</script>'
+    return (
+        f'<!DOCTYPE html><html lang="it"><head><meta charset="utf-8"><title>{titolo}</title>{script}</head>'
+        f'<body><header class="site-header"><nav><ul class="menu">{menu}</ul></nav></header>'
+        f'<main>{corpo}</main>'
+        f'<footer class="site-footer"><p>© Friuli Venezia Giulia</p><ul>{menu}</ul></footer></body></html>'
+    )
+
+
+def pagina_eventifvg(n=24, inizio=DATA_FIXTURE):
+    card = []
+    for i in range(n):
+        d = inizio + timedelta(days=i // 4)
+        card.append(f'''
+<div class="tribe-events-calendar-list__event-row">
+ <div class="tribe-events-calendar-list__event-date-tag tribe-common-g-col">
+  <time class="tribe-events-calendar-list__event-date-tag-datetime" datetime="{d.isoformat()}">
+   <span class="tribe-events-calendar-list__event-date-tag-weekday">{d:%a}</span>
+   <span class="tribe-events-calendar-list__event-date-tag-daynum tribe-common-h5 tribe-common-h4--min-medium">{d.day}</span>
+  </time>
+ </div>
+ <div class="tribe-events-calendar-list__event-wrapper tribe-common-g-col">
+  <article class="tribe-events-calendar-list__event tribe-common-g-row tribe-common-g-row--gutters post-{1000 + i} tribe_events type-tribe_events">
+   <div class="tribe-events-calendar-list__event-featured-image-wrapper tribe-common-g-col">
+    <a href="https://www.eventifvg.it/evento/evento-{i}/" class="tribe-events-calendar-list__event-featured-image-link">
+     <img src="https://www.eventifvg.it/wp-content/uploads/evento-{i}.jpg" alt="" class="tribe-events-calendar-list__event-featured-image">
+    </a>
+   </div>
+   <div class="tribe-events-calendar-list__event-details tribe-common-g-col">
+    <header class="tribe-events-calendar-list__event-header">
+     <div class="tribe-events-calendar-list__event-datetime-wrapper tribe-common-b2">
+      <time class="tribe-events-calendar-list__event-datetime" datetime="{d.isoformat()}">
+       <span class="tribe-event-date-start">{d.day} {MESI[d.month - 1]} @ {17 + i % 5}:00</span> - <span class="tribe-event-time">{20 + i % 3}:30</span>
+      </time>
+     </div>
+     <h4 class="tribe-events-calendar-list__event-title tribe-common-h6 tribe-common-h4--min-medium">
+      <a href="https://www.eventifvg.it/evento/evento-{i}/" title="Sagra &amp; festa n. {i}" rel="bookmark" class="tribe-events-calendar-list__event-title-link tribe-common-anchor-thin"> Sagra &amp; festa n. {i} </a>
+     </h4>
+     <address class="tribe-events-calendar-list__event-venue tribe-common-b2">
+      <span class="tribe-events-calendar-list__event-venue-title tribe-common-b2--bold">Piazza Libertà – {LUOGHI[i % len(LUOGHI)]}</span>
+      <span class="tribe-events-calendar-list__event-venue-address">Via Roma {i}, {LUOGHI[i % len(LUOGHI)]}</span>
+     </address>
+    </header>
+    <div class="tribe-events-calendar-list__event-description tribe-common-b2 tribe-common-a11y-hidden">
+     <p>Una giornata di festa con musica, chioschi e prodotti tipici. Edizione numero {i}.</p>
+    </div>
+   </div>
+  </article>
+ </div>
+</div>''')
+    corpo = (
+        '<div class="tribe-events-calendar-list">' + ''.join(card) + '</div>'
+        '<nav class="tribe-events-calendar-list-nav tribe-events-c-nav"><ul class="tribe-events-c-nav__list">'
+        '<li class="tribe-events-c-nav__list-item tribe-events-c-nav__list-item--next">'
+        '<a href="https://www.eventifvg.it/lista/page/2/" rel="next" class="tribe-events-c-nav__next tribe-common-b2 tribe-common-b1--min-medium">Successivi</a>'
+        '</li></ul></nav>'
+    )
+    return _contorno('Eventi FVG', corpo)
+
+
+def pagina_turismofvg(n=24, inizio=DATA_FIXTURE):
+    card = []
+    for i in range(n):
+        d = inizio + timedelta(days=i % 10)
+        f = d + timedelta(days=3 + i % 9)
+        luogo = LUOGHI[i % len(LUOGHI)]
+        if i % 3 == 0:
+            card.append(f'''<a class="c-eventsResults__item c-bigEvent" href="/it/eventi/evento-{i}">
+<div class="c-bigEvent__img"><img src="/media/evento-{i}.jpg" alt=""></div><h1 class="title"> Grande evento {i} </h1>
+<div class="col1"><strong>{d.day}</strong><p>{MESI[d.month - 1]}</p></div>
+<div class="c-bigEvent__time"> {17 + i % 5}:00 </div>
+<div class="info_rows info_location"><span class="col1">Luogo</span><strong class="col2"> {luogo} </strong></div>
+<div class="info_rows info_category"><span class="col1">Categoria</span><strong class="col2"> Musica </strong></div>
+</a>''')
+        elif i % 3 == 1:
+            card.append(f'''<a class="c-eventsResults__item" href="/it/eventi/piccolo-{i}">
+<h2 class="title">Piccolo evento {i}</h2>
+<div class="col1"><strong>{d.day}</strong><p>{MESI[d.month - 1]}</p></div>
+<div class="col2"><strong>{luogo}</strong></div><div class="col3" title="Sport"></div>
+</a>''')
+        else:
+            card.append(f'''<a class="c-eventsResults__item" href="/it/eventi/mostra-{i}">
+<h2 class="title">Mostra {i}</h2>
+<span class="multiple_days_string">Dal {d.day} {MESI[d.month - 1]} al {f.day} {MESI[f.month - 1]}</span>
+<div class="col2"><strong>{luogo}</strong></div><div class="col3" title="Mostre"></div>
+</a>''')
+    corpo = '<div class="c-eventsResults">' + ''.join(card) + '</div>'
+    return _contorno('Eventi - TurismoFVG', corpo)
+
+
+def pagina_itinerari(n=24, inizio=DATA_FIXTURE):
+    card = []
+    for i in range(n):
+        a = inizio - timedelta(days=30) + timedelta(days=i * 3)
+        b = a + timedelta(days=20 + i)
+        card.append(f'''<div class="col-md-4"><a href="/it/mostre/friuli/mostra-{i}"><div class="col-date">
+<img src="/img/mostra-{i}.jpg" alt="">
+<h3>Mostra d'arte {i}</h3>
+<div class="eventi-date"><span class="eventi-data">dal {a:%d/%m/%Y}</span> <span class="eventi-data">al {b:%d/%m/%Y}</span></div>
+<div class="eventi-date"> Museo {i}, {LUOGHI[i % len(LUOGHI)]} </div>
+</div></a></div>''')
+    corpo = '<div class="row">' + ''.join(card) + '</div>'
+    return _contorno("Mostre in Friuli Venezia Giulia - Itinerari nell'arte", corpo)
+
+
+PAGINE = {
+    'eventifvg': pagina_eventifvg,
+    'turismofvg': pagina_turismofvg,
+    'itinerarinellarte': pagina_itinerari,
+}
+
+
+def percorso_fixture(nome):
+    return os.path.join(CARTELLA_FIXTURE, f'{nome}.html')
+
+
+def leggi_fixture(nome):
+    with open(percorso_fixture(nome), 'rb') as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    os.makedirs(CARTELLA_FIXTURE, exist_ok=True)
+    for nome, genera in PAGINE.items():
+        with open(percorso_fixture(nome), 'w', encoding='utf-8') as f:
+            f.write(genera())
+        print(f"Scritto {percorso_fixture(nome)}")
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import metriche
+
+# Cartella della cache persistente (tra un'esecuzione giornaliera e l'altra)
+CARTELLA_CACHE = os.getenv("EVENTI_CACHE_DIR", os.path.join(".cache", "http"))
+# Eventi già estratti per impronta della card (vedi motore_html.estrai_schede); "0" per disattivare
+CACHE_SCHEDE = os.getenv("EVENTI_CACHE_SCHEDE", "1") not in ("", "0", "false")
+# Le card non più viste da questo numero di giorni vengono eliminate
+GIORNI_SCHEDE = 30
+
+
+def impronta(contenuto):
+    return hashlib.sha256(contenuto).hexdigest()
+
+
+class CacheHttp:
+    # Per ogni URL salva su disco: corpo della risposta, ETag / Last-Modified, hash del corpo
+    # e (facoltativamente) il risultato dell'estrazione, così una pagina identica all'ultima
+    # esecuzione non viene né riscaricata (304) né rianalizzata.
+    def __init__(self, cartella=CARTELLA_CACHE):
+        self.cartella = cartella
+        os.makedirs(self.cartella, exist_ok=True)
+
+    def _base(self, url):
+        return os.path.join(self.cartella, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def _meta(self, url):
+        try:
+            with open(self._base(url) + '.json', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def intestazioni_condizionali(self, url):
+        meta = self._meta(url)
+        if not meta or not os.path.exists(self._base(url) + '.body'):
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def aggiorna(self, pagina):
+        # Da chiamare dopo la richiesta: su 304 ricarica il corpo dalla cache, altrimenti lo salva.
+        # Imposta pagina.hash e pagina.invariata (stesso hash dell'ultima esecuzione).
+        base = self._base(pagina.url)
+        meta = self._meta(pagina.url) or {}
+
+        if pagina.status == 304:
+            with open(base + '.body', 'rb') as f:
+                pagina.contenuto = f.read()
+            pagina.encoding = meta.get('encoding')
+            pagina.da_cache = True
+            pagina.hash = meta.get('hash') or impronta(pagina.contenuto)
+            pagina.invariata = True
+            logging.info(f"Pagina non modificata (304), uso la cache: {pagina.url}")
+            return pagina
+
+        pagina.hash = impronta(pagina.contenuto)
+        pagina.invariata = pagina.hash == meta.get('hash')
+
+        with open(base + '.body', 'wb') as f:
+            f.write(pagina.contenuto)
+        nuovo_meta = {
+            'url': pagina.url,
+            'etag': pagina.headers.get('ETag'),
+            'last_modified': pagina.headers.get('Last-Modified'),
+            'encoding': pagina.encoding,
+            'hash': pagina.hash
+        }
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(nuovo_meta, f)
+        return pagina
+
+    def _estratto_salvato(self, pagina, chiave, versione):
+        # Risultato salvato all'ultima esecuzione per lo stesso corpo, la stessa chiave e lo
+        # stesso codice di estrazione, None se manca
+        if not (pagina.hash and pagina.invariata):
+            return None
+        try:
+            with open(self._base(pagina.url) + '.estratto', 'rb') as f:
+                salvato = pickle.load(f)
+            if (salvato['hash'] == pagina.hash and salvato['chiave'] == chiave
+                    and salvato.get('versione') == versione):
+                logging.info(f"Pagina invariata, estrazione saltata: {pagina.url}")
+                metriche.incrementa('estrazioni_riusate', host=urlsplit(pagina.url).netloc)
+                return salvato
+        except Exception:
+            pass
+        return None
+
+    def _salva_estratto(self, pagina, chiave, versione, risultato):
+        if not pagina.hash:
+            return
+        try:
+            with open(self._base(pagina.url) + '.estratto', 'wb') as f:
+                pickle.dump({'hash': pagina.hash, 'chiave': chiave, 'versione': versione, 'risultato': risultato}, f)
+        except OSError as e:
+            logging.warning(f"Impossibile salvare l'estrazione in cache per {pagina.url}: {e}")
+
+    def estrai(self, pagina, funzione, chiave=None, versione=''):
+        # Riusa il risultato di `funzione(pagina)` salvato all'ultima esecuzione se il corpo
+        # ha lo stesso hash. `chiave` distingue estrazioni che dipendono da altro (es. la data odierna),
+        # `versione` il codice che estrae (vedi motore_html.versione_estrattore): la cache
+        # sopravvive ai deploy e un estrattore modificato non deve ricevere i risultati del vecchio.
+        salvato = self._estratto_salvato(pagina, chiave, versione)
+        if salvato:
+            return salvato['risultato']
+        risultato = funzione(pagina)
+        self._salva_estratto(pagina, chiave, versione, risultato)
+        return risultato
+
+    async def estrai_asincrono(self, pagina, funzione, chiave=None, versione=''):
+        # Come estrai, con `funzione` coroutine (es. il parsing nel pool di processi)
+        salvato = self._estratto_salvato(pagina, chiave, versione)
+        if salvato:
+            return salvato['risultato']
+        risultato = await funzione(pagina)
+        self._salva_estratto(pagina, chiave, versione, risultato)
+        return risultato
+
+    def leggi_valore(self, nome, predefinito=None):
+        # Dati di supporto salvati tra un'esecuzione e l'altra (es. l'indice dei dettagli)
+        try:
+            with open(os.path.join(self.cartella, f"{nome}.pickle"), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return predefinito
+
+    def salva_valore(self, nome, valore):
+        percorso = os.path.join(self.cartella, f"{nome}.pickle")
+        try:
+            with open(percorso + '.tmp', 'wb') as f:
+                pickle.dump(valore, f)
+            os.replace(percorso + '.tmp', percorso)
+        except OSError as e:
+            logging.warning(f"Impossibile salvare {nome} in cache: {e}")
+
+
+class CacheSchede:
+    # Impronta del frammento HTML di una card -> evento estratto, in SQLite: è condivisa tra il
+    # processo principale e i processi del parsing, ognuno con la propria connessione.
+    # versione: impronta del codice comune a tutte le estrazioni (vedi motore_html.versione_estrazione);
+    # se cambia, i risultati salvati non valgono più e la tabella viene svuotata
+    def __init__(self, percorso, versione=''):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(percorso, timeout=30, check_same_thread=False)
+        self.oggi = date.today().isoformat()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS schede (impronta TEXT PRIMARY KEY, risultato BLOB NOT NULL, usata TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS schede_usata ON schede (usata)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS versione (valore TEXT NOT NULL)")
+            salvata = self.conn.execute("SELECT valore FROM versione").fetchone()
+            if salvata is None or salvata[0] != versione:
+                if salvata is not None:
+                    logging.info("Codice di estrazione modificato: cache delle card svuotata")
+                self.conn.execute("DELETE FROM schede")
+                self.conn.execute("DELETE FROM versione")
+                self.conn.execute("INSERT INTO versione VALUES (?)", (versione,))
+            limite = (date.today() - timedelta(days=GIORNI_SCHEDE)).isoformat()
+            self.conn.execute("DELETE FROM schede WHERE usata < ?", (limite,))
+
+    def leggi(self, impronte):
+        # impronta -> risultato salvato (serializzato), per le impronte presenti
+        impronte = list(set(impronte))
+        trovati = {}
+        with self._lock:
+            for i in range(0, len(impronte), 500):
+                blocco = impronte[i:i + 500]
+                segnaposto = ', '.join('?' for _ in blocco)
+                for impronta_scheda, risultato in self.conn.execute(
+                    f"SELECT impronta, risultato FROM schede WHERE impronta IN ({segnaposto})", blocco
+                ):
+                    trovati[impronta_scheda] = risultato
+            if trovati:
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE schede SET usata = ? WHERE impronta = ? AND usata < ?",
+                        ((self.oggi, i, self.oggi) for i in trovati)
+                    )
+        return trovati
+
+    def salva(self, risultati):
+        # risultati: impronta -> risultato
+        if not risultati:
+            return
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO schede VALUES (?, ?, ?)",
+                ((i, pickle.dumps(r), self.oggi) for i, r in risultati.items())
+            )
+
+
+_schede = {}
+_lock_schede = threading.Lock()
+
+
+def cache_schede(cartella=None, versione=''):
+    # La cache delle card per questo processo (None se disattivata o non apribile)
+    if not CACHE_SCHEDE:
+        return None
+    cartella = cartella or CARTELLA_CACHE
+    chiave = (os.getpid(), cartella)
+    with _lock_schede:
+        if chiave not in _schede:
+            try:
+                os.makedirs(cartella, exist_ok=True)
+                _schede[chiave] = CacheSchede(os.path.join(cartella, 'schede.sqlite'), versione)
+            except sqlite3.Error as e:
+                logging.warning(f"Cache delle card non disponibile: {e}")
+                _schede[chiave] = None
+        return _schede[chiave]
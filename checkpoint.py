@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+from datetime import date
+
+# Stato dell'esecuzione giornaliera, per riprenderla dopo un errore (--resume) senza rifare
+# tutto: per ogni sorgente le pagine dell'elenco già estratte e se il suo tab è già stato scritto.
+# Vale solo per il giorno in cui è stato creato: il giorno dopo si riparte da zero.
+CARTELLA_CHECKPOINT = os.getenv("EVENTI_CHECKPOINT_DIR", os.path.join(".cache", "esecuzione"))
+
+
+def _scrivi_atomico(percorso, dati):
+    temporaneo = percorso + '.tmp'
+    with open(temporaneo, 'wb') as f:
+        f.write(dati)
+    os.replace(temporaneo, percorso)
+
+
+class CheckpointSorgente:
+    # Pagine estratte di una sorgente, una per file: url -> risultato dell'estrazione
+    def __init__(self, cartella, nome):
+        self.nome = nome
+        self.cartella = os.path.join(cartella, nome)
+        os.makedirs(self.cartella, exist_ok=True)
+        # Pagine non scaricate nemmeno dopo i tentativi: la sorgente va ripresa
+        self.pagine_in_errore = 0
+
+    def _percorso(self, url):
+        return os.path.join(self.cartella, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.pickle')
+
+    def pagina(self, url):
+        # Risultato salvato per la pagina, None se non è stata ancora estratta
+        try:
+            with open(self._percorso(url), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def salva_pagina(self, url, risultato):
+        try:
+            _scrivi_atomico(self._percorso(url), pickle.dumps(risultato))
+        except OSError as e:
+            logging.warning(f"Impossibile salvare il checkpoint di {url}: {e}")
+
+
+class Checkpoint:
+    def __init__(self, cartella=CARTELLA_CHECKPOINT, riprendi=False):
+        self.cartella = cartella
+        self._lock = threading.Lock()
+        stato = self._leggi_stato()
+        oggi = date.today().isoformat()
+        if riprendi and stato.get('giorno') == oggi:
+            scritte = ', '.join(stato['scritte']) or 'nessuna'
+            logging.info(f"Ripresa dell'esecuzione del {oggi}: sorgenti già scritte: {scritte}")
+        else:
+            if riprendi:
+                logging.warning("Nessuna esecuzione di oggi da riprendere: si riparte da zero")
+            shutil.rmtree(cartella, ignore_errors=True)
+            stato = {'giorno': oggi, 'scritte': []}
+        os.makedirs(cartella, exist_ok=True)
+        self.stato = stato
+        self._salva_stato()
+
+    def _percorso_stato(self):
+        return os.path.join(self.cartella, 'stato.json')
+
+    def _leggi_stato(self):
+        try:
+            with open(self._percorso_stato(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _salva_stato(self):
+        _scrivi_atomico(self._percorso_stato(), json.dumps(self.stato, indent=2).encode('utf-8'))
+
+    def sorgente(self, nome):
+        return CheckpointSorgente(self.cartella, nome)
+
+    def scritta(self, nome):
+        return nome in self.stato['scritte']
+
+    def segna_scritta(self, nome):
+        with self._lock:
+            if nome not in self.stato['scritte']:
+                self.stato['scritte'].append(nome)
+                self._salva_stato()
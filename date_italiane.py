@@ -0,0 +1,149 @@
+import logging
+import re
+from datetime import datetime
+from functools import lru_cache
+
+import metriche
+
+# Mesi in italiano (completi e abbreviati) e abbreviazioni inglesi prodotte da strftime('%b')
+MESI = {
+    "gennaio": 1, "febbraio": 2, "marzo": 3, "aprile": 4, "maggio": 5, "giugno": 6,
+    "luglio": 7, "agosto": 8, "settembre": 9, "ottobre": 10, "novembre": 11, "dicembre": 12,
+    "gen": 1, "feb": 2, "mar": 3, "apr": 4, "mag": 5, "giu": 6,
+    "lug": 7, "ago": 8, "set": 9, "ott": 10, "nov": 11, "dic": 12,
+    "jan": 1, "may": 5, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "oct": 10, "dec": 12
+}
+
+# Abbreviazioni usate nei fogli: "03 Ago 2025" (italiano) e "03 Aug 2025" (come strftime('%d %b %Y'))
+MESI_ABBR_ITA = {
+    1: "Gen", 2: "Feb", 3: "Mar", 4: "Apr", 5: "Mag", 6: "Giu",
+    7: "Lug", 8: "Ago", 9: "Set", 10: "Ott", 11: "Nov", 12: "Dic"
+}
+MESI_ABBR_ENG = {
+    1: "Jan", 2: "Feb", 3: "Mar", 4: "Apr", 5: "May", 6: "Jun",
+    7: "Jul", 8: "Aug", 9: "Sep", 10: "Oct", 11: "Nov", 12: "Dec"
+}
+
+_RE_GIORNO_MESE_ANNO = re.compile(r"^(\d{1,2})\s+([a-z]+|\d{1,2})(?:\s+(\d{4}))?$")
+_RE_NUMERICA = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
+_RE_ISO = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_RE_SOLO_GIORNO = re.compile(r"^(\d{1,2})$")
+_RE_PERIODO = re.compile(r"dal\s+(.+?)\s+al\s+(.+)$")
+_RE_ANNO = re.compile(r"\b(19|20)\d{2}\b")
+
+
+def formatta_data(data):
+    # "03 Ago 2025", il formato dei fogli
+    return f"{data.day:02d} {MESI_ABBR_ITA[data.month]} {data.year}"
+
+
+def formatta_data_inglese(data):
+    # Equivalente a strftime('%d %b %Y') senza dipendere dal locale del sistema
+    return f"{data.day:02d} {MESI_ABBR_ENG[data.month]} {data.year}"
+
+
+def _normalizza(testo):
+    return " ".join(testo.strip().lower().split())
+
+
+def _crea(anno, mese, giorno):
+    try:
+        return datetime(int(anno), int(mese), int(giorno))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def parse_giorno_mese_anno(testo):
+    # "3 ottobre 2025", "03 Ott 2025", "03 Oct 2025", "03 10 2025" -> datetime, altrimenti None
+    m = _RE_GIORNO_MESE_ANNO.match(_normalizza(testo))
+    if not m or not m.group(3):
+        return None
+    giorno, mese, anno = m.groups()
+    mese = int(mese) if mese.isdigit() else MESI.get(mese)
+    return _crea(anno, mese, giorno) if mese else None
+
+
+@lru_cache(maxsize=8192)
+def parse_data_esatta(testo):
+    # Formati completi dei siti: quelli di parse_giorno_mese_anno più "03/10/2025" e "2025-10-03".
+    # Nessun fallback: restituisce None se il formato non è riconosciuto.
+    data = parse_giorno_mese_anno(testo)
+    if data is not None:
+        return data
+
+    t = _normalizza(testo)
+    m = _RE_NUMERICA.match(t)
+    if m:
+        giorno, mese, anno = m.groups()
+        return _crea(anno, mese, giorno)
+
+    m = _RE_ISO.match(t)
+    if m:
+        anno, mese, giorno = m.groups()
+        return _crea(anno, mese, giorno)
+
+    return None
+
+
+@lru_cache(maxsize=8192)
+def _parse_data(testo, anno):
+    data = parse_data_esatta(testo)
+    if data is not None:
+        return data
+
+    # "12 ottobre" senza anno
+    m = _RE_GIORNO_MESE_ANNO.match(_normalizza(testo))
+    if m and not m.group(3):
+        giorno, mese = m.group(1), m.group(2)
+        mese = int(mese) if mese.isdigit() else MESI.get(mese)
+        if mese:
+            return _crea(anno, mese, giorno)
+
+    # Formato sconosciuto: si ricorre a dateparser (lento, importato solo se serve)
+    import dateparser
+    if not _RE_ANNO.search(testo):
+        testo = f"{testo} {anno}"
+    logging.debug(f"Data non riconosciuta dal parser veloce, uso dateparser: {testo}")
+    with metriche.span('dateparser'):
+        return dateparser.parse(testo, settings={'DATE_ORDER': 'DMY'}, languages=['it'])
+
+
+def parse_data(testo, anno=None):
+    # Data italiana -> datetime (o None). Senza anno nel testo si usa `anno` o l'anno corrente.
+    if not testo:
+        return None
+    return _parse_data(testo, anno or datetime.now().year)
+
+
+def parse_periodo(testo, anno=None):
+    # "dal 3 al 9 novembre", "dal 28 dicembre al 3 gennaio 2026", "dal 03/10/2025 al 09/11/2025"
+    # -> (inizio, fine) oppure None
+    m = _RE_PERIODO.search(_normalizza(testo))
+    if not m:
+        return None
+    inizio_txt, fine_txt = m.group(1), m.group(2)
+    anno = anno or datetime.now().year
+
+    fine = parse_data(fine_txt, anno)
+    if fine is None:
+        return None
+
+    if _RE_SOLO_GIORNO.match(inizio_txt):
+        # Il mese (e l'anno) dell'inizio sono quelli della fine, o del mese prima ("dal 28 al 3 novembre")
+        inizio = _crea(fine.year, fine.month, inizio_txt)
+        if inizio is None or inizio > fine:
+            anno_prec, mese_prec = (fine.year, fine.month - 1) if fine.month > 1 else (fine.year - 1, 12)
+            inizio = _crea(anno_prec, mese_prec, inizio_txt)
+    else:
+        inizio = parse_data(inizio_txt, fine.year if _RE_ANNO.search(fine_txt) else anno)
+    if inizio is None:
+        return None
+
+    # Periodi a cavallo d'anno scritti senza anno
+    if inizio > fine:
+        if not _RE_ANNO.search(fine_txt):
+            fine = _crea(fine.year + 1, fine.month, fine.day) or fine
+        elif not _RE_ANNO.search(inizio_txt):
+            inizio = _crea(inizio.year - 1, inizio.month, inizio.day) or inizio
+    return inizio, fine
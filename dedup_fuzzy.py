@@ -0,0 +1,174 @@
+import os
+import random
+import re
+import unicodedata
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# Ricerca dei duplicati "quasi uguali" tra sorgenti diverse (stesso evento con titoli scritti
+# in modo leggermente diverso). Per evitare il confronto di tutte le coppie:
+#   1. blocchi: si confrontano solo eventi dello stesso giorno i cui titoli hanno almeno una banda
+#      della firma MinHash in comune (LSH)
+#   2. luogo: i candidati devono condividere una parola del luogo (se entrambi lo indicano)
+#   3. verifica: similarità di Jaccard sui trigrammi dei titoli >= SOGLIA
+# Ogni evento entra nel cluster del primo evento già visto a cui somiglia, e di ogni cluster si tiene
+# il primo evento. Due cluster già formati non vengono mai fusi: l'unione in streaming decide se tenere
+# un evento appena arriva, e un evento tenuto non può diventare in seguito il duplicato di un altro.
+
+# Similarità minima (Jaccard sui trigrammi di caratteri del titolo) per considerare due eventi uguali;
+# giorno e luogo coincidono già, quindi basta una somiglianza parziale ("Mostra X" / "MOSTRA: X - edizione 2026")
+SOGLIA = float(os.getenv("EVENTI_DEDUP_SOGLIA", "0.5"))
+# Firma MinHash: PERMUTAZIONI valori divisi in BANDE (3 valori per banda). Una coppia diventa
+# candidata con probabilità ~0.98 a similarità 0.6, ~0.88 a 0.5 e ~0.1 a 0.2
+PERMUTAZIONI = int(os.getenv("EVENTI_DEDUP_PERMUTAZIONI", "48"))
+BANDE = int(os.getenv("EVENTI_DEDUP_BANDE", "16"))
+# Eventi massimi per ogni bucket LSH (tiene lineare il caso di molti titoli quasi identici)
+MAX_PER_BUCKET = 50
+
+# Parole del luogo che non identificano un posto
+PAROLE_VUOTE = {
+    'di', 'del', 'della', 'dello', 'dei', 'degli', 'delle', 'il', 'lo', 'la', 'le', 'gli', 'and',
+    'in', 'da', 'al', 'alla', 'ai', 'agli', 'alle', 'con', 'per', 'sul', 'sulla', 'the',
+    'via', 'viale', 'piazza', 'piazzale', 'corso', 'localita', 'loc', 'frazione', 'fraz',
+    'luogo', 'non', 'disponibile', 'friuli', 'venezia', 'giulia', 'fvg', 'italia', 'provincia'
+}
+
+_RE_NON_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+_P = (1 << 31) - 1
+
+
+def normalizza_testo(testo):
+    # Minuscole, senza accenti e punteggiatura: "Mostra: Ca' Foscari!" -> "mostra ca foscari"
+    testo = unicodedata.normalize('NFKD', str(testo or '')).encode('ascii', 'ignore').decode('ascii')
+    return _RE_NON_ALFANUMERICO.sub(' ', testo.lower()).strip()
+
+
+def parole_luogo(luogo):
+    return frozenset(
+        p for p in normalizza_testo(luogo).split()
+        if len(p) >= 3 and not p.isdigit() and p not in PAROLE_VUOTE
+    )
+
+
+def trigrammi(testo):
+    testo = f" {testo} "
+    if len(testo) <= 3:
+        return frozenset([testo])
+    return frozenset(testo[i:i + 3] for i in range(len(testo) - 2))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@lru_cache(maxsize=None)
+def _permutazioni(n, seed=1):
+    rnd = random.Random(seed)
+    a = np.array([rnd.randrange(1, _P) for _ in range(n)], dtype=np.uint64)
+    b = np.array([rnd.randrange(0, _P) for _ in range(n)], dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+@lru_cache(maxsize=65536)
+def firma(titolo_normalizzato, permutazioni=PERMUTAZIONI, bande=BANDE):
+    # (trigrammi, chiavi delle bande LSH) del titolo; lo stesso titolo compare in molti giorni,
+    # quindi il calcolo viene memorizzato
+    gruppi = trigrammi(titolo_normalizzato)
+    valori = np.fromiter((zlib.crc32(g.encode()) for g in gruppi), dtype=np.uint64, count=len(gruppi))
+    a, b = _permutazioni(permutazioni)
+    minhash = ((a * valori + b) % _P).min(axis=1).astype(np.uint32)
+    righe = permutazioni // bande
+    return gruppi, tuple(minhash[i * righe:(i + 1) * righe].tobytes() for i in range(bande))
+
+
+def _titolo_valido(titolo_normalizzato):
+    return titolo_normalizzato and titolo_normalizzato != 'titolo non disponibile'
+
+
+class IndiceDuplicati:
+    # Indice incrementale: aggiungi() restituisce l'id dell'evento di cui il nuovo è un duplicato
+    # (il primo del suo cluster) oppure il proprio id se è un evento nuovo
+
+    def __init__(self, soglia=SOGLIA, permutazioni=PERMUTAZIONI, bande=BANDE):
+        if permutazioni % bande:
+            raise ValueError(f"PERMUTAZIONI ({permutazioni}) deve essere un multiplo di BANDE ({bande})")
+        self.soglia = soglia
+        self.permutazioni = permutazioni
+        self.bande = bande
+        self.confronti = 0
+        self.svuota()
+
+    def svuota(self):
+        # Con il blocco per data i cluster non attraversano i giorni: l'unione in streaming
+        # può svuotare l'indice a ogni cambio di giorno
+        self.eventi = []    # id -> (titolo, data, luogo, trigrammi, parole del luogo)
+        self.genitori = []  # union-find
+        self.bucket = {}    # (data, banda, chiave della banda) -> [id]
+
+    def _radice(self, i):
+        while self.genitori[i] != i:
+            self.genitori[i] = self.genitori[self.genitori[i]]
+            i = self.genitori[i]
+        return i
+
+    def aggiungi(self, titolo, data, luogo=''):
+        nuovo = len(self.eventi)
+        titolo_norm = normalizza_testo(titolo)
+        parole = parole_luogo(luogo)
+        gruppi, chiavi = firma(titolo_norm, self.permutazioni, self.bande)
+        self.eventi.append((titolo, data, luogo, gruppi, parole))
+        self.genitori.append(nuovo)
+        if not _titolo_valido(titolo_norm):
+            return nuovo
+
+        candidati = set()
+        for banda, chiave in enumerate(chiavi):
+            bucket = self.bucket.setdefault((data, banda, chiave), [])
+            candidati.update(bucket)
+            if len(bucket) < MAX_PER_BUCKET:
+                bucket.append(nuovo)
+
+        radici = set()
+        for i in candidati:
+            altre_parole = self.eventi[i][4]
+            # Luoghi diversi: "Teatro Nuovo, Udine" e "Udine" sono compatibili, "Udine" e "Trieste" no
+            if parole and altre_parole and parole.isdisjoint(altre_parole):
+                continue
+            self.confronti += 1
+            if jaccard(gruppi, self.eventi[i][3]) >= self.soglia:
+                radici.add(self._radice(i))
+        if radici:
+            # Se somiglia a eventi di cluster diversi va nel cluster più vecchio, senza fonderli
+            self.genitori[nuovo] = min(radici)
+        return self.genitori[nuovo]
+
+    def cluster(self):
+        # Gruppi di id con più di un evento, nell'ordine di arrivo
+        gruppi = {}
+        for i in range(len(self.eventi)):
+            gruppi.setdefault(self._radice(i), []).append(i)
+        return [ids for ids in gruppi.values() if len(ids) > 1]
+
+    def report(self):
+        # Un dizionario per ogni cluster unito: evento tenuto e titoli/luoghi scartati
+        risultato = []
+        for ids in self.cluster():
+            titolo, data, luogo = self.eventi[ids[0]][:3]
+            risultato.append({
+                'data': str(data),
+                'titolo': titolo,
+                'luogo': luogo,
+                'duplicati': [{'titolo': self.eventi[i][0], 'luogo': self.eventi[i][2]} for i in ids[1:]]
+            })
+        return risultato
+
+
+def righe_report(cluster):
+    # Testo leggibile del report: una riga per cluster
+    for c in cluster:
+        scartati = '; '.join(f"{d['titolo']} ({d['luogo']})" for d in c['duplicati'])
+        yield f"{c['data']} - tenuto: {c['titolo']} ({c['luogo']}) | scartati: {scartati}"
@@ -0,0 +1,187 @@
+import argparse
+import builtins
+import functools
+import importlib
+import logging
+import sys
+import time
+
+# Punto di ingresso unico:
+#   python eventi_friuli.py run [--resume]       tutte le sorgenti e l'unione (pipeline_giornaliera)
+#   python eventi_friuli.py scrape <sorgente>    una sola sorgente, scritta nel suo tab
+#   python eventi_friuli.py merge [--modalita]   solo l'unione dei tab (e i feed statici, con
+#                                                EVENTI_FEED_DIR o --feed)
+#   python eventi_friuli.py replay [sorgente ...] estrazione dalle pagine di una registrazione
+#                                                (EVENTI_REGISTRA_DIR), senza rete
+# Qui si importano solo moduli della libreria standard: ogni comando importa i moduli (e le
+# dipendenze pesanti: pandas, numpy, gspread, bs4, ...) che gli servono, quando gli servono.
+# Con --profile-startup alla fine viene riportato nel log il tempo speso negli import.
+
+_INIZIO = time.perf_counter()
+
+# Nome sul comando -> modulo che dichiara SORGENTE
+SORGENTI = {
+    'eventifvg': 'scraping_eventifvg',
+    'itinerarinellarte': 'scraping_itinerarinellarte',
+    'turismofvg': 'scraping_turismofvg',
+}
+# Import mostrati nel profilo, dal più lento
+RIGHE_PROFILO = 15
+
+# Profilo degli import: pacchetto -> secondi del suo primo import (inclusi i pacchetti che
+# importa a sua volta) e totale degli import non annidati in altri
+_profilo = {'tempi': {}, 'totale': 0.0, 'profondita': 0, 'attivo': False}
+
+
+def _misura_import(nome, importa_modulo):
+    if not _profilo['attivo'] or nome in sys.modules:
+        return importa_modulo()
+    inizio = time.perf_counter()
+    _profilo['profondita'] += 1
+    try:
+        return importa_modulo()
+    finally:
+        _profilo['profondita'] -= 1
+        if nome in sys.modules and nome not in _profilo['tempi']:
+            durata = time.perf_counter() - inizio
+            _profilo['tempi'][nome] = durata
+            if not _profilo['profondita']:
+                _profilo['totale'] += durata
+
+
+def attiva_profilo_import():
+    originale = builtins.__import__
+
+    def importa_con_tempo(name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            return originale(name, globals, locals, fromlist, level)
+        return _misura_import(name.partition('.')[0], lambda: originale(name, globals, locals, fromlist, level))
+
+    _profilo['attivo'] = True
+    builtins.__import__ = importa_con_tempo
+
+
+def importa(nome):
+    # I moduli dei comandi si importano solo quando il comando viene eseguito
+    return _misura_import(nome, lambda: importlib.import_module(nome))
+
+
+def riporta_profilo_import():
+    logging.info(
+        f"Import: {_profilo['totale']:.2f}s, {len(sys.modules)} moduli caricati "
+        f"({time.perf_counter() - _INIZIO:.2f}s dall'avvio). Import più lenti (tempo cumulativo):"
+    )
+    for nome, secondi in sorted(_profilo['tempi'].items(), key=lambda x: -x[1])[:RIGHE_PROFILO]:
+        logging.info(f"  {nome:<30} {secondi * 1000:8.1f} ms")
+    logging.info("Dettaglio per modulo: python -X importtime eventi_friuli.py ...")
+
+
+def esegui_run(args):
+    pipeline = importa('pipeline_giornaliera')
+    return pipeline.esegui_pipeline(riprendi=args.resume)
+
+
+def esegui_scrape(args):
+    sorgente = importa(SORGENTI[args.sorgente]).SORGENTE
+    sorgente.main()
+    return True
+
+
+def esegui_merge(args):
+    unione = importa('unione_dati_scraping')
+    archivio_eventi = importa('archivio_eventi')
+    feed_statici = importa('feed_statici')
+    metriche = importa('metriche')
+    archivio = None
+    if archivio_eventi.PERCORSO_ARCHIVIO:
+        archivio = archivio_eventi.ArchivioEventi(archivio_eventi.PERCORSO_ARCHIVIO)
+    cartella_feed = args.feed or feed_statici.CARTELLA_FEED
+    esporta = functools.partial(feed_statici.esporta_feed, cartella=cartella_feed) if cartella_feed else None
+    unione.unisci_e_ordina_eventi(modalita=args.modalita, sorgenti=archivio, esporta=esporta)
+    metriche.scrivi_report('unione')
+    return True
+
+
+def esegui_replay(args):
+    registro_pagine = importa('registro_pagine')
+    sink_output = importa('sink_output')
+    metriche = importa('metriche')
+    registro = registro_pagine.apri_registrazione(args.registrazione)
+    nomi = args.sorgenti or sorted(SORGENTI)
+    sink = sink_output.crea_sink(args.sink)
+    logging.info(f"Replay della registrazione {registro.nome} del {registro.data} su {sink.nome}")
+    for sorgente_registrata, pagine, byte, compressi in registro.riepilogo():
+        logging.info(f"  {sorgente_registrata}: {pagine} pagine, {byte} byte ({compressi} compressi)")
+
+    ok = True
+    for nome in nomi:
+        sorgente = importa(SORGENTI[nome]).SORGENTE
+        if sorgente.nome not in registro.sorgenti():
+            logging.warning(f"{sorgente.nome}: nessuna pagina nella registrazione, saltata")
+            continue
+        try:
+            inizio = time.perf_counter()
+            # Finestra dei giorni calcolata dal giorno della registrazione, non da oggi
+            righe = sorgente.prepara_righe(sorgente.raccogli_eventi(replay=registro), registro.data)
+            sorgente.scrivi_righe(sink, righe)
+            logging.info(f"{sorgente.nome}: {len(righe)} righe in {time.perf_counter() - inizio:.2f}s")
+        except Exception as e:
+            ok = False
+            logging.error(f"Errore nel replay di {sorgente.nome}: {e}")
+    registro.chiudi()
+    metriche.scrivi_report('replay')
+    return ok
+
+
+def nome_sorgente(nome):
+    # Con nargs='*' argparse non accetta choices (la lista vuota non è tra le scelte)
+    if nome not in SORGENTI:
+        raise argparse.ArgumentTypeError(f"sorgente sconosciuta: {nome} (valori ammessi: {', '.join(sorted(SORGENTI))})")
+    return nome
+
+
+def crea_parser():
+    parser = argparse.ArgumentParser(prog='eventi_friuli', description="Scraping degli eventi in Friuli e unione dei dati")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="riporta nel log il tempo speso negli import")
+    comandi = parser.add_subparsers(dest='comando', required=True)
+
+    run = comandi.add_parser('run', help="tutte le sorgenti in parallelo e unione dei dati")
+    run.add_argument('--resume', action='store_true',
+                     help="riprende l'esecuzione di oggi dall'ultima pagina e sorgente completate")
+    run.set_defaults(esegui=esegui_run)
+
+    scrape = comandi.add_parser('scrape', help="una sola sorgente")
+    scrape.add_argument('sorgente', choices=sorted(SORGENTI))
+    scrape.set_defaults(esegui=esegui_scrape)
+
+    merge = comandi.add_parser('merge', help="unione dei tab delle sorgenti nel primo foglio")
+    merge.add_argument('--modalita', choices=['dataframe', 'streaming'],
+                       help="predefinita: EVENTI_MODALITA_UNIONE")
+    merge.add_argument('--feed', metavar='CARTELLA',
+                       help="esporta anche i feed statici JSON/iCalendar (predefinita: EVENTI_FEED_DIR)")
+    merge.set_defaults(esegui=esegui_merge)
+
+    replay = comandi.add_parser('replay', help="rielabora le pagine di una registrazione, senza rete")
+    replay.add_argument('sorgenti', nargs='*', type=nome_sorgente, metavar='sorgente',
+                        help=f"{', '.join(sorted(SORGENTI))} (predefinite: tutte)")
+    replay.add_argument('--registrazione', help="nome o file della registrazione (predefinita: l'ultima)")
+    # Di norma non si vuole sovrascrivere il foglio di produzione
+    replay.add_argument('--sink', default='csv', help="destinazione delle righe (predefinita: csv)")
+    replay.set_defaults(esegui=esegui_replay)
+    return parser
+
+
+def main(argv=None):
+    args = crea_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.profile_startup:
+        attiva_profilo_import()
+    ok = args.esegui(args)
+    if args.profile_startup:
+        riporta_profilo_import()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import heapq
+from datetime import date, datetime, timedelta
+
+SENZA_DATA = 'Data non disponibile'
+
+
+def _giorno(valore):
+    return valore.date() if isinstance(valore, datetime) else valore
+
+
+class EventoPeriodo:
+    # Un evento (o una mostra di più giorni) memorizzato una sola volta con il suo intervallo di date.
+    # Le righe per giorno vengono create solo in espandi(), al momento della scrittura.
+    #   periodo=True: una riga per ogni giorno tra inizio e fine, limitata alla finestra richiesta
+    #   periodo=False: una sola riga con la data di inizio (o SENZA_DATA se manca), senza finestra
+    __slots__ = ('titolo', 'inizio', 'fine', 'ora', 'luogo', 'link', 'categoria', 'periodo')
+
+    def __init__(self, titolo, inizio, fine, ora, luogo, link, categoria, periodo=True):
+        self.titolo = titolo
+        self.inizio = _giorno(inizio)
+        self.fine = _giorno(fine) if fine is not None else self.inizio
+        self.ora = ora
+        self.luogo = luogo
+        self.link = link
+        self.categoria = categoria
+        self.periodo = periodo
+
+    def __getstate__(self):
+        # Le istanze finiscono nella cache delle estrazioni (pickle)
+        return tuple(getattr(self, campo) for campo in self.__slots__)
+
+    def __setstate__(self, stato):
+        for campo, valore in zip(self.__slots__, stato):
+            setattr(self, campo, valore)
+
+    def __eq__(self, altro):
+        return isinstance(altro, EventoPeriodo) and self.__getstate__() == altro.__getstate__()
+
+    def __repr__(self):
+        return f"EventoPeriodo({self.titolo!r}, {self.inizio} - {self.fine}, {self.luogo!r})"
+
+    def giorni(self, dal=None, al=None):
+        # Giorni in cui l'evento va scritto; None se la data non è disponibile
+        if self.inizio is None:
+            yield None
+            return
+        if not self.periodo:
+            yield self.inizio
+            return
+        inizio = max(self.inizio, dal) if dal else self.inizio
+        fine = min(self.fine, al) if al else self.fine
+        for i in range((fine - inizio).days + 1):
+            yield inizio + timedelta(days=i)
+
+
+def _giorni_numerati(indice, evento, dal, al):
+    for giorno in evento.giorni(dal, al):
+        yield (giorno or date.max, indice), giorno, evento
+
+
+def espandi(eventi, formatta, dal=None, al=None):
+    # Righe [Titolo, Data, Ora, Luogo, Link, Categoria] ordinate per giorno (a parità di giorno
+    # nell'ordine di estrazione, senza data in fondo). Gli intervalli sono già ordinati, quindi
+    # basta una fusione a k vie invece di creare e ordinare tutte le righe
+    flussi = [_giorni_numerati(i, e, dal, al) for i, e in enumerate(eventi)]
+    for _, giorno, e in heapq.merge(*flussi):
+        yield [e.titolo, formatta(giorno) if giorno else SENZA_DATA, e.ora, e.luogo, e.link, e.categoria]
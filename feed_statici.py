@@ -0,0 +1,253 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+import metriche
+from date_italiane import parse_giorno_mese_anno
+
+# Feed statici dell'unione per il sito e l'app, al posto della lettura del primo tab via API:
+# dopo unisci_e_ordina_eventi gli eventi vengono scritti in file JSON e iCalendar compressi,
+# uno per giorno e uno per comune, più un manifest con l'impronta (sha256) di ogni file.
+# I client scaricano il manifest e poi solo i file delle porzioni che servono, e solo se
+# l'impronta è cambiata; i file invariati non vengono riscritti (stesso contenuto, stessa data
+# di modifica, stesso ETag sul server statico).
+#   <cartella>/manifest.json
+#   <cartella>/eventi.json.gz, eventi.ics.gz            tutti gli eventi
+#   <cartella>/giorni/AAAA-MM-GG.json.gz, .ics.gz       eventi di un giorno
+#   <cartella>/comuni/<comune>.json.gz, .ics.gz         eventi di un comune
+# Cartella dei feed; vuoto per non generarli
+CARTELLA_FEED = os.getenv("EVENTI_FEED_DIR", "")
+NOME_CALENDARIO = "Eventi in Friuli"
+# Dominio degli UID iCalendar (RFC 5545: UID globalmente univoci)
+DOMINIO_UID = "eventi-friuli"
+VERSIONE_MANIFEST = 1
+LIVELLO_COMPRESSIONE = 9
+# Comune degli eventi senza luogo o con un luogo da cui non si ricava
+SENZA_COMUNE = 'altro'
+# Lunghezza massima in ottetti di una riga iCalendar, oltre la quale va spezzata
+LUNGHEZZA_RIGA_ICS = 75
+
+_RE_SEPARATORE_LUOGO = re.compile(r',|\s[–—-]\s')
+_RE_CAP_PROVINCIA = re.compile(r'\b\d{5}\b|\(\s*[A-Za-z]{2}\s*\)')
+_RE_ORA = re.compile(r'\b([01]?\d|2[0-3])[:.]([0-5]\d)\b')
+
+
+def comune_da_luogo(luogo):
+    # "Piazza Libertà – Udine", "Museo 5, Lignano Sabbiadoro", "33100 Udine (UD)" -> il comune
+    # è l'ultima parte del luogo; None se il luogo manca
+    luogo = str(luogo or '').strip()
+    if not luogo or 'non disponibile' in luogo.lower():
+        return None
+    comune = _RE_CAP_PROVINCIA.sub(' ', _RE_SEPARATORE_LUOGO.split(luogo)[-1])
+    return ' '.join(comune.split()) or None
+
+
+def slug(testo):
+    # "Cividale del Friuli" -> "cividale-del-friuli": nome di file e chiave del manifest
+    ascii_ = unicodedata.normalize('NFKD', testo).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', ascii_.lower()).strip('-') or SENZA_COMUNE
+
+
+def orari(ora):
+    # "17:00 - 20:30" -> ((17, 0), (20, 30)); "ore 21.00" -> ((21, 0), None); (None, None) se manca
+    trovati = [(int(h), int(m)) for h, m in _RE_ORA.findall(str(ora or ''))]
+    inizio = trovati[0] if trovati else None
+    fine = trovati[1] if len(trovati) > 1 and trovati[1] > trovati[0] else None
+    return inizio, fine
+
+
+def evento_feed(intestazione, riga):
+    # Riga dell'unione -> evento dei feed: le colonne con il nome in minuscolo, la data in
+    # formato ISO, il comune e un identificativo stabile tra le esecuzioni
+    evento = {colonna.lower(): ('' if valore is None else str(valore)) for colonna, valore in zip(intestazione, riga)}
+    data = parse_giorno_mese_anno(evento.get('data', ''))
+    evento['data'] = data.date().isoformat() if data else ''
+    evento['comune'] = comune_da_luogo(evento.get('luogo'))
+    chiave = '\x1f'.join((evento.get('link', ''), evento['data'], evento.get('titolo', '')))
+    evento['id'] = hashlib.sha1(chiave.encode()).hexdigest()[:16]
+    return evento
+
+
+def _testo_ics(valore):
+    return (str(valore).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _piega(riga):
+    # RFC 5545 §3.1: righe di al massimo 75 ottetti, le continuazioni iniziano con uno spazio;
+    # il taglio non cade mai dentro un carattere UTF-8
+    dati = riga.encode()
+    parti = []
+    while len(dati) > LUNGHEZZA_RIGA_ICS - (1 if parti else 0):
+        taglio = LUNGHEZZA_RIGA_ICS - (1 if parti else 0)
+        while dati[taglio] & 0xC0 == 0x80:
+            taglio -= 1
+        parti.append(dati[:taglio])
+        dati = dati[taglio:]
+    parti.append(dati)
+    return b'\r\n '.join(parti).decode()
+
+
+def _vevent(evento):
+    giorno = datetime.strptime(evento['data'], '%Y-%m-%d')
+    inizio, fine = orari(evento.get('ora'))
+    righe = [
+        'BEGIN:VEVENT',
+        f"UID:{evento['id']}@{DOMINIO_UID}",
+        # Dalla data dell'evento e non dall'ora di esportazione: un evento invariato produce
+        # gli stessi byte e il file mantiene la sua impronta
+        f"DTSTAMP:{giorno:%Y%m%d}T000000Z",
+    ]
+    if inizio:
+        # Ora locale "floating" (senza fuso): è l'ora indicata dal sito, in Friuli
+        righe.append(f"DTSTART:{giorno:%Y%m%d}T{inizio[0]:02d}{inizio[1]:02d}00")
+        if fine:
+            righe.append(f"DTEND:{giorno:%Y%m%d}T{fine[0]:02d}{fine[1]:02d}00")
+    else:
+        righe.append(f"DTSTART;VALUE=DATE:{giorno:%Y%m%d}")
+        righe.append(f"DTEND;VALUE=DATE:{giorno + timedelta(days=1):%Y%m%d}")
+    righe.append(f"SUMMARY:{_testo_ics(evento.get('titolo', ''))}")
+    if evento.get('luogo'):
+        righe.append(f"LOCATION:{_testo_ics(evento['luogo'])}")
+    if evento.get('ora') and 'non disponibile' not in evento['ora'].lower():
+        righe.append(f"DESCRIPTION:{_testo_ics(evento['ora'])}")
+    if evento.get('categoria'):
+        righe.append(f"CATEGORIES:{_testo_ics(evento['categoria'])}")
+    if evento.get('link', '').startswith(('http://', 'https://')):
+        righe.append(f"URL:{evento['link']}")
+    righe.append('END:VEVENT')
+    return righe
+
+
+def calendario_ics(eventi, titolo=NOME_CALENDARIO):
+    righe = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{DOMINIO_UID}//feed statici//IT',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{_testo_ics(titolo)}",
+        'X-WR-TIMEZONE:Europe/Rome',
+    ]
+    for evento in eventi:
+        # Gli eventi senza data restano solo nei feed JSON
+        if evento['data']:
+            righe.extend(_vevent(evento))
+    righe.append('END:VCALENDAR')
+    return ''.join(_piega(r) + '\r\n' for r in righe).encode()
+
+
+def documento_json(eventi, **porzione):
+    return json.dumps({**porzione, 'eventi': eventi}, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def comprimi(dati):
+    # mtime=0: stesso contenuto, stessi byte compressi (e stessa impronta)
+    return gzip.compress(dati, LIVELLO_COMPRESSIONE, mtime=0)
+
+
+def porzioni(eventi):
+    # Le porzioni dei feed: (percorso senza estensione, titolo del calendario, campi della
+    # porzione nel JSON, eventi), con i giorni e i comuni nell'ordine degli eventi
+    giorni, comuni, nomi_comuni = {}, {}, {}
+    for evento in eventi:
+        if evento['data']:
+            giorni.setdefault(evento['data'], []).append(evento)
+        chiave = slug(evento['comune']) if evento['comune'] else SENZA_COMUNE
+        # Lo stesso comune scritto in modi diversi ("Udine", "UDINE") finisce nello stesso file,
+        # con il nome visto per primo
+        nomi_comuni.setdefault(chiave, evento['comune'] or '')
+        comuni.setdefault(chiave, []).append(evento)
+
+    yield 'eventi', NOME_CALENDARIO, {}, eventi
+    for giorno in sorted(giorni):
+        yield f'giorni/{giorno}', f'{NOME_CALENDARIO} – {giorno}', {'giorno': giorno}, giorni[giorno]
+    for chiave in sorted(comuni):
+        nome = nomi_comuni[chiave]
+        titolo = f'{NOME_CALENDARIO} – {nome}' if nome else NOME_CALENDARIO
+        yield f'comuni/{chiave}', titolo, {'comune': nome, 'slug': chiave}, comuni[chiave]
+
+
+def _scrivi_se_cambiato(percorso, dati):
+    # True se il file è stato (ri)scritto; la scrittura passa da un file temporaneo, così chi
+    # serve la cartella non vede mai un file a metà
+    try:
+        with open(percorso, 'rb') as f:
+            if f.read() == dati:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    temporaneo = percorso + '.tmp'
+    with open(temporaneo, 'wb') as f:
+        f.write(dati)
+    os.replace(temporaneo, percorso)
+    return True
+
+
+def _elimina_superati(cartella, attuali):
+    # File di giorni passati e comuni senza più eventi
+    for sottocartella in ('giorni', 'comuni'):
+        percorso = os.path.join(cartella, sottocartella)
+        if not os.path.isdir(percorso):
+            continue
+        for nome in os.listdir(percorso):
+            relativo = f'{sottocartella}/{nome}'
+            if relativo not in attuali:
+                os.remove(os.path.join(percorso, nome))
+
+
+def esporta_feed(intestazione, righe, cartella=None):
+    # Feed dell'unione (intestazione e righe come scritte nel primo tab) in `cartella`.
+    # Restituisce il manifest
+    cartella = cartella or CARTELLA_FEED
+    with metriche.span('esportazione_feed'):
+        eventi = [evento_feed(intestazione, riga) for riga in righe]
+        manifest = {
+            'versione': VERSIONE_MANIFEST,
+            'generato': datetime.now().isoformat(timespec='seconds'),
+            'eventi': len(eventi),
+            'file': {},
+            'giorni': {},
+            'comuni': {},
+        }
+        scritti = invariati = 0
+        for base, titolo, porzione, selezionati in porzioni(eventi):
+            voce = {'eventi': len(selezionati)}
+            for formato, dati in (('json', documento_json(selezionati, **porzione)),
+                                  ('ics', calendario_ics(selezionati, titolo))):
+                relativo = f'{base}.{formato}.gz'
+                compresso = comprimi(dati)
+                if _scrivi_se_cambiato(os.path.join(cartella, relativo), compresso):
+                    scritti += 1
+                else:
+                    invariati += 1
+                manifest['file'][relativo] = {
+                    'sha256': hashlib.sha256(compresso).hexdigest(),
+                    'byte': len(compresso),
+                    'eventi': len(selezionati),
+                }
+                voce[formato] = relativo
+            if 'giorno' in porzione:
+                manifest['giorni'][porzione['giorno']] = voce
+            elif 'comune' in porzione:
+                manifest['comuni'][porzione['slug']] = {'nome': porzione['comune'], **voce}
+
+        # Il manifest per ultimo e i file superati solo dopo: un client non trova mai nel
+        # manifest un file che non c'è
+        _scrivi_se_cambiato(os.path.join(cartella, 'manifest.json'),
+                            json.dumps(manifest, ensure_ascii=False, indent=1).encode())
+        _elimina_superati(cartella, manifest['file'])
+
+    metriche.incrementa('file_feed_scritti', scritti)
+    metriche.incrementa('file_feed_invariati', invariati)
+    logging.info(
+        f"Feed in {cartella}: {len(eventi)} eventi, {len(manifest['giorni'])} giorni, "
+        f"{len(manifest['comuni'])} comuni ({scritti} file scritti, {invariati} invariati)"
+    )
+    return manifest
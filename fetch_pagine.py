@@ -0,0 +1,330 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+import metriche
+import runtime_http
+from limitatore import leggi_retry_after, limitatore
+
+# ================= CONFIG =================
+# Numero massimo di richieste contemporanee verso lo stesso host
+MAX_PER_HOST = 3
+# Intervallo iniziale (secondi) tra l'avvio di due richieste verso lo stesso host: il limitatore
+# lo riduce se l'host risponde in fretta e lo allunga con latenze alte, errori e Retry-After
+PAUSA_PER_HOST = 1.0
+TIMEOUT = 15
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+# Tentativi per pagina in caso di errori temporanei (rete, timeout, 429, 5xx), con attesa
+# esponenziale: BACKOFF, 2 * BACKOFF, 4 * BACKOFF... (±50% casuale)
+TENTATIVI = 3
+BACKOFF = 2.0
+STATUS_RIPETIBILI = {429, 500, 502, 503, 504}
+# Risposte attese oltre l'ultima pagina di un elenco numerato: registrate senza errore
+STATUS_FINE_ELENCO = {404, 410}
+# Interruttore per host: dopo ERRORI_PER_CIRCUITO errori consecutivi le richieste verso l'host
+# falliscono subito per PAUSA_CIRCUITO secondi, poi ne passa una di prova
+ERRORI_PER_CIRCUITO = 5
+PAUSA_CIRCUITO = 60
+# Pagine scaricate in attesa di estrazione o in estrazione: oltre questo limite il fetch si ferma
+# finché il parsing non recupera, così la memoria resta limitata
+PAGINE_IN_ANALISI = int(os.getenv("EVENTI_CODA_PARSING", "8"))
+
+
+class CircuitoAperto(Exception):
+    pass
+
+
+class Circuito:
+    def __init__(self, host):
+        self.host = host
+        self.errori = 0
+        self.aperto_fino = 0
+
+    def permesso(self):
+        return time.monotonic() >= self.aperto_fino
+
+    def successo(self):
+        self.errori = 0
+
+    def errore(self):
+        self.errori += 1
+        if self.errori >= ERRORI_PER_CIRCUITO:
+            self.aperto_fino = time.monotonic() + PAUSA_CIRCUITO
+            logging.warning(f"{self.errori} errori consecutivi da {self.host}: richieste sospese per {PAUSA_CIRCUITO}s")
+            metriche.incrementa('circuito_aperto', host=self.host)
+
+
+# Condivisi da tutti i fetcher del processo (le sorgenti della pipeline girano in thread diversi)
+_circuiti = {}
+_lock_circuiti = threading.Lock()
+
+
+def circuito(host):
+    with _lock_circuiti:
+        if host not in _circuiti:
+            _circuiti[host] = Circuito(host)
+        return _circuiti[host]
+
+
+def _status(errore):
+    return getattr(getattr(errore, 'response', None), 'status_code', None)
+
+
+def errore_ripetibile(errore):
+    if isinstance(errore, requests.HTTPError):
+        return errore.response is not None and errore.response.status_code in STATUS_RIPETIBILI
+    return isinstance(errore, (requests.ConnectionError, requests.Timeout))
+
+
+class Pagina:
+    # Risultato di una richiesta: il corpo resta in bytes, il parsing lo fa lo scraper
+    def __init__(self, indice, url, status=None, contenuto=b'', encoding=None, headers=None, errore=None):
+        self.indice = indice
+        self.url = url
+        self.status = status
+        self.contenuto = contenuto
+        self.encoding = encoding
+        self.headers = headers or {}
+        self.errore = errore
+        # Valorizzati dalla cache HTTP, se presente
+        self.hash = None
+        self.invariata = False
+        self.da_cache = False
+
+    @property
+    def ok(self):
+        return self.errore is None
+
+    @property
+    def testo(self):
+        return self.contenuto.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class FetcherAsincrono:
+    # Scarica pagine in parallelo rispettando un limite di concorrenza e una pausa per host.
+    # Le richieste HTTP restano sincrone (requests / cloudscraper) ed eseguite in thread;
+    # senza un client esplicito si usa la sessione condivisa di runtime_http.
+    # registro (registro_pagine.RegistrazioneSorgente), se indicato, riceve ogni pagina scaricata.
+    def __init__(self, client=None, max_per_host=MAX_PER_HOST, pausa=PAUSA_PER_HOST,
+                 timeout=TIMEOUT, headers=None, cache=None, tentativi=TENTATIVI, registro=None,
+                 **opzioni_richiesta):
+        self.client = client or runtime_http.sessione()
+        self.cache = cache
+        self.registro = registro
+        # Almeno una richiesta per pagina, anche con tentativi=0
+        self.tentativi = max(tentativi, 1)
+        # Pagine perse per errori temporanei anche dopo i tentativi (non i 404 di fine elenco):
+        # la raccolta è incompleta e conviene riprenderla
+        self.errori = 0
+        self.max_per_host = max_per_host
+        self.pausa = pausa
+        self.timeout = timeout
+        self.headers = headers if headers is not None else dict(HEADERS)
+        self.opzioni_richiesta = opzioni_richiesta
+        self._semafori = {}
+
+    def _semaforo(self, host):
+        if host not in self._semafori:
+            self._semafori[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semafori[host]
+
+    def _limitatore(self, host):
+        # Condiviso con gli altri fetcher del processo, come il circuito dell'host
+        return limitatore(host, self.pausa)
+
+    async def _attendi_turno(self, host):
+        # Attende il turno assegnato dal limitatore dell'host (ritmo adattivo e Retry-After)
+        attesa = self._limitatore(host).prenota()
+        if attesa > 0:
+            metriche.osserva('attesa_pausa', attesa, host=host)
+            await asyncio.sleep(attesa)
+
+    def _richiesta(self, url, indice):
+        headers = dict(self.headers)
+        if self.cache:
+            # Richiesta condizionale: se la pagina non è cambiata il server risponde 304 senza corpo
+            headers.update(self.cache.intestazioni_condizionali(url))
+        host = urlsplit(url).netloc
+        ritmo = self._limitatore(host)
+        inizio = time.perf_counter()
+        try:
+            with metriche.span('http', host=host):
+                r = self.client.get(url, headers=headers, timeout=self.timeout, **self.opzioni_richiesta)
+        except Exception:
+            ritmo.registra(errore=True)
+            raise
+        ritmo.registra(time.perf_counter() - inizio, r.status_code, r.headers)
+        metriche.incrementa('richieste_http', host=host, status=r.status_code)
+        metriche.incrementa('byte_scaricati', len(r.content), host=host)
+        r.raise_for_status()
+        pagina = Pagina(indice, url, r.status_code, r.content, r.encoding, r.headers)
+        if self.cache:
+            self.cache.aggiorna(pagina)
+        if self.registro:
+            # Dopo la cache: anche per un 304 viene registrato il corpo completo
+            self.registro.salva(pagina)
+        return pagina
+
+    async def scarica(self, url, indice=None):
+        host = urlsplit(url).netloc
+        stato = circuito(host)
+        for tentativo in range(self.tentativi):
+            if not stato.permesso():
+                errore = CircuitoAperto(f"richieste verso {host} sospese dopo troppi errori")
+                break
+            async with self._semaforo(host):
+                await self._attendi_turno(host)
+                try:
+                    pagina = await asyncio.to_thread(self._richiesta, url, indice)
+                    stato.successo()
+                    return pagina
+                except Exception as e:
+                    errore = e
+            metriche.incrementa('errori_http', host=host)
+            if not errore_ripetibile(errore):
+                # Es. il 404 dopo l'ultima pagina di un elenco ?page=N: l'host risponde, il
+                # circuito non se ne occupa
+                break
+            stato.errore()
+            if tentativo == self.tentativi - 1:
+                break
+            # L'attesa avviene fuori dal semaforo: le altre pagine dell'host proseguono.
+            # Con Retry-After è il limitatore a sospendere l'host per il tempo richiesto
+            risposta = getattr(errore, 'response', None)
+            retry_after = leggi_retry_after(risposta.headers) if risposta is not None else None
+            attesa = retry_after or BACKOFF * 2 ** tentativo * random.uniform(0.5, 1.5)
+            logging.warning(f"Errore temporaneo per {url} ({errore}), nuovo tentativo tra {attesa:.1f}s")
+            metriche.incrementa('tentativi_http', host=host)
+            await asyncio.sleep(attesa)
+
+        if isinstance(errore, CircuitoAperto) or errore_ripetibile(errore):
+            self.errori += 1
+        if _status(errore) in STATUS_FINE_ELENCO:
+            logging.info(f"Pagina non trovata: {url} ({errore})")
+        else:
+            logging.error(f"Errore nella richiesta dell'URL {url}: {errore}")
+        return Pagina(indice, url, errore=errore)
+
+    async def scarica_tutte(self, urls, max_in_volo=None):
+        # Generatore asincrono: restituisce le pagine nell'ordine in cui arrivano.
+        # Le richieste vengono avviate poco alla volta, quindi se il chiamante interrompe
+        # l'iterazione le pagine non ancora richieste non costano nulla.
+        max_in_volo = max_in_volo or self.max_per_host * 2
+        da_scaricare = iter(enumerate(urls))
+        in_volo = set()
+
+        def avvia_prossime():
+            while len(in_volo) < max_in_volo:
+                prossima = next(da_scaricare, None)
+                if prossima is None:
+                    return
+                indice, url = prossima
+                in_volo.add(asyncio.ensure_future(self.scarica(url, indice)))
+
+        avvia_prossime()
+        try:
+            while in_volo:
+                completate, _ = await asyncio.wait(in_volo, return_when=asyncio.FIRST_COMPLETED)
+                in_volo.difference_update(completate)
+                for task in completate:
+                    yield task.result()
+                avvia_prossime()
+        finally:
+            for task in in_volo:
+                task.cancel()
+
+
+async def estrai_pagine_numerate(fetcher, urls, estrai, salta_errori=False, paginazione=None, salvate=None,
+                                 in_analisi=PAGINE_IN_ANALISI):
+    # Scarica le pagine numerate (?page=N) in parallelo e applica `estrai` man mano che arrivano.
+    # `estrai` può essere una coroutine (es. parsing nel pool di processi): fino a `in_analisi`
+    # pagine vengono estratte mentre il fetch prosegue, poi il fetch attende.
+    # Si comporta come il vecchio ciclo sequenziale: la prima pagina vuota (o in errore, se
+    # salta_errori è False) chiude la paginazione e le pagine successive vengono scartate.
+    # paginazione (paginazione.Paginazione), se indicata, riceve gli eventi di ogni pagina
+    # nell'ordine delle pagine e può chiudere la paginazione dopo quella pagina.
+    # salvate: indice -> eventi delle pagine già estratte (checkpoint), che non vengono richieste.
+    salvate = salvate or {}
+    risultati = {}
+    completate = set()
+    fine = len(urls)
+    prossima = 0
+
+    def completa(indice, eventi):
+        nonlocal fine, prossima
+        completate.add(indice)
+        if indice >= fine:
+            pass
+        elif eventi is None:
+            if not salta_errori:
+                fine = indice
+        elif eventi:
+            risultati[indice] = eventi
+        else:
+            logging.info(f"Nessun evento trovato nella pagina {indice}")
+            fine = indice
+
+        # Le pagine contigue già arrivate passano alla paginazione in ordine
+        while paginazione and prossima < fine and prossima in completate:
+            if prossima in risultati and paginazione.ferma(risultati[prossima]):
+                fine = prossima + 1
+            prossima += 1
+        return all(i in completate for i in range(fine))
+
+    finito = False
+    for indice in sorted(salvate):
+        finito = completa(indice, salvate[indice])
+
+    indici = [i for i in range(len(urls)) if i not in salvate]
+    if not finito and indici:
+        posti = asyncio.Semaphore(in_analisi)
+        estrazioni = set()
+
+        async def analizza(indice, pagina):
+            nonlocal finito
+            try:
+                eventi = estrai(pagina)
+                if inspect.isawaitable(eventi):
+                    eventi = await eventi
+            finally:
+                posti.release()
+            if not finito:
+                finito = completa(indice, eventi)
+
+        pagine = fetcher.scarica_tutte([urls[i] for i in indici])
+        try:
+            async for pagina in pagine:
+                indice = indici[pagina.indice]
+                metriche.incrementa('pagine', host=urlsplit(pagina.url).netloc)
+                if finito:
+                    break
+                if indice < fine and pagina.ok:
+                    pagina.indice = indice
+                    await posti.acquire()
+                    estrazioni.add(asyncio.ensure_future(analizza(indice, pagina)))
+                else:
+                    finito = completa(indice, None if not pagina.ok else [])
+                if finito:
+                    break
+            # Le estrazioni ancora in corso completano la paginazione
+            await asyncio.gather(*estrazioni)
+        finally:
+            for task in estrazioni:
+                task.cancel()
+            await pagine.aclose()
+
+    if paginazione:
+        paginazione.registra(len(completate - set(salvate)), len(urls) - len(salvate))
+
+    eventi_totali = []
+    for indice in sorted(risultati):
+        if indice < fine:
+            eventi_totali.extend(risultati[indice])
+    return eventi_totali
@@ -0,0 +1,50 @@
+import os
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+NOME_FOGLIO = "Eventi in Friuli"
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+def credenziali_da_env():
+    client_email = os.getenv("GSHEET_CLIENT_EMAIL")
+    private_key = os.getenv("GSHEET_PRIVATE_KEY")
+
+    if not client_email or not private_key:
+        raise ValueError("Variabili d'ambiente GSHEET_CLIENT_EMAIL o GSHEET_PRIVATE_KEY mancanti.")
+
+    return {
+        "type": "service_account",
+        "project_id": "EventiFriuli",
+        "private_key_id": os.getenv("GSHEET_PRIVATE_KEY_ID", "2ad6e92ed5bd78ebb61505057bc75ecb4130b6a6"),
+        "private_key": private_key.replace('\\n', '\n'),
+        "client_email": client_email,
+        "client_id": os.getenv("GSHEET_CLIENT_ID", "103136377669455790448"),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{client_email}"
+    }
+
+
+def crea_client():
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(credenziali_da_env(), SCOPE)
+    return gspread.authorize(credentials)
+
+
+_client = None
+
+
+def client_condiviso():
+    # Un solo client autorizzato per processo, qualunque sia il numero di sorgenti e di sink
+    global _client
+    if _client is None:
+        _client = crea_client()
+    return _client
+
+
+def apri_foglio(client=None):
+    # Apre il Google Sheet "Eventi in Friuli"; il client può essere condiviso tra più script
+    if client is None:
+        client = client_condiviso()
+    return client.open(NOME_FOGLIO)
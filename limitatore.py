@@ -0,0 +1,137 @@
+import email.utils
+import os
+import threading
+import time
+
+import metriche
+
+# Ritmo delle richieste verso un host: token bucket con frequenza adattiva (AIMD).
+# Si parte dalla pausa configurata dalla sorgente; finché le risposte arrivano in fretta la
+# frequenza cresce di poco a ogni richiesta, se la latenza sale o arrivano errori cala in
+# proporzione, e un 429/503 la dimezza e sospende l'host per il tempo indicato da Retry-After.
+
+# Fino a quante volte la frequenza iniziale si può accelerare
+ACCELERAZIONE_MASSIMA = float(os.getenv("EVENTI_ACCELERAZIONE_MAX", "4"))
+# Frequenza minima: una richiesta ogni PAUSA_MASSIMA secondi
+PAUSA_MASSIMA = 30.0
+# Richieste che possono partire di seguito senza attendere (capacità del secchio)
+CAPACITA = 2
+# Aumento per risposta veloce, in frazioni della frequenza iniziale
+INCREMENTO = 0.1
+# Una risposta è lenta se supera di questo fattore la latenza media dell'host
+FATTORE_LENTEZZA = 2.0
+RIDUZIONE_LENTEZZA = 0.8
+RIDUZIONE_ERRORE = 0.7
+RIDUZIONE_BLOCCO = 0.5
+STATUS_BLOCCO = {429, 503}
+# Retry-After oltre questo limite (secondi) non viene atteso per intero
+RETRY_AFTER_MASSIMO = 120
+
+# Host sospesi da un Retry-After, condivisi da tutti i limitatori del processo: host -> fino a quando
+_sospesi = {}
+_lock_sospesi = threading.Lock()
+
+
+def leggi_retry_after(headers):
+    # Secondi da attendere secondo l'intestazione Retry-After (secondi o data HTTP), None se assente
+    valore = (headers or {}).get('Retry-After')
+    if not valore:
+        return None
+    valore = valore.strip()
+    if valore.isdigit():
+        secondi = int(valore)
+    else:
+        try:
+            secondi = email.utils.parsedate_to_datetime(valore).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(secondi, 0), RETRY_AFTER_MASSIMO)
+
+
+def sospendi_host(host, secondi):
+    with _lock_sospesi:
+        _sospesi[host] = max(_sospesi.get(host, 0), time.monotonic() + secondi)
+
+
+def sospeso_fino(host):
+    with _lock_sospesi:
+        return _sospesi.get(host, 0)
+
+
+class LimitatoreAdattivo:
+    def __init__(self, host, pausa):
+        self.host = host
+        self.iniziale = 1 / pausa if pausa > 0 else None
+        self.frequenza = self.iniziale
+        self.massima = self.iniziale * ACCELERAZIONE_MASSIMA if self.iniziale else None
+        self.minima = min(1 / PAUSA_MASSIMA, self.iniziale) if self.iniziale else None
+        self.latenza_media = None
+        # Istante teorico di arrivo della prossima richiesta (GCRA, equivalente al token bucket)
+        self._prossimo = 0.0
+        self._lock = threading.Lock()
+        self._pubblica()
+
+    def rallenta(self, pausa):
+        # Un altro fetcher dello stesso host chiede una pausa più lunga: vale la più prudente
+        if pausa <= 0 or (self.iniziale and 1 / pausa >= self.iniziale):
+            return
+        with self._lock:
+            self.iniziale = 1 / pausa
+            self.massima = self.iniziale * ACCELERAZIONE_MASSIMA
+            self.minima = min(1 / PAUSA_MASSIMA, self.iniziale)
+            self.frequenza = min(self.frequenza or self.iniziale, self.massima)
+        self._pubblica()
+
+    def _pubblica(self):
+        if self.frequenza:
+            metriche.imposta('frequenza_richieste', round(self.frequenza, 4), host=self.host)
+
+    def prenota(self):
+        # Riserva il prossimo turno libero e restituisce quanti secondi mancano
+        adesso = time.monotonic()
+        sospeso = sospeso_fino(self.host)
+        if not self.frequenza:
+            return max(sospeso - adesso, 0)
+        with self._lock:
+            intervallo = 1 / self.frequenza
+            inizio = max(adesso, self._prossimo - (CAPACITA - 1) * intervallo, sospeso)
+            self._prossimo = max(self._prossimo, inizio) + intervallo
+        return inizio - adesso
+
+    def registra(self, latenza=None, status=None, headers=None, errore=False):
+        # Da chiamare per ogni risposta (o errore di rete) ricevuta dall'host
+        retry_after = leggi_retry_after(headers)
+        if retry_after:
+            sospendi_host(self.host, retry_after)
+            metriche.incrementa('retry_after', host=self.host)
+        if not self.frequenza:
+            return
+        with self._lock:
+            if status in STATUS_BLOCCO or retry_after:
+                self.frequenza *= RIDUZIONE_BLOCCO
+            elif errore or (status is not None and status >= 500):
+                self.frequenza *= RIDUZIONE_ERRORE
+            elif latenza is not None:
+                lenta = self.latenza_media is not None and latenza > self.latenza_media * FATTORE_LENTEZZA
+                self.latenza_media = latenza if self.latenza_media is None else 0.8 * self.latenza_media + 0.2 * latenza
+                if lenta:
+                    self.frequenza *= RIDUZIONE_LENTEZZA
+                else:
+                    self.frequenza += INCREMENTO * self.iniziale
+            self.frequenza = min(max(self.frequenza, self.minima), self.massima)
+        self._pubblica()
+
+
+# Un limitatore per host condiviso da tutti i fetcher del processo (es. elenco e pagine di
+# dettaglio dello stesso sito): il ritmo verso l'host è unico, non uno per fetcher
+_limitatori = {}
+_lock_limitatori = threading.Lock()
+
+
+def limitatore(host, pausa):
+    with _lock_limitatori:
+        if host not in _limitatori:
+            _limitatori[host] = LimitatoreAdattivo(host, pausa)
+        else:
+            _limitatori[host].rallenta(pausa)
+        return _limitatori[host]
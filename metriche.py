@@ -0,0 +1,179 @@
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+# Strumentazione leggera della pipeline: intervalli di tempo (span) e contatori con etichette,
+# raccolti in memoria da tutti i thread e scritti a fine esecuzione come report JSON e come
+# file di testo Prometheus (formato del textfile collector di node_exporter).
+# Ogni misura costa un perf_counter e un lock: può restare attiva in produzione.
+
+# Cartella dei report; vuota per non scrivere nulla
+CARTELLA_METRICHE = os.getenv("EVENTI_METRICHE_DIR", "metriche")
+PREFISSO_PROMETHEUS = "eventi_friuli"
+
+_lock = threading.Lock()
+_span = {}       # (nome, etichette) -> [conteggio, totale, massimo]
+_contatori = {}  # (nome, etichette) -> valore
+_inizio = time.time()
+
+
+def _chiave(nome, etichette):
+    return nome, tuple(sorted((k, str(v)) for k, v in etichette.items()))
+
+
+def incrementa(nome, valore=1, **etichette):
+    chiave = _chiave(nome, etichette)
+    with _lock:
+        _contatori[chiave] = _contatori.get(chiave, 0) + valore
+
+
+def imposta(nome, valore, **etichette):
+    # Valore istantaneo (es. la frequenza corrente delle richieste verso un host): vince l'ultimo
+    chiave = _chiave(nome, etichette)
+    with _lock:
+        _contatori[chiave] = valore
+
+
+def osserva(nome, secondi, **etichette):
+    # Registra una durata misurata altrove (es. le pause tra le richieste)
+    chiave = _chiave(nome, etichette)
+    with _lock:
+        voce = _span.get(chiave)
+        if voce is None:
+            _span[chiave] = [1, secondi, secondi]
+        else:
+            voce[0] += 1
+            voce[1] += secondi
+            if secondi > voce[2]:
+                voce[2] = secondi
+
+
+class span:
+    # with span("parsing", motore="lxml"): ...
+    __slots__ = ('nome', 'etichette', 'inizio')
+
+    def __init__(self, nome, **etichette):
+        self.nome = nome
+        self.etichette = etichette
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *errore):
+        osserva(self.nome, time.perf_counter() - self.inizio, **self.etichette)
+        return False
+
+
+def misurato(nome, **etichette):
+    # Decoratore: misura ogni chiamata della funzione come uno span
+    def decoratore(funzione):
+        @functools.wraps(funzione)
+        def avvolta(*args, **kwargs):
+            with span(nome, **etichette):
+                return funzione(*args, **kwargs)
+        return avvolta
+    return decoratore
+
+
+def azzera():
+    global _inizio
+    with _lock:
+        _span.clear()
+        _contatori.clear()
+        _inizio = time.time()
+
+
+def report():
+    with _lock:
+        span_ = [
+            {'nome': n, 'etichette': dict(e), 'conteggio': c, 'secondi_totali': round(t, 6), 'secondi_max': round(m, 6)}
+            for (n, e), (c, t, m) in sorted(_span.items())
+        ]
+        contatori = [
+            {'nome': n, 'etichette': dict(e), 'valore': v}
+            for (n, e), v in sorted(_contatori.items())
+        ]
+    return {
+        'inizio': datetime.fromtimestamp(_inizio).isoformat(timespec='seconds'),
+        'durata_secondi': round(time.time() - _inizio, 3),
+        'span': span_,
+        'contatori': contatori
+    }
+
+
+def _nome_prometheus(nome):
+    return f"{PREFISSO_PROMETHEUS}_{re.sub(r'[^a-zA-Z0-9_]', '_', nome)}"
+
+
+def _etichette_prometheus(etichette):
+    if not etichette:
+        return ''
+    valori = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in sorted(etichette.items())
+    )
+    return '{' + ','.join(valori) + '}'
+
+
+def testo_prometheus(dati=None):
+    dati = dati or report()
+    righe = []
+
+    def famiglia(nome, tipo, campioni):
+        righe.append(f"# TYPE {nome} {tipo}")
+        righe.extend(f"{nome}{_etichette_prometheus(e)} {v}" for e, v in campioni)
+
+    span_ = dati['span']
+    for suffisso, campo in (('secondi_totali', 'secondi_totali'), ('conteggio', 'conteggio'), ('secondi_max', 'secondi_max')):
+        campioni = [(dict(s['etichette'], span=s['nome']), s[campo]) for s in span_]
+        if campioni:
+            famiglia(_nome_prometheus(f"span_{suffisso}"), 'gauge', campioni)
+
+    per_nome = {}
+    for c in dati['contatori']:
+        per_nome.setdefault(c['nome'], []).append((c['etichette'], c['valore']))
+    for nome, campioni in per_nome.items():
+        famiglia(_nome_prometheus(nome), 'gauge', campioni)
+
+    famiglia(_nome_prometheus('durata_esecuzione_secondi'), 'gauge', [({}, dati['durata_secondi'])])
+    famiglia(_nome_prometheus('ultima_esecuzione_timestamp'), 'gauge', [({}, int(time.time()))])
+    return '\n'.join(righe) + '\n'
+
+
+def _scrivi_atomico(percorso, testo):
+    # Chi legge il file (node_exporter, upload degli artifact) non vede mai un file a metà
+    temporaneo = percorso + '.tmp'
+    with open(temporaneo, 'w', encoding='utf-8') as f:
+        f.write(testo)
+    os.replace(temporaneo, percorso)
+
+
+def scrivi_report(nome='esecuzione', cartella=None):
+    # Scrive <cartella>/<nome>.json e <cartella>/<nome>.prom; restituisce il report
+    cartella = CARTELLA_METRICHE if cartella is None else cartella
+    dati = report()
+    if not cartella:
+        return dati
+    try:
+        os.makedirs(cartella, exist_ok=True)
+        _scrivi_atomico(os.path.join(cartella, f"{nome}.json"), json.dumps(dati, indent=2, ensure_ascii=False))
+        _scrivi_atomico(os.path.join(cartella, f"{nome}.prom"), testo_prometheus(dati))
+        logging.info(f"Metriche scritte in {cartella}/{nome}.json e {nome}.prom")
+    except OSError as e:
+        logging.error(f"Errore nella scrittura delle metriche: {e}")
+    return dati
+
+
+def riepilogo(dati=None, righe_max=15):
+    # Gli span più costosi, per il log di fine esecuzione
+    dati = dati or report()
+    principali = sorted(dati['span'], key=lambda s: s['secondi_totali'], reverse=True)[:righe_max]
+    for s in principali:
+        etichette = ', '.join(f"{k}={v}" for k, v in s['etichette'].items())
+        yield f"{s['nome']}[{etichette}]: {s['secondi_totali']:.2f}s in {s['conteggio']} volte (max {s['secondi_max']:.2f}s)"
@@ -0,0 +1,406 @@
+import asyncio
+import contextvars
+import importlib
+import logging
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+from bs4.element import Tag
+
+import metriche
+from cache_http import cache_schede, impronta
+
+# Motore di parsing: "auto" usa selectolax se installato, altrimenti lxml, altrimenti BeautifulSoup
+MOTORE = os.getenv("EVENTI_PARSER", "auto")
+# Modalità parità: ogni pagina viene estratta anche con BeautifulSoup sull'albero completo
+# e gli eventuali scostamenti vengono segnalati nel log
+PARITA = os.getenv("EVENTI_PARSER_PARITA", "") not in ("", "0", "false")
+# Processi per il parsing in parallelo al fetch (estrai_html_asincrono); con 1 o 0 le pagine
+# vengono analizzate in un thread del processo principale
+PROCESSI_PARSING = int(os.getenv("EVENTI_PROCESSI_PARSING", str(os.cpu_count() or 1)))
+
+
+# ================= NODI =================
+# Interfaccia comune usata dalle funzioni estrai_eventi:
+#   seleziona(css) -> lista di nodi discendenti
+#   primo(css)     -> primo nodo discendente o None
+#   testo()        -> tutto il testo del nodo (come .text di BeautifulSoup)
+#   testo_compatto() -> frammenti di testo ripuliti e concatenati (come get_text(strip=True))
+#   attr(nome, default) -> valore dell'attributo
+#   antenato(tag)  -> primo antenato con quel tag o None
+#   html()         -> markup del nodo
+
+@lru_cache(maxsize=None)
+def _selettore_soupsieve(css):
+    import soupsieve
+    return soupsieve.compile(css)
+
+
+class NodoBs4:
+    __slots__ = ('nodo',)
+
+    def __init__(self, nodo):
+        self.nodo = nodo
+
+    def seleziona(self, css):
+        return [NodoBs4(n) for n in _selettore_soupsieve(css).select(self.nodo)]
+
+    def primo(self, css):
+        n = _selettore_soupsieve(css).select_one(self.nodo)
+        return NodoBs4(n) if n is not None else None
+
+    def testo(self):
+        return self.nodo.get_text()
+
+    def testo_compatto(self):
+        return self.nodo.get_text(strip=True)
+
+    def attr(self, nome, default=None):
+        valore = self.nodo.get(nome, default)
+        return ' '.join(valore) if isinstance(valore, list) else valore
+
+    def antenato(self, tag):
+        n = self.nodo.find_parent(tag)
+        return NodoBs4(n) if n is not None else None
+
+    def html(self):
+        return str(self.nodo)
+
+
+@lru_cache(maxsize=None)
+def _selettore_lxml(css):
+    from lxml import etree
+    from cssselect import HTMLTranslator
+    # Solo discendenti, come find/select di BeautifulSoup
+    return etree.XPath(HTMLTranslator().css_to_xpath(css, prefix='descendant::'))
+
+
+class NodoLxml:
+    __slots__ = ('nodo',)
+
+    def __init__(self, nodo):
+        self.nodo = nodo
+
+    def seleziona(self, css):
+        return [NodoLxml(n) for n in _selettore_lxml(css)(self.nodo)]
+
+    def primo(self, css):
+        trovati = _selettore_lxml(css)(self.nodo)
+        return NodoLxml(trovati[0]) if trovati else None
+
+    def testo(self):
+        return self.nodo.text_content()
+
+    def testo_compatto(self):
+        return ''.join(t.strip() for t in self.nodo.itertext() if t.strip())
+
+    def attr(self, nome, default=None):
+        return self.nodo.get(nome, default)
+
+    def antenato(self, tag):
+        for n in self.nodo.iterancestors(tag):
+            return NodoLxml(n)
+        return None
+
+    def html(self):
+        from lxml import html as lxml_html
+        return lxml_html.tostring(self.nodo, encoding='unicode', with_tail=False)
+
+
+class NodoSelectolax:
+    __slots__ = ('nodo',)
+
+    def __init__(self, nodo):
+        self.nodo = nodo
+
+    def seleziona(self, css):
+        # selectolax include anche il nodo stesso se corrisponde al selettore
+        return [NodoSelectolax(n) for n in self.nodo.css(css) if n.mem_id != self.nodo.mem_id]
+
+    def primo(self, css):
+        trovati = self.seleziona(css)
+        return trovati[0] if trovati else None
+
+    def testo(self):
+        return self.nodo.text(deep=True)
+
+    def testo_compatto(self):
+        return self.nodo.text(deep=True, strip=True)
+
+    def attr(self, nome, default=None):
+        valore = self.nodo.attributes.get(nome, default)
+        return '' if valore is None and nome in self.nodo.attributes else valore
+
+    def antenato(self, tag):
+        n = self.nodo.parent
+        while n is not None:
+            if n.tag == tag:
+                return NodoSelectolax(n)
+            n = n.parent
+        return None
+
+    def html(self):
+        return self.nodo.html
+
+
+def come_nodo(radice):
+    # Permette di chiamare estrai_eventi anche con un oggetto BeautifulSoup "classico"
+    if isinstance(radice, (NodoBs4, NodoLxml, NodoSelectolax)):
+        return radice
+    if isinstance(radice, Tag):
+        return NodoBs4(radice)
+    raise TypeError(f"Nodo HTML non supportato: {type(radice)!r}")
+
+
+# ================= MOTORI =================
+def _decodifica(contenuto):
+    # Stesso rilevamento della codifica di BeautifulSoup, così i motori restituiscono lo stesso testo
+    if isinstance(contenuto, bytes):
+        return UnicodeDammit(contenuto, is_html=True).unicode_markup or ''
+    return contenuto
+
+
+class MotoreBs4:
+    nome = 'bs4'
+
+    def __init__(self, restringi=True):
+        self.restringi = restringi
+
+    def analizza(self, contenuto, contenitori=None):
+        # Con `contenitori` (lista di coppie tag/classe) viene costruito solo il sottoalbero degli eventi
+        parse_only = None
+        if self.restringi and contenitori:
+            # L'attributo class arriva come stringa unica ("a b"): serve una regex per il singolo valore
+            classi = '|'.join(re.escape(c) for _, c in contenitori)
+            parse_only = SoupStrainer(
+                [t for t, _ in contenitori],
+                class_=re.compile(rf'(^|\s)({classi})(\s|$)')
+            )
+        return NodoBs4(BeautifulSoup(contenuto, 'html.parser', parse_only=parse_only))
+
+
+class MotoreLxml:
+    nome = 'lxml'
+
+    def analizza(self, contenuto, contenitori=None):
+        from lxml import html as lxml_html
+        contenuto = _decodifica(contenuto)
+        if not contenuto.strip():
+            contenuto = '<html></html>'
+        return NodoLxml(lxml_html.document_fromstring(contenuto))
+
+
+class MotoreSelectolax:
+    nome = 'selectolax'
+
+    def analizza(self, contenuto, contenitori=None):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as Parser
+        except ImportError:
+            from selectolax.parser import HTMLParser as Parser
+        return NodoSelectolax(Parser(_decodifica(contenuto)).root)
+
+
+MOTORI = {'bs4': MotoreBs4, 'lxml': MotoreLxml, 'selectolax': MotoreSelectolax}
+
+
+def _disponibile(nome):
+    moduli = {'lxml': ('lxml.html', 'cssselect'), 'selectolax': ('selectolax',), 'bs4': ()}[nome]
+    try:
+        for modulo in moduli:
+            __import__(modulo)
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def crea_motore(nome=None):
+    nome = nome or MOTORE
+    if nome == 'auto':
+        nome = next(n for n in ('selectolax', 'lxml', 'bs4') if _disponibile(n))
+    elif nome not in MOTORI:
+        raise ValueError(f"Motore HTML sconosciuto: {nome}")
+    elif not _disponibile(nome):
+        logging.warning(f"Motore HTML {nome} non installato, uso BeautifulSoup")
+        nome = 'bs4'
+    logging.info(f"Motore di parsing HTML: {nome}")
+    return MOTORI[nome]()
+
+
+# ================= ESTRAZIONE =================
+def _normalizza(valore):
+    # Le estrazioni usano datetime.now(): nel confronto di parità si ignorano secondi e microsecondi
+    if isinstance(valore, datetime):
+        return valore.replace(second=0, microsecond=0)
+    if isinstance(valore, dict):
+        return {k: _normalizza(v) for k, v in valore.items()}
+    if isinstance(valore, (list, tuple)):
+        return [_normalizza(v) for v in valore]
+    return valore
+
+
+def estrai_html(contenuto, estrai, contenitori=None, motore=None, cartella_schede=None, oggi=None):
+    # Analizza `contenuto` con il motore scelto e applica la funzione `estrai(radice)`.
+    # cartella_schede: la cartella della cache HTTP in uso, dove estrai_schede tiene le card
+    # (predefinita: cache_http.CARTELLA_CACHE)
+    # oggi: la data di riferimento per estrai (vedi oggi_estrazione), predefinita quella odierna
+    motore = motore or crea_motore()
+    token_schede = _cartella_schede.set(cartella_schede)
+    token_oggi = _oggi.set(oggi)
+    try:
+        with metriche.span('parsing', motore=motore.nome, estrattore=estrai.__module__):
+            risultato = estrai(motore.analizza(contenuto, contenitori))
+    finally:
+        _oggi.reset(token_oggi)
+        _cartella_schede.reset(token_schede)
+
+    if PARITA:
+        riferimento = estrai(MotoreBs4(restringi=False).analizza(contenuto))
+        if _normalizza(riferimento) != _normalizza(risultato):
+            logging.warning(
+                f"Parità motore {motore.nome}: risultato diverso da BeautifulSoup "
+                f"({estrai.__module__}.{estrai.__name__})"
+            )
+            logging.warning(f"  atteso: {riferimento}")
+            logging.warning(f"  ottenuto: {risultato}")
+        else:
+            logging.info(f"Parità motore {motore.nome}: OK ({estrai.__module__}.{estrai.__name__})")
+    return risultato
+
+
+# ================= CONTESTO =================
+# Data di riferimento dell'estrazione in corso (vedi estrai_html)
+_oggi = contextvars.ContextVar('oggi', default=None)
+
+
+def oggi_estrazione():
+    # Il giorno rispetto a cui leggere le pagine (es. l'anno delle date senza anno): oggi o,
+    # nel replay, il giorno in cui le pagine sono state registrate
+    return _oggi.get() or date.today()
+
+
+# ================= CARD =================
+# Cartella della cache delle card per l'estrazione in corso (vedi estrai_html)
+_cartella_schede = contextvars.ContextVar('cartella_schede', default=None)
+# Moduli usati da tutti gli estrattori delle card: testo dei nodi (qui), parsing delle date e
+# EventoPeriodo, che è anche il formato degli eventi salvati nella cache
+MODULI_ESTRAZIONE = ('motore_html', 'date_italiane', 'evento_compatto')
+# Da incrementare per invalidare la cache delle card quando cambia qualcosa che non sta nei
+# sorgenti dei moduli (es. una dipendenza esterna)
+VERSIONE_ESTRAZIONE = 1
+
+
+@lru_cache(maxsize=None)
+def _versione_modulo(nome):
+    # Impronta del sorgente di un modulo: se il codice cambia le card vanno rilette
+    try:
+        with open(importlib.import_module(nome).__file__, 'rb') as f:
+            return impronta(f.read())[:16]
+    except (ImportError, AttributeError, TypeError, OSError):
+        return ''
+
+
+@lru_cache(maxsize=None)
+def versione_estrazione():
+    # Impronta del codice comune a tutte le estrazioni: se cambia la cache delle card viene svuotata
+    parti = [str(VERSIONE_ESTRAZIONE)] + [_versione_modulo(nome) for nome in MODULI_ESTRAZIONE]
+    return impronta('|'.join(parti).encode('utf-8'))[:16]
+
+
+def versione_estrattore(estrai):
+    # Impronta di una funzione di estrazione: il sorgente del suo modulo e il codice comune
+    # (versione_estrazione). Vale per le card e per i risultati salvati dalla cache HTTP.
+    modulo = estrai.__module__
+    return f"{modulo}.{estrai.__qualname__}|{_versione_modulo(modulo)}|{versione_estrazione()}"
+
+
+def estrai_schede(schede, estrai_scheda, chiave=None, frammento=None):
+    # Applica estrai_scheda(card) -> evento (o None per le card da scartare) a ogni card e
+    # restituisce gli eventi nell'ordine delle card. Il risultato di una card con lo stesso HTML
+    # già vista in un'esecuzione precedente viene riusato senza rileggerla: il lavoro di
+    # estrazione è proporzionale alle card nuove o modificate.
+    #   chiave: ciò da cui dipende il risultato oltre all'HTML (es. l'anno per le date senza anno)
+    #   frammento(card): il testo da cui dipende il risultato, se non basta l'HTML della card
+    # Il modulo dell'estrattore e i moduli comuni (MODULI_ESTRAZIONE) entrano nell'impronta:
+    # modificarli invalida le card, e un cambio dei moduli comuni svuota la cache. Con la
+    # modalità parità la cache non si usa, perché il confronto deve rieseguire l'estrazione, e
+    # nemmeno con BeautifulSoup, dove serializzare la card costa più che estrarla.
+    cache = None if PARITA or not schede or isinstance(schede[0], NodoBs4) else cache_schede(_cartella_schede.get(), versione_estrazione())
+    if cache is None:
+        return [e for e in map(estrai_scheda, schede) if e is not None]
+
+    modulo = estrai_scheda.__module__
+    prefisso = f"{versione_estrattore(estrai_scheda)}|{chiave or ''}|"
+    impronte = [impronta((prefisso + (frammento(s) if frammento else s.html())).encode('utf-8')) for s in schede]
+    salvate = cache.leggi(impronte)
+
+    eventi = []
+    nuove = {}
+    riusate = 0
+    for scheda, impronta_scheda in zip(schede, impronte):
+        if impronta_scheda in salvate:
+            # Un oggetto nuovo per ogni card: gli eventi possono essere modificati in seguito
+            evento = pickle.loads(salvate[impronta_scheda])
+            riusate += 1
+        else:
+            evento = nuove[impronta_scheda] = estrai_scheda(scheda)
+        if evento is not None:
+            eventi.append(evento)
+    cache.salva(nuove)
+    metriche.incrementa('schede_riusate', riusate, estrattore=modulo)
+    metriche.incrementa('schede_estratte', len(schede) - riusate, estrattore=modulo)
+    return eventi
+
+
+# ================= POOL DI PROCESSI =================
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def pool_parsing():
+    # Pool condiviso da tutte le sorgenti, creato alla prima pagina (None se disattivato).
+    # I processi partono con forkserver/spawn: il processo principale ha già altri thread attivi
+    global _pool
+    if PROCESSI_PARSING <= 1:
+        return None
+    with _lock_pool:
+        if _pool is None:
+            metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=PROCESSI_PARSING, mp_context=multiprocessing.get_context(metodo))
+            logging.info(f"Parsing HTML in {PROCESSI_PARSING} processi ({metodo})")
+        return _pool
+
+
+def _estrai_in_processo(contenuto, estrai, contenitori, cartella_schede, oggi):
+    # Eseguita nel processo del pool: le metriche raccolte lì andrebbero perse, quindi la durata
+    # del parsing e i contatori tornano al processo principale insieme al risultato
+    metriche.azzera()
+    motore = crea_motore()
+    inizio = time.perf_counter()
+    risultato = estrai_html(contenuto, estrai, contenitori, motore, cartella_schede, oggi)
+    return risultato, motore.nome, time.perf_counter() - inizio, metriche.report()['contatori']
+
+
+async def estrai_html_asincrono(contenuto, estrai, contenitori=None, cartella_schede=None, oggi=None):
+    # Come estrai_html, ma fuori dal ciclo degli eventi: in un processo del pool (estrai deve
+    # essere una funzione definita a livello di modulo) o, senza pool, in un thread.
+    # Intanto il fetcher continua a scaricare le pagine successive
+    pool = pool_parsing()
+    if pool is None:
+        return await asyncio.to_thread(estrai_html, contenuto, estrai, contenitori, None, cartella_schede, oggi)
+    risultato, motore, durata, contatori = await asyncio.get_running_loop().run_in_executor(
+        pool, _estrai_in_processo, contenuto, estrai, contenitori, cartella_schede, oggi
+    )
+    metriche.osserva('parsing', durata, motore=motore, estrattore=estrai.__module__)
+    for contatore in contatori:
+        metriche.incrementa(contatore['nome'], contatore['valore'], **contatore['etichette'])
+    return risultato
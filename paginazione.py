@@ -0,0 +1,44 @@
+import logging
+from datetime import datetime
+
+import metriche
+
+
+def data_inizio(evento):
+    # Giorno di inizio di un EventoPeriodo o di un evento-dizionario ('data'); None se manca
+    valore = evento.get('data') if isinstance(evento, dict) else evento.inizio
+    return valore.date() if isinstance(valore, datetime) else valore
+
+
+class Paginazione:
+    # Decide quando smettere di chiedere pagine di un elenco. Riceve gli eventi di ogni pagina
+    # nell'ordine delle pagine (ferma) e si ferma quando:
+    #   - tutti gli eventi datati della pagina iniziano oltre l'orizzonte (gli elenchi sono
+    #     ordinati per data: le pagine successive finirebbero comunque fuori dalla finestra);
+    #   - la raccolta incrementale (archivio_eventi) ha trovato abbastanza eventi già noti.
+    # A fine raccolta registra quante richieste sono state evitate.
+    def __init__(self, sorgente, orizzonte=None, incrementale=None, righe=None):
+        self.sorgente = sorgente
+        self.orizzonte = orizzonte.date() if isinstance(orizzonte, datetime) else orizzonte
+        self.incrementale = incrementale
+        # eventi -> righe del tab, per il confronto con l'archivio
+        self.righe = righe
+        self.motivo = None
+
+    def ferma(self, eventi):
+        if self.motivo:
+            return True
+        date_pagina = [d for d in map(data_inizio, eventi) if d is not None]
+        if self.orizzonte and date_pagina and min(date_pagina) > self.orizzonte:
+            self.motivo = 'orizzonte'
+            logging.info(f"{self.sorgente}: la pagina inizia il {min(date_pagina)}, oltre l'orizzonte del {self.orizzonte}")
+        elif self.incrementale and self.incrementale.ferma(self.righe(eventi)):
+            self.motivo = 'noti'
+        return self.motivo is not None
+
+    def registra(self, richieste, totale):
+        # richieste: pagine effettivamente scaricate; totale: pagine previste senza interruzioni
+        evitate = max(totale - richieste, 0)
+        metriche.incrementa('pagine_evitate', evitate, sorgente=self.sorgente, motivo=self.motivo or 'fine_elenco')
+        if evitate:
+            logging.info(f"{self.sorgente}: {richieste} pagine richieste, {evitate} evitate ({self.motivo or 'fine elenco'})")
@@ -0,0 +1,98 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import scraping_eventifvg
+import scraping_itinerarinellarte
+import scraping_turismofvg
+import metriche
+from archivio_eventi import PERCORSO_ARCHIVIO, ArchivioEventi
+from checkpoint import Checkpoint
+from feed_statici import CARTELLA_FEED, esporta_feed
+from sink_output import crea_sink, crea_sink_pubblicazione
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Le sorgenti (sorgenti.Sorgente) condividono le sessioni HTTP e, qui, il sink e l'autenticazione.
+# Una nuova sorgente è un modulo che dichiara SORGENTE e va aggiunta a questa lista
+SORGENTI = [scraping_eventifvg.SORGENTE, scraping_itinerarinellarte.SORGENTE, scraping_turismofvg.SORGENTE]
+
+
+def esegui_pipeline(riprendi=False):
+    # riprendi: continua l'esecuzione di oggi interrotta da un errore; le sorgenti già scritte
+    # vengono saltate e delle altre si richiedono solo le pagine non ancora estratte
+    inizio = time.monotonic()
+
+    # Un solo sink (e, per Google Sheets, una sola autenticazione) condiviso da tutte le fasi
+    try:
+        sink = crea_sink()
+        pubblicazione = crea_sink_pubblicazione(sink)
+    except Exception as e:
+        logging.error(f"Errore nell'accesso alla destinazione dei dati: {e}")
+        return False
+
+    # Con EVENTI_ARCHIVIO gli eventi restano in un archivio locale: ogni tab contiene anche gli
+    # eventi non rivisti perché la raccolta si è fermata prima, e l'unione legge dall'archivio
+    archivio = ArchivioEventi(PERCORSO_ARCHIVIO) if PERCORSO_ARCHIVIO else None
+    incrementali = {
+        sorgente: archivio.raccolta_incrementale(sorgente.nome) if archivio else None
+        for sorgente in SORGENTI
+    }
+
+    stato = Checkpoint(riprendi=riprendi)
+    da_raccogliere = [s for s in SORGENTI if not stato.scritta(s.nome)]
+    for sorgente in SORGENTI:
+        if sorgente not in da_raccogliere:
+            logging.info(f"{sorgente.nome}: già scritta in questa esecuzione, saltata")
+    checkpoint = {sorgente: stato.sorgente(sorgente.nome) for sorgente in da_raccogliere}
+
+    errori = 0
+    # Fetch e parsing delle sorgenti in parallelo; la scrittura di ogni tab parte appena
+    # la relativa sorgente ha finito, mentre le altre stanno ancora scaricando
+    with ThreadPoolExecutor(max_workers=max(len(da_raccogliere), 1)) as pool:
+        futures = {
+            pool.submit(sorgente.raccogli_eventi, incrementali[sorgente], checkpoint[sorgente]): sorgente
+            for sorgente in da_raccogliere
+        }
+        for future in as_completed(futures):
+            sorgente = futures[future]
+            try:
+                eventi = future.result()
+                righe = sorgente.prepara_righe(eventi)
+                if archivio:
+                    completa = not incrementali[sorgente].interrotta
+                    righe = archivio.aggiorna(sorgente.nome, righe, completa)
+                sorgente.scrivi_righe(sink, righe)
+                logging.info(f"{sorgente.nome}: {len(righe)} righe in {time.monotonic() - inizio:.1f}s")
+                # Con pagine perse la sorgente resta da riprendere (il tab contiene comunque quelle raccolte)
+                if checkpoint[sorgente].pagine_in_errore:
+                    errori += 1
+                    logging.error(f"{sorgente.nome}: raccolta incompleta, rieseguire con --resume")
+                else:
+                    stato.segna_scritta(sorgente.nome)
+            except Exception as e:
+                errori += 1
+                logging.error(f"Errore nella sorgente {sorgente.nome}: {e}")
+
+    # L'unione (con pandas) si importa solo ora, mentre le sorgenti non ne hanno bisogno
+    from unione_dati_scraping import unisci_e_ordina_eventi
+    # Con EVENTI_FEED_DIR l'unione viene esportata anche nei feed statici JSON e iCalendar
+    unisci_e_ordina_eventi(sink, pubblicazione, sorgenti=archivio, esporta=esporta_feed if CARTELLA_FEED else None)
+    logging.info(f"Pipeline completata in {time.monotonic() - inizio:.1f}s")
+
+    # Report JSON + Prometheus e, nel log, le fasi più lente
+    metriche.incrementa('sorgenti_in_errore', errori)
+    dati = metriche.scrivi_report('pipeline')
+    for riga in metriche.riepilogo(dati):
+        logging.info(f"  {riga}")
+    return errori == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraping di tutte le sorgenti e unione dei dati")
+    parser.add_argument('--resume', action='store_true',
+                        help="riprende l'esecuzione di oggi dall'ultima pagina e sorgente completate")
+    args = parser.parse_args()
+    if not esegui_pipeline(riprendi=args.resume):
+        raise SystemExit(1)
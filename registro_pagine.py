@@ -0,0 +1,184 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+
+import metriche
+from fetch_pagine import Pagina
+
+# Registrazione delle pagine scaricate: con EVENTI_REGISTRA_DIR ogni esecuzione salva i corpi delle
+# risposte (compressi) in un file SQLite per esecuzione, indicizzati per sorgente e URL. Una
+# registrazione si può poi rigiocare (eventi_friuli.py replay): le pagine passano dagli estrattori
+# senza rete né pause, per riprodurre un'esecuzione o rielaborare i dati dopo un cambio di markup.
+CARTELLA_REGISTRAZIONI = os.getenv("EVENTI_REGISTRA_DIR", "")
+# Le registrazioni più vecchie vengono eliminate all'avvio di una nuova; 0 per tenerle tutte
+GIORNI_REGISTRAZIONI = int(os.getenv("EVENTI_REGISTRA_GIORNI", "14"))
+LIVELLO_COMPRESSIONE = 6
+ESTENSIONE = '.sqlite'
+
+
+class PaginaNonRegistrata(Exception):
+    pass
+
+
+class RegistroPagine:
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self.nome = os.path.basename(percorso)[:-len(ESTENSIONE)]
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(percorso, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pagine (
+                    sorgente TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    ordine INTEGER NOT NULL,
+                    status INTEGER,
+                    encoding TEXT,
+                    corpo BLOB NOT NULL,
+                    byte INTEGER NOT NULL,
+                    scaricata TEXT NOT NULL,
+                    PRIMARY KEY (sorgente, url)
+                )
+            """)
+        self.data = self._data_registrazione()
+
+    def _data_registrazione(self):
+        # Il giorno dell'esecuzione registrata, che nel replay fa da "oggi": dalla prima pagina
+        # salvata o, per una registrazione vuota, dal nome (AAAAMMGG-hhmmss)
+        prima = self.conn.execute("SELECT MIN(scaricata) FROM pagine").fetchone()[0]
+        try:
+            if prima:
+                return date.fromisoformat(prima[:10])
+            return datetime.strptime(self.nome[:8], '%Y%m%d').date()
+        except ValueError:
+            return date.today()
+
+    def sorgente(self, nome):
+        return RegistrazioneSorgente(self, nome)
+
+    def salva(self, sorgente, pagina):
+        corpo = zlib.compress(pagina.contenuto, LIVELLO_COMPRESSIONE)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pagine VALUES "
+                "(?, ?, (SELECT COUNT(*) FROM pagine), ?, ?, ?, ?, ?)",
+                (sorgente, pagina.url, pagina.status, pagina.encoding, corpo, len(pagina.contenuto),
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+        metriche.incrementa('pagine_registrate', sorgente=sorgente)
+
+    def pagina(self, sorgente, url, indice=None):
+        # La pagina registrata, None se nell'esecuzione registrata non era stata scaricata
+        with self._lock:
+            riga = self.conn.execute(
+                "SELECT status, encoding, corpo FROM pagine WHERE sorgente = ? AND url = ?", (sorgente, url)
+            ).fetchone()
+        if riga is None:
+            return None
+        status, encoding, corpo = riga
+        return Pagina(indice, url, status, zlib.decompress(corpo), encoding)
+
+    def sorgenti(self):
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT sorgente FROM pagine ORDER BY sorgente")]
+
+    def riepilogo(self):
+        # (sorgente, pagine, byte originali, byte compressi)
+        with self._lock:
+            return self.conn.execute(
+                "SELECT sorgente, COUNT(*), SUM(byte), SUM(LENGTH(corpo)) FROM pagine GROUP BY sorgente ORDER BY sorgente"
+            ).fetchall()
+
+    def chiudi(self):
+        self.conn.close()
+
+
+class RegistrazioneSorgente:
+    # Il registro visto da una sorgente: è l'oggetto passato al fetcher
+    def __init__(self, registro, nome):
+        self.registro = registro
+        self.nome = nome
+
+    def salva(self, pagina):
+        try:
+            self.registro.salva(self.nome, pagina)
+        except sqlite3.Error as e:
+            logging.warning(f"Impossibile registrare {pagina.url}: {e}")
+
+
+class FetcherRegistrato:
+    # Stessa interfaccia di fetch_pagine.FetcherAsincrono, con le pagine lette dalla registrazione:
+    # una pagina non registrata (non scaricata o in errore nell'esecuzione originale) è un errore
+    def __init__(self, registro, sorgente):
+        self.registro = registro
+        self.sorgente = sorgente
+        self.errori = 0
+
+    async def scarica(self, url, indice=None):
+        pagina = self.registro.pagina(self.sorgente, url, indice)
+        if pagina is None:
+            logging.warning(f"Pagina non presente nella registrazione {self.registro.nome}: {url}")
+            return Pagina(indice, url, errore=PaginaNonRegistrata(url))
+        metriche.incrementa('pagine_rigiocate', sorgente=self.sorgente)
+        return pagina
+
+    async def scarica_tutte(self, urls, max_in_volo=None):
+        for indice, url in enumerate(urls):
+            yield await self.scarica(url, indice)
+
+
+def _elimina_vecchie(cartella):
+    if GIORNI_REGISTRAZIONI <= 0:
+        return
+    limite = time.time() - GIORNI_REGISTRAZIONI * 86400
+    for nome in os.listdir(cartella):
+        percorso = os.path.join(cartella, nome)
+        if nome.endswith(ESTENSIONE) and os.path.getmtime(percorso) < limite:
+            os.remove(percorso)
+            logging.info(f"Registrazione eliminata: {nome}")
+
+
+_registrazione = None
+_lock_registrazione = threading.Lock()
+
+
+def registrazione_corrente():
+    # La registrazione di questa esecuzione, creata alla prima pagina; None se disattivata
+    global _registrazione
+    if not CARTELLA_REGISTRAZIONI:
+        return None
+    with _lock_registrazione:
+        if _registrazione is None:
+            os.makedirs(CARTELLA_REGISTRAZIONI, exist_ok=True)
+            _elimina_vecchie(CARTELLA_REGISTRAZIONI)
+            nome = datetime.now().strftime('%Y%m%d-%H%M%S')
+            _registrazione = RegistroPagine(os.path.join(CARTELLA_REGISTRAZIONI, nome + ESTENSIONE))
+            logging.info(f"Registrazione delle pagine in {_registrazione.percorso}")
+        return _registrazione
+
+
+def registrazioni(cartella=None):
+    # Nomi delle registrazioni disponibili, dalla più vecchia
+    cartella = cartella or CARTELLA_REGISTRAZIONI
+    if not cartella or not os.path.isdir(cartella):
+        return []
+    return sorted(n[:-len(ESTENSIONE)] for n in os.listdir(cartella) if n.endswith(ESTENSIONE))
+
+
+def apri_registrazione(nome=None, cartella=None):
+    # nome: percorso di un file, nome di una registrazione (es. 20260501-020000) o None per l'ultima
+    cartella = cartella or CARTELLA_REGISTRAZIONI
+    if nome and os.path.isfile(nome):
+        return RegistroPagine(nome)
+    disponibili = registrazioni(cartella)
+    if not nome:
+        if not disponibili:
+            raise ValueError(f"Nessuna registrazione in '{cartella}' (impostare EVENTI_REGISTRA_DIR)")
+        nome = disponibili[-1]
+    if nome not in disponibili:
+        raise ValueError(f"Registrazione sconosciuta: {nome} (disponibili: {', '.join(disponibili) or 'nessuna'})")
+    return RegistroPagine(os.path.join(cartella, nome + ESTENSIONE))
@@ -0,0 +1,77 @@
+import importlib.util
+import os
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metriche
+
+# Connessioni condivise da tutte le sorgenti: una sessione per tipo di client, con le connessioni
+# keep-alive riusate tra le pagine (niente nuovo handshake TCP+TLS per ogni richiesta),
+# risposte compresse e una cache DNS in memoria per i nuovi collegamenti verso lo stesso host.
+
+# Connessioni tenute aperte per host (almeno il massimo di richieste parallele verso un host)
+CONNESSIONI_PER_HOST = 10
+# Durata (secondi) delle risposte DNS in cache; 0 per disattivare la cache
+TTL_DNS = int(os.getenv("EVENTI_TTL_DNS", "300"))
+
+# urllib3 decomprime brotli solo se è installato uno dei due pacchetti
+BROTLI = any(importlib.util.find_spec(m) for m in ('brotli', 'brotlicffi'))
+ACCEPT_ENCODING = 'gzip, deflate, br' if BROTLI else 'gzip, deflate'
+
+_lock = threading.Lock()
+_sessioni = {}
+
+_getaddrinfo_di_sistema = socket.getaddrinfo
+_dns = {}
+_lock_dns = threading.Lock()
+
+
+def _getaddrinfo_con_cache(*args, **kwargs):
+    chiave = (args, tuple(sorted(kwargs.items())))
+    adesso = time.monotonic()
+    with _lock_dns:
+        voce = _dns.get(chiave)
+    if voce and voce[0] > adesso:
+        metriche.incrementa('dns', esito='cache')
+        return voce[1]
+    risultato = _getaddrinfo_di_sistema(*args, **kwargs)
+    metriche.incrementa('dns', esito='risolto')
+    with _lock_dns:
+        _dns[chiave] = (adesso + TTL_DNS, risultato)
+    return risultato
+
+
+def attiva_cache_dns():
+    # Sostituisce socket.getaddrinfo per tutto il processo (anche per il client di Google Sheets)
+    if TTL_DNS > 0:
+        socket.getaddrinfo = _getaddrinfo_con_cache
+
+
+def _crea_sessione(tipo):
+    if tipo == 'cloudscraper':
+        # cloudscraper usa un proprio adattatore HTTPS (cifrari e intestazioni di un browser):
+        # resta il suo, che tiene comunque aperte le connessioni
+        import cloudscraper
+        return cloudscraper.create_scraper()
+    if tipo != 'requests':
+        raise ValueError(f"Client HTTP sconosciuto: {tipo} (valori ammessi: requests, cloudscraper)")
+
+    sessione = requests.Session()
+    adattatore = HTTPAdapter(pool_connections=CONNESSIONI_PER_HOST, pool_maxsize=CONNESSIONI_PER_HOST)
+    sessione.mount('https://', adattatore)
+    sessione.mount('http://', adattatore)
+    sessione.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return sessione
+
+
+def sessione(tipo='requests'):
+    # La sessione condivisa per il tipo di client, creata alla prima richiesta
+    with _lock:
+        if tipo not in _sessioni:
+            attiva_cache_dns()
+            _sessioni[tipo] = _crea_sessione(tipo)
+        return _sessioni[tipo]
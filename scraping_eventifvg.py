@@ -1,197 +1,268 @@
-import os
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import time
+import asyncio
+from datetime import date, datetime
 import logging
+import os
+import metriche
+import runtime_http
+from cache_http import impronta
+from motore_html import come_nodo, estrai_html_asincrono, estrai_schede, versione_estrattore
+from date_italiane import formatta_data, parse_data_esatta
+from evento_compatto import EventoPeriodo
+from sorgenti import SUCCESSIVA, Sorgente
 
 # Configura il logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Mappa manuale dei nomi dei mesi in italiano
-mesi_italiani = {
-    "Jan": "Gen", "Feb": "Feb", "Mar": "Mar", "Apr": "Apr", "May": "Mag", "Jun": "Giu",
-    "Jul": "Lug", "Aug": "Ago", "Sep": "Set", "Oct": "Ott", "Nov": "Nov", "Dec": "Dic"
-}
-
 # URL di partenza
 url = 'https://www.eventifvg.it/'
+PAUSA = 2
+# Limite di sicurezza: di norma la paginazione si chiude molto prima, al superamento di GIORNI_AVANTI
+MAX_PAGINE = 50
 
-def estrai_eventi(soup):
-    eventi = []
-
-    # Trova tutti gli eventi nella pagina
-    for evento in soup.find_all('div', class_='tribe-events-calendar-list__event-wrapper'):
-        # Estrazione del titolo e del link
-        titolo_elem = evento.find('h4', class_='tribe-events-calendar-list__event-title')
-        if titolo_elem:
-            link_elem = titolo_elem.find('a', class_='tribe-events-calendar-list__event-title-link')
-            if link_elem and link_elem.has_attr('href'):
-                titolo = link_elem.text.strip()  # Estrai il testo del titolo
-                link = link_elem['href']  # Estrai il link dell'evento
-            else:
-                logging.warning(f"Link non trovato per l'evento '{titolo_elem.text.strip()}'")
-                titolo = 'Titolo non disponibile'
-                link = 'Link non disponibile'
+WORKSHEET_NAME = "EventiFvg"
+
+# Arricchimento facoltativo dalle pagine dei singoli eventi: categoria, data di fine e indirizzo completo
+DETTAGLI = os.getenv("EVENTI_DETTAGLI_EVENTIFVG", "") not in ("", "0", "false")
+MAX_DETTAGLI_PER_HOST = 4
+PAUSA_DETTAGLI = 0.5
+# Un dettaglio già letto viene riusato senza richieste finché la scheda nell'elenco non cambia,
+# ma al massimo per questo numero di giorni
+VALIDITA_DETTAGLI_GIORNI = 7
+# Gli eventi oltre oggi + GIORNI_AVANTI non vengono raccolti
+GIORNI_AVANTI = 7
+
+# Nodi da analizzare: le card degli eventi e il link alla pagina successiva
+CONTENITORI = [
+    ('div', 'tribe-events-calendar-list__event-wrapper'),
+    ('a', 'tribe-events-c-nav__next')
+]
+
+def estrai_evento(evento):
+    # Estrazione del titolo e del link
+    titolo_elem = evento.primo('h4.tribe-events-calendar-list__event-title')
+    if titolo_elem:
+        link_elem = titolo_elem.primo('a.tribe-events-calendar-list__event-title-link')
+        if link_elem and link_elem.attr('href') is not None:
+            titolo = link_elem.testo().strip()  # Estrai il testo del titolo
+            link = link_elem.attr('href')  # Estrai il link dell'evento
         else:
-            logging.warning("Titolo non trovato per l'evento")
+            logging.warning(f"Link non trovato per l'evento '{titolo_elem.testo().strip()}'")
             titolo = 'Titolo non disponibile'
             link = 'Link non disponibile'
+    else:
+        logging.warning("Titolo non trovato per l'evento")
+        titolo = 'Titolo non disponibile'
+        link = 'Link non disponibile'
+
+    # Estrazione della data
+    data = None
+    data_elem = evento.primo('time.tribe-events-calendar-list__event-datetime')
+    data_raw = data_elem.attr('datetime') if data_elem else None
+    if data_raw is not None:
+        try:
+            # La data viene estratta dall'attributo datetime
+            data = datetime.strptime(data_raw, '%Y-%m-%d')
+            logging.info(f"Data trovata: {data}")
+        except ValueError as e:
+            logging.warning(f"Formato data non valido per {data_raw}: {e}")
+    else:
+        logging.warning(f"Nessuna data trovata nel tag datetime per l'evento '{titolo}'")
+
+    # Estrazione dell'orario di inizio
+    orario = 'Orario non disponibile'
+    orario_elem = evento.primo('span.tribe-event-date-start')
+    if orario_elem:
+        orario = orario_elem.testo().split('@')[-1].strip()
+
+    # Estrazione dell'orario di fine
+    orario_fine = 'Orario non disponibile'
+    orario_fine_elem = evento.primo('span.tribe-event-time')
+    if orario_fine_elem:
+        orario_fine = orario_fine_elem.testo().strip()
+
+    # Estrazione del luogo
+    luogo_elem = evento.primo('address.tribe-events-calendar-list__event-venue')
+    luogo = 'Luogo non disponibile'
+    if luogo_elem:
+        luogo_title_elem = luogo_elem.primo('span.tribe-events-calendar-list__event-venue-title')
+        luogo = luogo_title_elem.testo().strip() if luogo_title_elem else luogo
+
+    # Estrazione della descrizione
+    descrizione_elem = evento.primo('div.tribe-events-calendar-list__event-description')
+    descrizione = descrizione_elem.testo().strip() if descrizione_elem else 'Descrizione non disponibile'
+
+    # Crea il dizionario per l'evento
+    evento_data = {
+        'titolo': titolo,
+        'data': data,  # Oggetto datetime o None
+        'orario': f"{orario} - {orario_fine}",
+        'luogo': luogo,
+        'link': link,
+        'categoria': 'Non specificata',  # Aggiungi qui la logica per la categoria se necessario
+        'descrizione': descrizione
+    }
+
+    logging.info(f"Evento trovato: {evento_data}")
+    return evento_data
+
+
+def estrai_eventi(soup):
+    # Trova tutti gli eventi nella pagina; le card già viste vengono riusate
+    schede = come_nodo(soup).seleziona('div.tribe-events-calendar-list__event-wrapper')
+    return estrai_schede(schede, estrai_evento)
+
+
+def estrai_eventi_e_successiva(radice):
+    # Restituisce gli eventi e l'URL della pagina successiva (None se non c'è)
+    next_page_elem = radice.primo('a.tribe-events-c-nav__next')
+    url_successivo = next_page_elem.attr('href') if next_page_elem else None
+    return estrai_eventi(radice), url_successivo
 
-        # Estrazione della data
-        data = None
-        data_elem = evento.find('time', class_='tribe-events-calendar-list__event-datetime')
-        if data_elem and data_elem.has_attr('datetime'):
-            data_raw = data_elem['datetime']
-            try:
-                # La data viene estratta dall'attributo datetime
-                data = datetime.strptime(data_raw, '%Y-%m-%d')
-                logging.info(f"Data trovata: {data}")
-            except ValueError as e:
-                logging.warning(f"Formato data non valido per {data_raw}: {e}")
-        else:
-            logging.warning(f"Nessuna data trovata nel tag datetime per l'evento '{titolo}'")
-
-        # Estrazione dell'orario di inizio
-        orario = 'Orario non disponibile'
-        orario_elem = evento.find('span', class_='tribe-event-date-start')
-        if orario_elem:
-            orario = orario_elem.text.split('@')[-1].strip()
-
-        # Estrazione dell'orario di fine
-        orario_fine = 'Orario non disponibile'
-        orario_fine_elem = evento.find('span', class_='tribe-event-time')
-        if orario_fine_elem:
-            orario_fine = orario_fine_elem.text.strip()
-
-        # Estrazione del luogo
-        luogo_elem = evento.find('address', class_='tribe-events-calendar-list__event-venue')
-        luogo = 'Luogo non disponibile'
-        if luogo_elem:
-            luogo_title_elem = luogo_elem.find('span', class_='tribe-events-calendar-list__event-venue-title')
-            luogo = luogo_title_elem.text.strip() if luogo_title_elem else luogo
-
-        # Estrazione della descrizione
-        descrizione_elem = evento.find('div', class_='tribe-events-calendar-list__event-description')
-        descrizione = descrizione_elem.text.strip() if descrizione_elem else 'Descrizione non disponibile'
-
-        # Crea il dizionario per l'evento
-        evento_data = {
-            'titolo': titolo,
-            'data': data,  # Oggetto datetime o None
-            'orario': f"{orario} - {orario_fine}",
-            'luogo': luogo,
-            'link': link,
-            'categoria': 'Non specificata',  # Aggiungi qui la logica per la categoria se necessario
-            'descrizione': descrizione
-        }
 
-        logging.info(f"Evento trovato: {evento_data}")
-        eventi.append(evento_data)
-
-    return eventi
-
-
-def main():
-    try:
-        # Autenticazione con Google Sheets
-        client_email = os.getenv("GSHEET_CLIENT_EMAIL")
-        private_key = os.getenv("GSHEET_PRIVATE_KEY")
-
-        credentials_info = {
-            "type": "service_account",
-            "project_id": "EventiFriuli",
-            "private_key_id": "2ad6e92ed5bd78ebb61505057bc75ecb4130b6a6",
-            "private_key": private_key,
-            "client_email": client_email,
-            "client_id": "103136377669455790448",
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{client_email}"
+# ================= DETTAGLI =================
+def estrai_dettaglio(soup):
+    # Pagina del singolo evento (The Events Calendar): categorie, data di fine e luogo con indirizzo
+    radice = come_nodo(soup)
+
+    categorie = [a.testo().strip() for a in radice.seleziona('.tribe-events-event-categories a')]
+
+    data_fine = None
+    fine_elem = radice.primo('abbr.tribe-events-end-date') or radice.primo('.tribe-events-end-date')
+    if fine_elem:
+        data_fine = parse_data_esatta(fine_elem.attr('title') or fine_elem.testo().strip())
+
+    parti_luogo = []
+    for selettore in ('.tribe-venue', '.tribe-street-address', '.tribe-locality'):
+        elem = radice.primo(selettore)
+        testo = ' '.join(elem.testo().split()) if elem else ''
+        if testo and testo not in parti_luogo:
+            parti_luogo.append(testo)
+
+    return {
+        'categoria': ', '.join(categorie) or None,
+        'data_fine': data_fine,
+        'luogo': ', '.join(parti_luogo) or None
+    }
+
+
+async def estrai_dettaglio_pagina(pagina):
+    return await estrai_html_asincrono(pagina.contenuto, estrai_dettaglio)
+
+
+def _impronta_scheda(evento):
+    # Cosa mostra l'elenco per l'evento: se non cambia, non serve rileggere la pagina di dettaglio
+    campi = (evento['titolo'], evento['data'], evento['orario'], evento['luogo'], evento['descrizione'])
+    return impronta(repr(campi).encode('utf-8'))
+
+
+def applica_dettaglio(evento, dettaglio):
+    if dettaglio.get('categoria'):
+        evento['categoria'] = dettaglio['categoria']
+    if dettaglio.get('luogo'):
+        evento['luogo'] = dettaglio['luogo']
+    evento['data_fine'] = dettaglio.get('data_fine')
+
+
+class DettagliEventi:
+    # Completa gli eventi con la pagina di dettaglio, in parallelo alla paginazione dell'elenco.
+    # L'indice salvato nella cache (link -> impronta della scheda, data di lettura, dettaglio)
+    # evita le richieste per gli eventi già visti e invariati; le altre pagine vengono scaricate
+    # entro il limite per host e la loro estrazione è riusata se il contenuto ha lo stesso hash.
+    # Indice ed estrazioni valgono per il codice che li ha prodotti: con un estrattore
+    # modificato i dettagli vengono riletti.
+    def __init__(self, cache, crea_fetcher):
+        self.cache = cache
+        self.fetcher = crea_fetcher(
+            client=runtime_http.sessione(), max_per_host=MAX_DETTAGLI_PER_HOST, pausa=PAUSA_DETTAGLI
+        )
+        self.versione = versione_estrattore(estrai_dettaglio)
+        salvato = cache.leggi_valore('dettagli_eventifvg', {})
+        self.indice = salvato.get('voci', {}) if salvato.get('versione') == self.versione else {}
+        self.task = []
+
+    def pagina(self, eventi):
+        self.task.append(asyncio.ensure_future(self.arricchisci(eventi)))
+
+    async def chiudi(self):
+        # Un errore nei dettagli lascia gli eventi come letti dall'elenco, senza fermare la sorgente
+        for esito in await asyncio.gather(*self.task, return_exceptions=True):
+            if isinstance(esito, Exception):
+                logging.error(f"Errore nelle pagine di dettaglio di {WORKSHEET_NAME}: {esito}")
+        # Le voci scadute non verrebbero comunque riusate
+        oggi = date.today()
+        self.indice = {
+            link: voce for link, voce in self.indice.items()
+            if (oggi - voce['letto']).days < VALIDITA_DETTAGLI_GIORNI
         }
+        self.cache.salva_valore('dettagli_eventifvg', {'versione': self.versione, 'voci': self.indice})
 
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_info, scope)
-        client = gspread.authorize(credentials)
-
-        # Apertura del foglio Google Sheets
-        sheet = client.open("Eventi in Friuli").worksheet("EventiFvg")
-        logging.info("Foglio aperto con successo: %s", sheet.title)
-    except Exception as e:
-        logging.error(f"Errore nell'accesso a Google Sheets: {e}")
-        return
-
-    try:
-        # Verifica e cancella righe esistenti
-        num_rows = len(sheet.get_all_values())
-        if num_rows > 1:
-            sheet.delete_rows(2, num_rows)
-            logging.info("Righe cancellate con successo.")
-    except Exception as e:
-        logging.error(f"Errore nella cancellazione delle righe: {e}")
-        return
-
-    eventi_totali = []
-    url_da_scrapare = url
-    data_limite = datetime.now() + timedelta(days=7)
-
-    while url_da_scrapare:
-        logging.info(f"Scraping URL: {url_da_scrapare}")
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url_da_scrapare, headers=headers)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Errore nella richiesta dell'URL {url_da_scrapare}: {e}")
-            break
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        eventi_pagina = estrai_eventi(soup)
-
-        if not eventi_pagina:
-            logging.info("Nessun evento trovato nella pagina.")
-            break
-
-        for evento in eventi_pagina:
-            if evento['data'] and evento['data'] > data_limite:
-                logging.info(f"Data limite raggiunta: {evento['data']}")
-                url_da_scrapare = None
-                break
-
-            eventi_totali.append(evento)
-
-        if url_da_scrapare:
-            next_page_elem = soup.find('a', class_='tribe-events-c-nav__next')
-            url_da_scrapare = next_page_elem['href'] if next_page_elem and next_page_elem.has_attr('href') else None
-        time.sleep(2)
-
-    if eventi_totali:
-        # Ordina gli eventi per data
-        eventi_totali.sort(key=lambda e: e['data'] if e['data'] else datetime.max)
-
-        # Prepara i dati per la scrittura su Google Sheets
-        righe = [
-            [
-                e['titolo'],
-                f"{e['data'].day:02d} {mesi_italiani[e['data'].strftime('%b')]} {e['data'].year}" if e['data'] else "Data non disponibile",
-                e['orario'],
-                e['luogo'],
-                e['link'],
-                e['categoria']
-            ]
-            for e in eventi_totali
-        ]
+    async def arricchisci(self, eventi):
+        oggi = date.today()
+        da_scaricare = {}
+        for evento in eventi:
+            link = evento['link']
+            if not link.startswith('http'):
+                continue
+            voce = self.indice.get(link)
+            scheda = _impronta_scheda(evento)
+            if voce and voce['scheda'] == scheda and (oggi - voce['letto']).days < VALIDITA_DETTAGLI_GIORNI:
+                applica_dettaglio(evento, voce['dettaglio'])
+                metriche.incrementa('dettagli_riusati', sorgente=WORKSHEET_NAME)
+            else:
+                da_scaricare.setdefault(link, []).append((evento, scheda))
 
-        try:
-            sheet.append_rows(righe)
-            logging.info("Dati caricati su Google Sheets.")
-        except Exception as e:
-            logging.error(f"Errore durante il caricamento su Google Sheets: {e}")
-    else:
-        logging.info("Nessun evento da caricare.")
+        if not da_scaricare:
+            return
+
+        async for pagina in self.fetcher.scarica_tutte(list(da_scaricare)):
+            if not pagina.ok:
+                continue
+            try:
+                dettaglio = await self.cache.estrai_asincrono(
+                    pagina, estrai_dettaglio_pagina, versione=self.versione
+                )
+            except Exception as e:
+                logging.warning(f"Dettaglio non estratto da {pagina.url}: {e}")
+                metriche.incrementa('errori_dettagli', sorgente=WORKSHEET_NAME)
+                continue
+            for evento, scheda in da_scaricare[pagina.url]:
+                applica_dettaglio(evento, dettaglio)
+                self.indice[pagina.url] = {'scheda': scheda, 'letto': oggi, 'dettaglio': dettaglio}
+            metriche.incrementa('dettagli_scaricati', sorgente=WORKSHEET_NAME)
+
+
+def converti_eventi(eventi):
+    # Gli eventi di più giorni (data di fine letta dalla pagina di dettaglio) hanno una riga
+    # per ogni giorno fino all'orizzonte
+    return [
+        EventoPeriodo(
+            e['titolo'], e['data'], e.get('data_fine'), e['orario'], e['luogo'], e['link'], e['categoria'],
+            periodo=bool(e['data'] and e.get('data_fine') and e['data_fine'] > e['data'])
+        )
+        for e in eventi
+    ]
+
+
+# ================= SORGENTE =================
+# Elenco "lista" di The Events Calendar: il link "next" porta alla pagina successiva,
+# gli eventi oltre oggi + GIORNI_AVANTI vengono scartati e chiudono la paginazione
+SORGENTE = Sorgente(
+    WORKSHEET_NAME, url, estrai_eventi_e_successiva, formatta_data,
+    paginazione=SUCCESSIVA,
+    max_pagine=MAX_PAGINE,
+    contenitori=CONTENITORI,
+    giorni_avanti=GIORNI_AVANTI,
+    scarta_oltre_orizzonte=True,
+    max_per_host=1,
+    pausa=PAUSA,
+    converti=converti_eventi,
+    arricchimento=DettagliEventi if DETTAGLI else None
+)
+
+raccogli_eventi = SORGENTE.raccogli_eventi
+prepara_righe = SORGENTE.prepara_righe
+scrivi_righe = SORGENTE.scrivi_righe
+main = SORGENTE.main
 
 if __name__ == "__main__":
     main()
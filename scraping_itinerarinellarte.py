@@ -1,12 +1,9 @@
-import os
-import time
 import re
 import logging
-import cloudscraper
-import gspread
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-from oauth2client.service_account import ServiceAccountCredentials
+from motore_html import come_nodo, estrai_schede
+from date_italiane import formatta_data, parse_data_esatta
+from evento_compatto import EventoPeriodo
+from sorgenti import NUMERATA, Sorgente
 
 # ================= CONFIG =================
 URL_BASE = "https://www.itinerarinellarte.it"
@@ -14,157 +11,90 @@ URL_EVENTI = f"{URL_BASE}/it/mostre/friuli-venezia-giulia"
 
 GIORNI_AVANTI = 7
 MAX_PAGES = 4
+MAX_PER_HOST = 2
 SLEEP_TIME = 2
 
-SHEET_NAME = "Eventi in Friuli"
 WORKSHEET_NAME = "Itinerarinellarte"
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-MESI = {
-    1: "Gen", 2: "Feb", 3: "Mar", 4: "Apr", 5: "Mag", 6: "Giu",
-    7: "Lug", 8: "Ago", 9: "Set", 10: "Ott", 11: "Nov", 12: "Dic"
-}
-
 # ================= UTILS =================
 def parse_data(text):
     match = re.search(r"\d{2}/\d{2}/\d{4}", text)
     if not match:
         return None
-    return datetime.strptime(match.group(), "%d/%m/%Y")
+    return parse_data_esatta(match.group())
 
 # ================= SCRAPING =================
-def estrai_eventi(soup):
-    eventi = []
-    oggi = datetime.now()
-    limite = oggi + timedelta(days=GIORNI_AVANTI)
+def estrai_mostra(card):
+    # ----- titolo -----
+    titolo_elem = card.primo("h3")
+    if not titolo_elem:
+        return None
+    titolo = titolo_elem.testo_compatto()
+
+    # ----- link -----
+    link_elem = titolo_elem.antenato("a")
+    if not link_elem:
+        return None
+    link = link_elem.attr("href")
+    if link.startswith("/"):
+        link = f"{URL_BASE}{link}"
+
+    # ----- date -----
+    date_spans = card.seleziona("span.eventi-data")
+    if len(date_spans) < 2:
+        return None
 
-    cards = soup.select("div.col-date")
+    data_inizio = parse_data(date_spans[0].testo_compatto())
+    data_fine = parse_data(date_spans[1].testo_compatto())
+    if not data_inizio or not data_fine:
+        return None
+
+    # ----- luogo -----
+    luogo = "Luogo non disponibile"
+    luogo_divs = card.seleziona("div.eventi-date")
+    if len(luogo_divs) >= 2:
+        luogo = luogo_divs[1].testo_compatto()
+
+    return EventoPeriodo(titolo, data_inizio, data_fine, "Ora non disponibile", luogo, link, "Mostre")
+
+def frammento_mostra(card):
+    # Il link può stare in un antenato della card: entra anche lui nell'impronta
+    link_elem = card.antenato("a")
+    href = (link_elem.attr("href") or "") if link_elem else ""
+    return card.html() + href
+
+def estrai_eventi(soup):
+    # Una mostra = un EventoPeriodo con l'intero intervallo; la finestra di GIORNI_AVANTI
+    # si applica in prepara_righe
+    cards = come_nodo(soup).seleziona("div.col-date")
 
     logging.info(f"Eventi trovati nella pagina: {len(cards)}")
 
-    for card in cards:
-        # ----- titolo -----
-        titolo_elem = card.find("h3")
-        if not titolo_elem:
-            continue
-        titolo = titolo_elem.get_text(strip=True)
-
-        # ----- link -----
-        link_elem = titolo_elem.find_parent("a")
-        if not link_elem:
-            continue
-        link = link_elem.get("href")
-        if link.startswith("/"):
-            link = f"{URL_BASE}{link}"
-
-        # ----- date -----
-        date_spans = card.find_all("span", class_="eventi-data")
-        if len(date_spans) < 2:
-            continue
-
-        data_inizio = parse_data(date_spans[0].get_text(strip=True))
-        data_fine = parse_data(date_spans[1].get_text(strip=True))
-        if not data_inizio or not data_fine:
-            continue
-
-        data_inizio = max(data_inizio, oggi)
-        data_fine = min(data_fine, limite)
-
-        # ----- luogo -----
-        luogo = "Luogo non disponibile"
-        luogo_divs = card.find_all("div", class_="eventi-date")
-        if len(luogo_divs) >= 2:
-            luogo = luogo_divs[1].get_text(strip=True)
-
-        # ----- espandi giorni -----
-        for i in range((data_fine - data_inizio).days + 1):
-            giorno = data_inizio + timedelta(days=i)
-            eventi.append({
-                "titolo": titolo,
-                "data": f"{giorno.day:02d} {MESI[giorno.month]} {giorno.year}",
-                "data_sort": giorno,
-                "ora": "Ora non disponibile",
-                "luogo": luogo,
-                "link": link,
-                "categoria": "Mostre"
-            })
-
-    return eventi
-
-# ================= MAIN =================
-def main():
-    # ----- Google Sheets -----
-    credentials_info = {
-        "type": "service_account",
-        "project_id": "EventiFriuli",
-        "private_key_id": os.getenv("GSHEET_PRIVATE_KEY_ID"),
-        "private_key": os.getenv("GSHEET_PRIVATE_KEY").replace("\\n", "\n"),
-        "client_email": os.getenv("GSHEET_CLIENT_EMAIL"),
-        "client_id": os.getenv("GSHEET_CLIENT_ID"),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": (
-            "https://www.googleapis.com/robot/v1/metadata/x509/"
-            + os.getenv("GSHEET_CLIENT_EMAIL")
-        )
-    }
-
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive"
-    ]
-
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_info, scope)
-    client = gspread.authorize(credentials)
-    sheet = client.open(SHEET_NAME).worksheet(WORKSHEET_NAME)
-
-    logging.info("Accesso a Google Sheets riuscito")
-
-    # ----- Pulizia foglio -----
-    if sheet.row_count > 1:
-        sheet.delete_rows(2, sheet.row_count)
-
-    # ----- Scraping -----
-    scraper = cloudscraper.create_scraper()
-    eventi_totali = []
-
-    for page in range(MAX_PAGES + 1):
-        url = URL_EVENTI if page == 0 else f"{URL_EVENTI}?page={page}"
-        logging.info(f"Scraping pagina {page}")
-
-        try:
-            r = scraper.get(url, timeout=15)
-            r.raise_for_status()
-        except Exception as e:
-            logging.error(f"Errore richiesta pagina {page}: {e}")
-            continue
-
-        soup = BeautifulSoup(r.text, "html.parser")
-        eventi = estrai_eventi(soup)
-
-        if not eventi:
-            logging.info("Nessun evento trovato in questa pagina")
-            break
-
-        eventi_totali.extend(eventi)
-        time.sleep(SLEEP_TIME)
-
-    # ----- Scrittura su Google Sheets -----
-    if not eventi_totali:
-        logging.info("Nessun evento da caricare")
-        return
-
-    eventi_totali.sort(key=lambda e: e["data_sort"])
-
-    righe = [
-        [e["titolo"], e["data"], e["ora"], e["luogo"], e["link"], e["categoria"]]
-        for e in eventi_totali
-    ]
-
-    sheet.append_rows(righe)
-    logging.info(f"{len(righe)} eventi caricati su Google Sheets")
+    return estrai_schede(cards, estrai_mostra, frammento=frammento_mostra)
+
+# ================= SORGENTE =================
+# Pagine ?page=N con cloudscraper (il sito è dietro Cloudflare); le pagine in errore vengono
+# saltate e la prima pagina vuota chiude la paginazione. Nessuna restrizione ai contenitori:
+# il link dell'evento può essere un antenato della card
+SORGENTE = Sorgente(
+    WORKSHEET_NAME, URL_EVENTI, estrai_eventi, formatta_data,
+    paginazione=NUMERATA,
+    max_pagine=MAX_PAGES + 1,
+    decodifica=True,
+    giorni_avanti=GIORNI_AVANTI,
+    salta_errori=True,
+    client='cloudscraper',
+    max_per_host=MAX_PER_HOST,
+    pausa=SLEEP_TIME,
+    headers={}
+)
+
+raccogli_eventi = SORGENTE.raccogli_eventi
+prepara_righe = SORGENTE.prepara_righe
+scrivi_righe = SORGENTE.scrivi_righe
+main = SORGENTE.main
 
 # ================= START =================
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metriche
+from limitatore import leggi_retry_after
+
+# Scritture su Google Sheets di tutti gli scraper e dell'unione, da un unico pianificatore per
+# processo: le chiamate batch_update sono divise in blocchi di dimensione limitata, distribuite
+# entro la quota di scritture al minuto dell'API e ritentate una per una se falliscono.
+
+# Richieste di scrittura al minuto concesse dall'API (quota predefinita: 60 per utente)
+QUOTA_AL_MINUTO = int(os.getenv("EVENTI_SHEETS_QUOTA", "60"))
+# Celle per blocco di valori: tiene il corpo di ogni richiesta ben sotto il limite dell'API
+CELLE_PER_BLOCCO = int(os.getenv("EVENTI_SHEETS_CELLE_BLOCCO", "10000"))
+# Inserimenti/eliminazioni di righe per blocco
+OPERAZIONI_PER_BLOCCO = 500
+# Blocchi di valori inviati in contemporanea (intervalli disgiunti: l'ordine non conta)
+PARALLELISMO = int(os.getenv("EVENTI_SHEETS_PARALLELISMO", "3"))
+TENTATIVI = 5
+BACKOFF = 2.0
+STATUS_RIPETIBILI = {429, 500, 502, 503, 504}
+
+
+def _status(errore):
+    return getattr(getattr(errore, 'response', None), 'status_code', None)
+
+
+def errore_ripetibile(errore):
+    return _status(errore) in STATUS_RIPETIBILI or isinstance(errore, (requests.ConnectionError, requests.Timeout))
+
+
+def dividi_valori(dati, celle_per_blocco=CELLE_PER_BLOCCO):
+    # Raggruppa gli intervalli di una batch_update in blocchi di al massimo `celle_per_blocco` celle
+    # (un intervallo più grande del limite resta intero, in un blocco da solo)
+    blocco, celle = [], 0
+    for intervallo in dati:
+        n = sum(len(riga) for riga in intervallo['values'])
+        if blocco and celle + n > celle_per_blocco:
+            yield blocco
+            blocco, celle = [], 0
+        blocco.append(intervallo)
+        celle += n
+    if blocco:
+        yield blocco
+
+
+class PianificatoreScritture:
+    def __init__(self, quota=QUOTA_AL_MINUTO, celle_per_blocco=CELLE_PER_BLOCCO,
+                 parallelismo=PARALLELISMO, tentativi=TENTATIVI):
+        self.quota = quota
+        self.celle_per_blocco = celle_per_blocco
+        self.parallelismo = parallelismo
+        self.tentativi = tentativi
+        # Istanti delle chiamate dell'ultimo minuto (finestra scorrevole)
+        self._chiamate = deque()
+        self._lock = threading.Lock()
+
+    def _attendi_quota(self, tab):
+        while True:
+            with self._lock:
+                adesso = time.monotonic()
+                while self._chiamate and self._chiamate[0] <= adesso - 60:
+                    self._chiamate.popleft()
+                if len(self._chiamate) < self.quota:
+                    self._chiamate.append(adesso)
+                    return
+                attesa = self._chiamate[0] + 60 - adesso
+            metriche.osserva('attesa_quota_sheets', attesa, tab=tab)
+            time.sleep(attesa)
+
+    def _esegui(self, tab, chiamata):
+        # Una chiamata all'API entro la quota; gli errori temporanei (quota superata, 5xx, rete)
+        # vengono ritentati con backoff esponenziale o dopo il Retry-After indicato dal server
+        for tentativo in range(self.tentativi):
+            self._attendi_quota(tab)
+            try:
+                with metriche.span('scrittura_sheets', tab=tab):
+                    return chiamata()
+            except Exception as errore:
+                if not errore_ripetibile(errore) or tentativo == self.tentativi - 1:
+                    metriche.incrementa('errori_sheets', tab=tab)
+                    raise
+                risposta = getattr(errore, 'response', None)
+                retry_after = leggi_retry_after(risposta.headers) if risposta is not None else None
+                attesa = retry_after or BACKOFF * 2 ** tentativo * random.uniform(0.5, 1.5)
+                metriche.incrementa('tentativi_sheets', tab=tab, status=_status(errore) or 'rete')
+                logging.warning(f"Scrittura su '{tab}' fallita ({errore}), nuovo tentativo tra {attesa:.1f}s")
+                time.sleep(attesa)
+
+    def struttura(self, sheet, richieste):
+        # Inserimenti ed eliminazioni di righe, in blocchi applicati in sequenza nell'ordine dato
+        # (dal basso verso l'alto, così ogni blocco trova gli indici che si aspetta).
+        # Restituisce il numero di chiamate all'API
+        blocchi = [richieste[i:i + OPERAZIONI_PER_BLOCCO] for i in range(0, len(richieste), OPERAZIONI_PER_BLOCCO)]
+        for blocco in blocchi:
+            self._esegui(sheet.title, lambda: sheet.spreadsheet.batch_update({'requests': blocco}))
+        return len(blocchi)
+
+    def valori(self, sheet, dati, value_input_option='RAW'):
+        # Valori di intervalli disgiunti, in blocchi inviati in parallelo. Un blocco che fallisce
+        # anche dopo i tentativi non ferma gli altri; l'errore viene sollevato alla fine.
+        # Restituisce il numero di chiamate all'API
+        blocchi = list(dividi_valori(dati, self.celle_per_blocco))
+        if not blocchi:
+            return 0
+
+        def scrivi(blocco):
+            self._esegui(sheet.title, lambda: sheet.batch_update(blocco, value_input_option=value_input_option))
+
+        with ThreadPoolExecutor(max_workers=min(self.parallelismo, len(blocchi))) as pool:
+            futures = [pool.submit(scrivi, blocco) for blocco in blocchi]
+        errori = [f.exception() for f in futures if f.exception()]
+        if errori:
+            logging.error(f"'{sheet.title}': {len(errori)} blocchi su {len(blocchi)} non scritti")
+            raise errori[0]
+        return len(blocchi)
+
+
+_pianificatore = None
+_lock_pianificatore = threading.Lock()
+
+
+def pianificatore():
+    # Il pianificatore condiviso da tutte le scritture del processo (e quindi dalla stessa quota)
+    global _pianificatore
+    with _lock_pianificatore:
+        if _pianificatore is None:
+            _pianificatore = PianificatoreScritture()
+        return _pianificatore
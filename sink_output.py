@@ -0,0 +1,183 @@
+import csv
+import logging
+import os
+import sqlite3
+import time
+
+import metriche
+
+# Destinazione dei dati: "sheets" (Google Sheets), "sqlite" o "csv"
+SINK = os.getenv("EVENTI_SINK", "sheets")
+# Destinazione del tab unito; se vuota coincide con EVENTI_SINK.
+# Es. EVENTI_SINK=sqlite EVENTI_SINK_PUBBLICAZIONE=sheets: tutto in locale, solo l'unione va su Google Sheets
+SINK_PUBBLICAZIONE = os.getenv("EVENTI_SINK_PUBBLICAZIONE", "")
+
+PERCORSO_SQLITE = os.getenv("EVENTI_SQLITE", "eventi.sqlite")
+CARTELLA_CSV = os.getenv("EVENTI_CSV_DIR", "output_csv")
+
+# Intestazione dei tab delle sorgenti (le righe degli scraper seguono quest'ordine)
+INTESTAZIONE = ['Titolo', 'Data', 'Ora', 'Luogo', 'Link', 'Categoria']
+# Nome del tab unito nei backend locali (su Google Sheets è il primo foglio)
+TAB_UNIONE = "Unione"
+
+
+def _colonne_chiave(intestazione):
+    if 'Link' in intestazione and 'Data' in intestazione:
+        return intestazione.index('Link'), intestazione.index('Data')
+    return None
+
+
+class SinkGoogleSheets:
+    nome = 'sheets'
+
+    def __init__(self, spreadsheet=None):
+        from google_sheets import apri_foglio
+        self.spreadsheet = spreadsheet or apri_foglio()
+
+    def scrivi(self, tab, righe):
+        from sync_fogli import sincronizza_foglio
+        # La riga 1 (intestazione) del tab resta invariata
+        sincronizza_foglio(self.spreadsheet.worksheet(tab), righe)
+
+    def sorgenti(self):
+        # Tutti i tab tranne il primo, che contiene l'unione: (nome, intestazione, record)
+        for sheet in self.spreadsheet.worksheets()[1:]:
+            record = sheet.get_all_records()
+            metriche.incrementa('chiamate_api_sheets', tab=sheet.title)
+            intestazione = list(record[0].keys()) if record else sheet.row_values(1)
+            yield sheet.title, intestazione, record
+
+    def leggi_sorgenti(self):
+        return [r for _, _, record in self.sorgenti() for r in record]
+
+    def scrivi_unione(self, intestazione, righe):
+        from sync_fogli import sincronizza_foglio
+        sincronizza_foglio(
+            self.spreadsheet.worksheets()[0],
+            [intestazione] + list(righe),
+            colonne_chiave=_colonne_chiave(intestazione),
+            riga_iniziale=1
+        )
+
+
+class SinkSqlite:
+    nome = 'sqlite'
+
+    def __init__(self, percorso=PERCORSO_SQLITE):
+        self.percorso = percorso
+        self.conn = sqlite3.connect(percorso, check_same_thread=False)
+        # Con il journal WAL le sorgenti si possono leggere in streaming (da una seconda connessione)
+        # mentre il tab unito viene riscritto
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+    @staticmethod
+    def _nome(identificatore):
+        return '"' + identificatore.replace('"', '""') + '"'
+
+    def _sostituisci(self, tab, intestazione, righe):
+        colonne = ', '.join(f"{self._nome(c)} TEXT" for c in intestazione)
+        segnaposto = ', '.join('?' for _ in intestazione)
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {self._nome(tab)}")
+            self.conn.execute(f"CREATE TABLE {self._nome(tab)} ({colonne})")
+            self.conn.executemany(
+                f"INSERT INTO {self._nome(tab)} VALUES ({segnaposto})",
+                ([None if v is None else str(v) for v in r] for r in righe)
+            )
+
+    def scrivi(self, tab, righe):
+        self._sostituisci(tab, INTESTAZIONE, righe)
+
+    def _record(self, tab, colonne):
+        # I record di un tab, letti un record alla volta da una connessione propria: viene aperta
+        # alla prima lettura e chiusa quando i record finiscono o la lettura viene interrotta
+        lettura = self.conn if self.percorso == ':memory:' else sqlite3.connect(self.percorso, check_same_thread=False)
+        try:
+            for r in lettura.execute(f"SELECT * FROM {self._nome(tab)}"):
+                yield dict(zip(colonne, r))
+        finally:
+            if lettura is not self.conn:
+                lettura.close()
+
+    def sorgenti(self):
+        tabelle = [
+            r[0] for r in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name != ? ORDER BY name", (TAB_UNIONE,)
+            )
+        ]
+        for tab in tabelle:
+            colonne = [r[1] for r in self.conn.execute(f"PRAGMA table_info({self._nome(tab)})")]
+            yield tab, colonne, self._record(tab, colonne)
+
+    def leggi_sorgenti(self):
+        return [r for _, _, record in self.sorgenti() for r in record]
+
+    def scrivi_unione(self, intestazione, righe):
+        self._sostituisci(TAB_UNIONE, intestazione, righe)
+
+
+class SinkCsv:
+    nome = 'csv'
+
+    def __init__(self, cartella=CARTELLA_CSV):
+        self.cartella = cartella
+        os.makedirs(cartella, exist_ok=True)
+
+    def _percorso(self, tab):
+        return os.path.join(self.cartella, f"{tab}.csv")
+
+    def _sostituisci(self, tab, intestazione, righe):
+        temporaneo = self._percorso(tab) + '.tmp'
+        with open(temporaneo, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(intestazione)
+            writer.writerows(righe)
+        os.replace(temporaneo, self._percorso(tab))
+
+    def scrivi(self, tab, righe):
+        self._sostituisci(tab, INTESTAZIONE, righe)
+
+    def _leggi_csv(self, percorso):
+        with open(percorso, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+    def sorgenti(self):
+        for nome_file in sorted(os.listdir(self.cartella)):
+            if not nome_file.endswith('.csv') or nome_file == f"{TAB_UNIONE}.csv":
+                continue
+            percorso = os.path.join(self.cartella, nome_file)
+            with open(percorso, newline='', encoding='utf-8') as f:
+                intestazione = next(csv.reader(f), [])
+            yield nome_file[:-4], intestazione, self._leggi_csv(percorso)
+
+    def leggi_sorgenti(self):
+        return [r for _, _, record in self.sorgenti() for r in record]
+
+    def scrivi_unione(self, intestazione, righe):
+        self._sostituisci(TAB_UNIONE, intestazione, righe)
+
+
+SINKS = {'sheets': SinkGoogleSheets, 'sqlite': SinkSqlite, 'csv': SinkCsv}
+
+
+def crea_sink(nome=None, **opzioni):
+    nome = nome or SINK
+    if nome not in SINKS:
+        raise ValueError(f"Sink sconosciuto: {nome} (valori ammessi: {', '.join(SINKS)})")
+    return SINKS[nome](**opzioni)
+
+
+def crea_sink_pubblicazione(sink):
+    # Sink su cui scrivere il tab unito: quello indicato da EVENTI_SINK_PUBBLICAZIONE o lo stesso delle sorgenti
+    if not SINK_PUBBLICAZIONE or SINK_PUBBLICAZIONE == sink.nome:
+        return sink
+    return crea_sink(SINK_PUBBLICAZIONE)
+
+
+def scrivi_con_tempi(sink, tab, righe):
+    inizio = time.perf_counter()
+    sink.scrivi(tab, righe)
+    durata = time.perf_counter() - inizio
+    metriche.osserva('scrittura_sink', durata, sink=sink.nome, tab=tab)
+    metriche.incrementa('righe_scritte', len(righe), sink=sink.nome, tab=tab)
+    logging.info(f"Sink {sink.nome}: {len(righe)} righe scritte in '{tab}' in {durata:.2f}s")
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import tempfile
+from datetime import date, timedelta
+from functools import partial
+from urllib.parse import urlsplit
+
+import metriche
+import runtime_http
+from cache_http import CacheHttp
+from evento_compatto import espandi
+from fetch_pagine import FetcherAsincrono, estrai_pagine_numerate
+from motore_html import estrai_html_asincrono, versione_estrattore
+from paginazione import Paginazione, data_inizio
+from registro_pagine import FetcherRegistrato, registrazione_corrente
+from sink_output import crea_sink, scrivi_con_tempi
+
+# Strategie di paginazione
+NUMERATA = 'numerata'      # pagine url, url?page=1, ... scaricate in parallelo
+SUCCESSIVA = 'successiva'  # ogni pagina indica la successiva: richieste in sequenza
+
+
+class Sorgente:
+    # Un sito di eventi descritto in modo dichiarativo: URL di partenza, strategia di paginazione,
+    # estrattore e formato delle date del tab. Fetch (sessione HTTP condivisa, cache, pause),
+    # paginazione, finestra dei giorni e scrittura sono comuni a tutte le sorgenti.
+    #   estrai(radice) -> eventi (NUMERATA) oppure (eventi, url_successivo) (SUCCESSIVA);
+    #     gli eventi sono EventoPeriodo, o qualsiasi cosa che converti() trasformi in EventoPeriodo.
+    #     Viene eseguita nel pool di processi del parsing: deve essere una funzione di modulo
+    #   chiave_cache(oggi) -> valore da cui dipende l'estrazione oltre al contenuto (es. l'anno corrente)
+    #   arricchimento(cache, crea_fetcher) -> oggetto con pagina(eventi), chiamato per ogni pagina
+    #     dell'elenco, e chiudi(), coroutine attesa a fine raccolta (es. le pagine di dettaglio di
+    #     eventifvg); crea_fetcher(**opzioni) restituisce un fetcher per le sue richieste
+    def __init__(self, nome, url, estrai, formatta, paginazione=NUMERATA, max_pagine=20,
+                 url_pagina='{url}?page={pagina}', contenitori=None, decodifica=False,
+                 giorni_avanti=7, scarta_oltre_orizzonte=False, salta_errori=False,
+                 client='requests', max_per_host=3, pausa=1.0, headers=None,
+                 chiave_cache=None, converti=None, arricchimento=None, **opzioni_richiesta):
+        self.nome = nome
+        self.url = url
+        self.estrai = estrai
+        self.formatta = formatta
+        self.paginazione = paginazione
+        self.max_pagine = max_pagine
+        self.url_pagina = url_pagina
+        self.contenitori = contenitori
+        self.decodifica = decodifica
+        self.giorni_avanti = giorni_avanti
+        self.scarta_oltre_orizzonte = scarta_oltre_orizzonte
+        self.salta_errori = salta_errori
+        self.client = client
+        self.max_per_host = max_per_host
+        self.pausa = pausa
+        self.headers = headers
+        self.chiave_cache = chiave_cache
+        self.converti = converti
+        self.arricchimento = arricchimento
+        self.opzioni_richiesta = opzioni_richiesta
+
+    def __repr__(self):
+        return f"Sorgente({self.nome!r}, {self.url!r}, {self.paginazione})"
+
+    # ----- estrazione -----
+    # `oggi` è la data di riferimento di estrazione, finestra e paginazione: None per la data
+    # odierna, il giorno della registrazione nel replay
+    async def estrai_pagina(self, pagina, cartella_schede=None, oggi=None):
+        # cartella_schede: la cartella della cache HTTP in uso, per la cache delle card
+        contenuto = pagina.testo if self.decodifica else pagina.contenuto
+        return await estrai_html_asincrono(contenuto, self.estrai, self.contenitori, cartella_schede, oggi)
+
+    def orizzonte(self, oggi=None):
+        return (oggi or date.today()) + timedelta(days=self.giorni_avanti)
+
+    def righe_eventi(self, eventi, oggi=None):
+        # Righe del tab ordinate per data (senza data in fondo); gli eventi di più giorni
+        # hanno una riga per ogni giorno tra oggi e l'orizzonte
+        oggi = oggi or date.today()
+        eventi = self.converti(eventi) if self.converti else eventi
+        return espandi(eventi, self.formatta, oggi, self.orizzonte(oggi))
+
+    def urls(self):
+        return [self.url if n == 0 else self.url_pagina.format(url=self.url, pagina=n) for n in range(self.max_pagine)]
+
+    # ----- raccolta -----
+    async def scarica_eventi(self, incrementale=None, checkpoint=None, replay=None):
+        # checkpoint (checkpoint.CheckpointSorgente): le pagine già estratte in un'esecuzione
+        # interrotta non vengono richieste, quelle nuove vengono salvate appena estratte.
+        # replay (registro_pagine.RegistroPagine): le pagine arrivano da una registrazione, senza
+        # rete, e la cache è temporanea perché le estrazioni vanno rifatte tutte; le pagine si
+        # leggono rispetto al giorno della registrazione
+        if replay:
+            def crea_fetcher_replay(**opzioni):
+                return FetcherRegistrato(replay, self.nome)
+
+            with tempfile.TemporaryDirectory() as cartella:
+                return await self._scarica(CacheHttp(cartella), crea_fetcher_replay, incrementale, checkpoint,
+                                           replay.data)
+
+        cache = CacheHttp()
+        registrazione = registrazione_corrente()
+
+        def crea_fetcher(**opzioni):
+            registro = registrazione.sorgente(self.nome) if registrazione else None
+            return FetcherAsincrono(cache=cache, registro=registro, **opzioni)
+
+        return await self._scarica(cache, crea_fetcher, incrementale, checkpoint)
+
+    async def _scarica(self, cache, crea_fetcher, incrementale, checkpoint, oggi=None):
+        fetcher = crea_fetcher(
+            client=runtime_http.sessione(self.client),
+            max_per_host=self.max_per_host,
+            pausa=self.pausa,
+            headers=self.headers,
+            **self.opzioni_richiesta
+        )
+        chiave = self.chiave_cache(oggi or date.today()) if self.chiave_cache else None
+        versione = versione_estrattore(self.estrai)
+        arricchimento = self.arricchimento(cache, crea_fetcher) if self.arricchimento else None
+
+        async def estrai(pagina):
+            # Il parsing avviene nel pool di processi mentre il fetch delle altre pagine prosegue
+            # Anche le card si leggono e si salvano nella cartella di `cache`: nel replay è quella
+            # temporanea e la cache delle esecuzioni giornaliere resta intatta
+            risultato = await cache.estrai_asincrono(
+                pagina, lambda p: self.estrai_pagina(p, cache.cartella, oggi), chiave, versione
+            )
+            if checkpoint:
+                checkpoint.salva_pagina(pagina.url, risultato)
+            if arricchimento and self.paginazione == NUMERATA and risultato:
+                arricchimento.pagina(risultato)
+            return risultato
+
+        # Ci si ferma alla prima pagina che inizia oltre l'orizzonte o, con una raccolta
+        # incrementale, dopo una serie di eventi già in archivio
+        paginazione = Paginazione(self.nome, self.orizzonte(oggi), incrementale, partial(self.righe_eventi, oggi=oggi))
+        if self.paginazione == SUCCESSIVA:
+            eventi = await self._segui_successive(fetcher, estrai, paginazione, arricchimento, checkpoint, oggi)
+        else:
+            urls = self.urls()
+            salvate = {}
+            if checkpoint:
+                for indice, url in enumerate(urls):
+                    risultato = checkpoint.pagina(url)
+                    if risultato is not None:
+                        salvate[indice] = risultato
+                        if arricchimento and risultato:
+                            arricchimento.pagina(risultato)
+                if salvate:
+                    logging.info(f"{self.nome}: {len(salvate)} pagine riprese dal checkpoint")
+            logging.info(f"{self.nome}: scraping di {len(urls) - len(salvate)} pagine...")
+            eventi = await estrai_pagine_numerate(
+                fetcher, urls, estrai, salta_errori=self.salta_errori, paginazione=paginazione, salvate=salvate
+            )
+
+        if arricchimento:
+            await arricchimento.chiudi()
+        if fetcher.errori:
+            # Con salta_errori le pagine mancanti vengono saltate, altrimenti chiudono la paginazione:
+            # in entrambi i casi la raccolta è incompleta e va ripresa
+            logging.warning(f"{self.nome}: {fetcher.errori} pagine non scaricate, raccolta incompleta")
+            if checkpoint:
+                checkpoint.pagine_in_errore += fetcher.errori
+        return eventi
+
+    async def _segui_successive(self, fetcher, estrai, paginazione, arricchimento, checkpoint=None, oggi=None):
+        # La pagina successiva si conosce solo dopo aver letto quella corrente: il fetcher
+        # gestisce la pausa tra una richiesta e l'altra, l'arricchimento prosegue in parallelo
+        eventi_totali = []
+        url = self.url
+        orizzonte = self.orizzonte(oggi)
+        richieste = 0
+        while url and richieste < self.max_pagine:
+            salvata = checkpoint.pagina(url) if checkpoint else None
+            if salvata is not None:
+                logging.info(f"Pagina ripresa dal checkpoint: {url}")
+                eventi_pagina, url_successivo = salvata
+            else:
+                logging.info(f"Scraping URL: {url}")
+                pagina = await fetcher.scarica(url)
+                metriche.incrementa('pagine', host=urlsplit(url).netloc)
+                if not pagina.ok:
+                    break
+                eventi_pagina, url_successivo = await estrai(pagina)
+            richieste += 1
+            if not eventi_pagina:
+                logging.info("Nessun evento trovato nella pagina.")
+                break
+
+            nuovi = eventi_pagina
+            if self.scarta_oltre_orizzonte:
+                # L'elenco è ordinato per data: dal primo evento oltre l'orizzonte in poi non serve nulla
+                oltre = [i for i, e in enumerate(eventi_pagina) if (data_inizio(e) or orizzonte) > orizzonte]
+                if oltre:
+                    logging.info(f"Data limite raggiunta: {data_inizio(eventi_pagina[oltre[0]])}")
+                    nuovi = eventi_pagina[:oltre[0]]
+                    url_successivo = None
+            eventi_totali.extend(nuovi)
+
+            if arricchimento and nuovi:
+                arricchimento.pagina(nuovi)
+            if url_successivo and paginazione.ferma(nuovi):
+                url_successivo = None
+            url = url_successivo
+        return eventi_totali
+
+    def raccogli_eventi(self, incrementale=None, checkpoint=None, replay=None):
+        with metriche.span('raccolta', sorgente=self.nome):
+            eventi = asyncio.run(self.scarica_eventi(incrementale, checkpoint, replay))
+        metriche.incrementa('eventi_estratti', len(eventi), sorgente=self.nome)
+        return eventi
+
+    def prepara_righe(self, eventi, oggi=None):
+        with metriche.span('trasformazione', sorgente=self.nome):
+            return list(self.righe_eventi(eventi, oggi))
+
+    # ----- scrittura -----
+    def scrivi_righe(self, sink, righe):
+        # Su Google Sheets vengono scritte solo le differenze rispetto al contenuto attuale
+        scrivi_con_tempi(sink, self.nome, righe)
+
+    def main(self, sink=None):
+        # Esecuzione di una sola sorgente: destinazione scelta con EVENTI_SINK
+        try:
+            sink = sink or crea_sink()
+            logging.info(f"Destinazione aperta con successo: {sink.nome}")
+            self.scrivi_righe(sink, self.prepara_righe(self.raccogli_eventi()))
+        except Exception as e:
+            logging.error(f"Errore nella sorgente {self.nome}: {e}")
+        metriche.scrivi_report(self.nome.lower())
@@ -0,0 +1,123 @@
+import logging
+from difflib import SequenceMatcher
+
+from gspread.utils import rowcol_to_a1
+
+import metriche
+from scritture_sheets import pianificatore
+
+# Colonne delle righe scritte dagli scraper: Titolo, Data, Ora, Luogo, Link, Categoria
+COLONNE_CHIAVE_SCRAPER = (4, 1)  # link + data
+
+
+def _cella(valore):
+    return '' if valore is None else str(valore)
+
+
+def _chiave(riga, colonne_chiave):
+    if colonne_chiave is None:
+        return tuple(riga)
+    return tuple(riga[c] if c < len(riga) else '' for c in colonne_chiave)
+
+
+def calcola_differenze(attuali, nuove, colonne_chiave=COLONNE_CHIAVE_SCRAPER):
+    # Confronta le righe presenti nel foglio con quelle da scrivere (entrambe senza intestazione).
+    # Le righe vengono allineate per chiave (link + data) con un diff di sequenza, così un evento
+    # inserito in mezzo non sposta tutte le righe successive.
+    # Restituisce:
+    #   strutturali: lista di (operazione, indice, quantità) sulle righe attuali, dal basso verso l'alto
+    #   celle: lista di (indice_riga_finale, colonna_iniziale, valori) da scrivere dopo le modifiche strutturali
+    larghezza = max([len(r) for r in attuali] + [len(r) for r in nuove] + [0])
+    attuali = [[_cella(v) for v in r] + [''] * (larghezza - len(r)) for r in attuali]
+    nuove = [[_cella(v) for v in r] + [''] * (larghezza - len(r)) for r in nuove]
+
+    matcher = SequenceMatcher(
+        None,
+        [_chiave(r, colonne_chiave) for r in attuali],
+        [_chiave(r, colonne_chiave) for r in nuove],
+        autojunk=False
+    )
+
+    strutturali = []
+    celle = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            # Stessa chiave: si aggiornano solo le celle cambiate, raggruppate in tratti contigui
+            for k in range(i2 - i1):
+                vecchia, nuova = attuali[i1 + k], nuove[j1 + k]
+                col = 0
+                while col < larghezza:
+                    if vecchia[col] == nuova[col]:
+                        col += 1
+                        continue
+                    inizio = col
+                    while col < larghezza and vecchia[col] != nuova[col]:
+                        col += 1
+                    celle.append((j1 + k, inizio, nuova[inizio:col]))
+            continue
+
+        if tag in ('delete', 'replace'):
+            strutturali.append(('elimina', i1, i2 - i1))
+        if tag in ('insert', 'replace'):
+            strutturali.append(('inserisci', i1, j2 - j1))
+            celle.extend((j, 0, nuove[j]) for j in range(j1, j2))
+
+    # Applicate dal basso le operazioni non spostano gli indici di quelle ancora da fare;
+    # a parità di posizione l'eliminazione (replace) precede l'inserimento
+    strutturali.sort(key=lambda op: (op[1], op[0] == 'elimina'), reverse=True)
+    return strutturali, celle
+
+
+def sincronizza_foglio(sheet, righe, colonne_chiave=COLONNE_CHIAVE_SCRAPER, riga_iniziale=2):
+    # Porta il contenuto del foglio (dalla riga `riga_iniziale` in giù) a coincidere con `righe`
+    # con due batch_update: una per inserire/eliminare righe, una per i valori. Il pianificatore
+    # condiviso le divide in blocchi se sono grandi e le distribuisce entro la quota dell'API.
+    attuali = sheet.get_all_values()[riga_iniziale - 1:]
+    strutturali, celle = calcola_differenze(attuali, righe, colonne_chiave)
+
+    statistiche = {
+        'righe_attuali': len(attuali),
+        'righe_nuove': len(righe),
+        'inserite': sum(n for op, _, n in strutturali if op == 'inserisci'),
+        'eliminate': sum(n for op, _, n in strutturali if op == 'elimina'),
+        'celle_scritte': sum(len(valori) for _, _, valori in celle),
+        'chiamate_api': 1
+    }
+
+    if strutturali:
+        base = riga_iniziale - 1  # indici 0-based dell'API
+        richieste = []
+        for operazione, indice, quantita in strutturali:
+            intervallo = {
+                'sheetId': sheet.id,
+                'dimension': 'ROWS',
+                'startIndex': base + indice,
+                'endIndex': base + indice + quantita
+            }
+            if operazione == 'elimina':
+                richieste.append({'deleteDimension': {'range': intervallo}})
+            else:
+                # Il formato viene dalla riga di dati precedente; subito sotto l'intestazione
+                # da quella successiva, altrimenti le righe nuove prenderebbero quello dell'intestazione
+                richieste.append({'insertDimension': {'range': intervallo, 'inheritFromBefore': indice > 0}})
+        statistiche['chiamate_api'] += pianificatore().struttura(sheet, richieste)
+
+    if celle:
+        dati = [
+            {
+                'range': f"{rowcol_to_a1(riga_iniziale + riga, colonna + 1)}:"
+                         f"{rowcol_to_a1(riga_iniziale + riga, colonna + len(valori))}",
+                'values': [valori]
+            }
+            for riga, colonna, valori in celle
+        ]
+        statistiche['chiamate_api'] += pianificatore().valori(sheet, dati)
+
+    metriche.incrementa('chiamate_api_sheets', statistiche['chiamate_api'], tab=sheet.title)
+    metriche.incrementa('celle_scritte_sheets', statistiche['celle_scritte'], tab=sheet.title)
+    logging.info(
+        f"Sincronizzazione '{sheet.title}': {statistiche['inserite']} righe inserite, "
+        f"{statistiche['eliminate']} eliminate, {statistiche['celle_scritte']} celle scritte "
+        f"({statistiche['chiamate_api']} chiamate API)"
+    )
+    return statistiche
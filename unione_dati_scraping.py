@@ -1,8 +1,25 @@
+import heapq
+import json
 import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
+import metriche
 from datetime import datetime
+from date_italiane import MESI, MESI_ABBR_ITA, formatta_data, parse_giorno_mese_anno
+from archivio_eventi import PERCORSO_ARCHIVIO, ArchivioEventi
+from sink_output import crea_sink, crea_sink_pubblicazione
+
+# "dataframe": tutte le sorgenti in un DataFrame, ordinato e deduplicato in memoria.
+# "streaming": fusione a k vie delle sorgenti (già ordinate per data dagli scraper), con memoria
+# limitata alla finestra di riordino e agli eventi di un singolo giorno
+MODALITA_UNIONE = os.getenv("EVENTI_MODALITA_UNIONE", "dataframe")
+# Quanti record fuori ordine può contenere una sorgente prima che l'ordine non sia più garantito
+FINESTRA_RIORDINO = int(os.getenv("EVENTI_FINESTRA_RIORDINO", "1000"))
+# Oltre ai duplicati esatti (stesso titolo e data) rimuove anche quelli con titolo simile nello
+# stesso giorno e luogo (vedi dedup_fuzzy); il report dei cluster uniti va opzionalmente in un file JSON
+DUPLICATI_SIMILI = os.getenv("EVENTI_DEDUP_FUZZY", "") not in ("", "0", "false")
+REPORT_DUPLICATI = os.getenv("EVENTI_DEDUP_REPORT", "")
+
+# pandas (modalità "dataframe") e dedup_fuzzy con numpy (EVENTI_DEDUP_FUZZY) vengono importati solo
+# dalle funzioni che li usano: la modalità "streaming" e chi importa solo le utilità non li caricano
 
 # Mappa dei mesi completi e abbreviati in italiano
 mesi_italiani = {
@@ -24,6 +41,12 @@ mesi_italiani_abbr = {
     "lug": "Jul", "ago": "Aug", "set": "Sep", "ott": "Oct", "nov": "Nov", "dic": "Dec"
 }
 
+# Numero del mese per ogni forma accettata da converti_data: nomi italiani, abbreviazioni
+# italiane e inglesi, numeri ("8", "08")
+mesi_numerici = dict(MESI)
+mesi_numerici.update({str(m): m for m in range(1, 13)})
+mesi_numerici.update({f"{m:02d}": m for m in range(1, 13)})
+
 def traduci_mese_in_italiano(data_str):
     for mese_eng, mese_ita in mesi_abbreviati_ita.items():
         data_str = data_str.replace(mese_eng, mese_ita)
@@ -40,6 +63,19 @@ def italiano_to_inglese_abbr(data_str):
     return data_str
 
 def converti_data(data_str):
+    # Come _converti_data, con pd.NaT per le date non valide
+    data = _converti_data(data_str)
+    if data is None:
+        import pandas as pd
+        return pd.NaT
+    return data
+
+def _converti_data(data_str):
+    # Percorso veloce e memoizzato per i formati "03 08 2025", "03 Ago 2025", "03 Aug 2025"
+    data = parse_giorno_mese_anno(data_str)
+    if data is not None:
+        return data
+
     try:
         # Prova formato numerico (es. "03 08 2025")
         data_str_numerica = traduci_data(data_str)
@@ -54,47 +90,177 @@ def converti_data(data_str):
 
     except ValueError:
         print(f"⚠️ Data non valida: {data_str}")
-        return pd.NaT
+        return None
+
+def normalizza_date(serie):
+    # Versione vettoriale di serie.apply(converti_data): i formati "GG mese AAAA" vengono
+    # scomposti con una regex e ricostruiti con una tabella dei mesi; solo le stringhe rimaste
+    # passano da converti_data, una volta per ogni valore distinto
+    import pandas as pd
+    parti = serie.str.strip().str.lower().str.extract(r'^(\d{1,2})\s+([a-z]+|\d{1,2})\s+(\d{4})$')
+    componenti = pd.DataFrame({
+        'year': pd.to_numeric(parti[2]),
+        'month': parti[1].map(mesi_numerici),
+        'day': pd.to_numeric(parti[0])
+    })
+    date = pd.to_datetime(componenti, errors='coerce')
+
+    mancanti = date.isna()
+    if mancanti.any():
+        cache = {testo: converti_data(testo) for testo in serie[mancanti].unique()}
+        date = date.where(~mancanti, pd.to_datetime(serie[mancanti].map(cache)))
+    return date
+
+def formatta_date(serie_date):
+    # Equivalente vettoriale di strftime('%d %b %Y') seguito da traduci_mese_in_italiano
+    return (
+        serie_date.dt.day.astype(str).str.zfill(2) + ' '
+        + serie_date.dt.month.map(MESI_ABBR_ITA) + ' '
+        + serie_date.dt.year.astype(str)
+    )
+
+def stampa_report_duplicati(cluster):
+    from dedup_fuzzy import righe_report
+    print(f"⚠️ Duplicati simili rimossi: {sum(len(c['duplicati']) for c in cluster)} in {len(cluster)} cluster")
+    for riga in righe_report(cluster):
+        print(f"   {riga}")
+    if REPORT_DUPLICATI:
+        with open(REPORT_DUPLICATI, 'w', encoding='utf-8') as f:
+            json.dump(cluster, f, ensure_ascii=False, indent=2)
+
+def rimuovi_duplicati_simili(df):
+    # Tiene il primo evento di ogni cluster di titoli simili (il DataFrame è già ordinato per data)
+    from dedup_fuzzy import IndiceDuplicati
+    indice = IndiceDuplicati()
+    luoghi = df['Luogo'] if 'Luogo' in df.columns else [''] * len(df)
+    tieni = [
+        indice.aggiungi(titolo, data, luogo) == i
+        for i, (titolo, data, luogo) in enumerate(zip(df['Titolo'], df['Data'], luoghi))
+    ]
+    stampa_report_duplicati(indice.report())
+    return df[tieni]
+
+def flusso_ordinato(nome, record, oggi, finestra=FINESTRA_RIORDINO):
+    # Record di una sorgente -> (data, record) in ordine di data, senza le date passate.
+    # Un piccolo heap riordina i record fuori posto entro `finestra` posizioni
+    heap = []
+    ultima = None
+    for progressivo, r in enumerate(record):
+        data = _converti_data(str(r.get('Data', '')))
+        if data is None:
+            continue
+        if data < oggi:
+            continue
+        heapq.heappush(heap, (data, progressivo, r))
+        if len(heap) > finestra:
+            data, _, r = heapq.heappop(heap)
+            if ultima is not None and data < ultima:
+                print(f"⚠️ Sorgente '{nome}' non ordinata oltre la finestra di riordino: {r.get('Titolo')} ({r.get('Data')})")
+            ultima = data
+            yield data, r
+    while heap:
+        data, _, r = heapq.heappop(heap)
+        yield data, r
 
-def unisci_e_ordina_eventi():
+def unisci_in_streaming(sorgenti, oggi, duplicati_simili=False):
+    # Fusione a k vie dei flussi ordinati; i duplicati (stesso titolo nello stesso giorno) si
+    # riconoscono tenendo in memoria solo i titoli del giorno corrente (e, con duplicati_simili,
+    # l'indice dei titoli simili dello stesso giorno).
+    # Restituisce l'intestazione (unione delle colonne delle sorgenti) e un generatore di righe
+    intestazione = []
+    flussi = []
+    for nome, colonne, record in sorgenti:
+        intestazione.extend(c for c in colonne if c not in intestazione)
+        flussi.append(flusso_ordinato(nome, record, oggi))
+
+    def righe():
+        giorno = None
+        titoli = set()
+        indice = None
+        if duplicati_simili:
+            from dedup_fuzzy import IndiceDuplicati
+            indice = IndiceDuplicati()
+        cluster = []
+        scritte = duplicati = 0
+        for data, r in heapq.merge(*flussi, key=lambda x: x[0]):
+            if data.date() != giorno:
+                giorno = data.date()
+                titoli.clear()
+                if indice:
+                    cluster.extend(indice.report())
+                    indice.svuota()
+            titolo = str(r.get('Titolo', '')).strip().lower()
+            if titolo in titoli:
+                duplicati += 1
+                continue
+            titoli.add(titolo)
+            if indice and indice.aggiungi(r.get('Titolo', ''), giorno, r.get('Luogo', '')) != len(indice.eventi) - 1:
+                continue
+            scritte += 1
+            riga = [r.get(c) for c in intestazione]
+            if 'Data' in intestazione:
+                riga[intestazione.index('Data')] = formatta_data(data)
+            yield ['' if v is None else v for v in riga]
+        print(f"✅ Unione in streaming: {scritte} eventi, {duplicati} duplicati rimossi.")
+        metriche.incrementa('righe_unione', scritte, modalita='streaming')
+        metriche.incrementa('duplicati_rimossi', duplicati, modalita='streaming')
+        if indice:
+            stampa_report_duplicati(cluster + indice.report())
+
+    return intestazione, righe()
+
+def _esporta(esporta, intestazione, righe):
+    # Fase successiva all'unione (es. feed_statici.esporta_feed): un suo errore non annulla
+    # l'unione già scritta
+    try:
+        esporta(intestazione, righe)
+    except Exception as e:
+        print(f"⛔️ Errore nell'esportazione dei dati uniti: {e}")
+
+
+def _raccogli(righe, raccolte):
+    for riga in righe:
+        raccolte.append(riga)
+        yield riga
+
+
+@metriche.misurato('unione')
+def unisci_e_ordina_eventi(sink=None, pubblicazione=None, modalita=None, sorgenti=None, esporta=None):
+    # esporta: funzione chiamata con l'intestazione e le righe scritte nel tab unito
     try:
-        client_email = os.getenv("GSHEET_CLIENT_EMAIL")
-        private_key = os.getenv("GSHEET_PRIVATE_KEY")
-        
-        if not client_email or not private_key:
-            raise ValueError("Variabili d'ambiente GSHEET_CLIENT_EMAIL o GSHEET_PRIVATE_KEY mancanti.")
-        
-        credentials_info = {
-            "type": "service_account",
-            "project_id": "EventiFriuli",
-            "private_key_id": "2ad6e92ed5bd78ebb61505057bc75ecb4130b6a6",
-            "private_key": private_key.replace('\\n', '\n'),
-            "client_email": client_email,
-            "client_id": "103136377669455790448",
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{client_email}"
-        }
-
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_info, scope)
-        client = gspread.authorize(credentials)
-
-        spreadsheet = client.open("Eventi in Friuli")
-        all_sheets = spreadsheet.worksheets()
-
-        if not all_sheets:
-            raise ValueError("Nessun foglio disponibile nel Google Sheet.")
-
-        all_data = []
-        for sheet in all_sheets[1:]:  # Salta il primo foglio
-            records = sheet.get_all_records()
-            all_data.extend(records)
+        # Le sorgenti si leggono da `sorgenti` (es. l'archivio locale degli eventi) o dal sink
+        # (su Google Sheets: tutti i tab tranne il primo)
+        if sink is None:
+            sink = crea_sink()
+        if pubblicazione is None:
+            pubblicazione = crea_sink_pubblicazione(sink)
+        if sorgenti is None:
+            sorgenti = sink
+
+        if (modalita or MODALITA_UNIONE) == 'streaming':
+            oggi = datetime.combine(datetime.today().date(), datetime.min.time())
+            intestazione, righe = unisci_in_streaming(sorgenti.sorgenti(), oggi, DUPLICATI_SIMILI)
+            if not intestazione:
+                raise ValueError("Nessun dato trovato nei fogli di lavoro.")
+            # Lettura delle sorgenti e scrittura procedono insieme
+            # Le righe da esportare si tengono solo se c'è un'esportazione
+            scritte = []
+            if esporta:
+                righe = _raccogli(righe, scritte)
+            with metriche.span('scrittura_unione', sink=pubblicazione.nome, modalita='streaming'):
+                pubblicazione.scrivi_unione(intestazione, righe)
+            print(f"✅ Dati copiati e ordinati con successo nel tab unito ({pubblicazione.nome})!")
+            if esporta:
+                _esporta(esporta, intestazione, scritte)
+            return
+
+        with metriche.span('lettura_sorgenti', sink=sorgenti.nome):
+            all_data = sorgenti.leggi_sorgenti()
 
         if not all_data:
             raise ValueError("Nessun dato trovato nei fogli di lavoro.")
 
+        import pandas as pd
         df = pd.DataFrame(all_data)
 
         print("Prime righe del DataFrame caricato:")
@@ -102,7 +268,7 @@ def unisci_e_ordina_eventi():
 
         if 'Data' in df.columns:
             df['Data'] = df['Data'].astype(str)
-            df['Data_parsed'] = df['Data'].apply(converti_data)
+            df['Data_parsed'] = normalizza_date(df['Data'])
 
             non_parse = df[df['Data_parsed'].isna()]
             if not non_parse.empty:
@@ -116,11 +282,10 @@ def unisci_e_ordina_eventi():
             oggi = datetime.today().date()
 
             # Filtra il DataFrame per escludere le date precedenti ad oggi, inclusa la data odierna
-            df = df[df['Data_parsed'].dt.date >= oggi]
+            df = df[df['Data_parsed'] >= pd.Timestamp(oggi)]
 
             # Formatta la colonna Data
-            df['Data'] = df['Data_parsed'].dt.strftime('%d %b %Y')
-            df['Data'] = df['Data'].apply(traduci_mese_in_italiano)
+            df['Data'] = formatta_date(df['Data_parsed'])
             df = df.drop(columns=['Data_parsed'])
         else:
             print("⚠️ Colonna 'Data' non trovata. I dati non saranno ordinati per data.")
@@ -138,17 +303,27 @@ def unisci_e_ordina_eventi():
             df = df.drop(columns=['Titolo_normalizzato', 'Data_normalizzata'])
 
             print("✅ Eventi duplicati rimossi con successo.")
+
+            if DUPLICATI_SIMILI:
+                df = rimuovi_duplicati_simili(df)
         else:
             print("⚠️ Colonne 'Titolo' o 'Data' mancanti. Non è stato possibile rimuovere i duplicati.")
 
-        first_sheet = all_sheets[0]
-        first_sheet.clear()
-        first_sheet.update([df.columns.values.tolist()] + df.fillna('').values.tolist())
+        # Su Google Sheets il primo tab viene aggiornato scrivendo solo le differenze
+        metriche.incrementa('righe_unione', len(df), modalita='dataframe')
+        intestazione, righe = df.columns.values.tolist(), df.fillna('').values.tolist()
+        with metriche.span('scrittura_unione', sink=pubblicazione.nome, modalita='dataframe'):
+            pubblicazione.scrivi_unione(intestazione, righe)
 
-        print("✅ Dati copiati e ordinati con successo nel primo tab!")
+        print(f"✅ Dati copiati e ordinati con successo nel tab unito ({pubblicazione.nome})!")
+        if esporta:
+            _esporta(esporta, intestazione, righe)
 
     except Exception as e:
         print(f"Errore durante l'esecuzione: {e}")
 
 if __name__ == "__main__":
-    unisci_e_ordina_eventi()
+    from feed_statici import CARTELLA_FEED, esporta_feed
+    unisci_e_ordina_eventi(sorgenti=ArchivioEventi(PERCORSO_ARCHIVIO) if PERCORSO_ARCHIVIO else None,
+                           esporta=esporta_feed if CARTELLA_FEED else None)
+    metriche.scrivi_report('unione')